@@ -0,0 +1,11 @@
+"""
+Зависимости API
+"""
+from fastapi import Request
+
+from app.services.ai_service import AIAnalysisService
+
+
+def get_ai_service(request: Request) -> AIAnalysisService:
+    """Возвращает общий на процесс AIAnalysisService, созданный в lifespan"""
+    return request.app.state.ai_service
@@ -1,13 +1,24 @@
 """
 API роуты для ИИ-анализатора
 """
-from fastapi import APIRouter, HTTPException
+import json
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from loguru import logger
 
+from app.api.dependencies import get_ai_service
+from app.core.deadline import Deadline
 from app.services.ai_service import AIAnalysisService
-from app.schemas.response import AnalysisRequest
+from app.schemas.response import (
+    AnalysisJobResponse,
+    AnalysisRequest,
+    BatchAnalysisRequest,
+    BatchAnalysisResponse,
+)
+from app.services.job_service import JobQueueFullError, JobQueueUnavailableError
 
 api_router = APIRouter()
 
@@ -41,7 +52,7 @@ async def root():
 @api_router.get("/health", response_model=HealthResponse)
 async def health_check():
     """Проверка состояния сервиса"""
-    logger.info("Health check requested")
+    logger.debug("Health check requested")
     return HealthResponse(
         success=True,
         message="AI Analyzer Service is running",
@@ -49,15 +60,21 @@ async def health_check():
     )
 
 
+@api_router.get("/stats", response_model=Dict[str, Any])
+async def service_stats(ai_service: AIAnalysisService = Depends(get_ai_service)):
+    """Счетчики сервиса анализа (кэш и т.д.)"""
+    return ai_service.get_stats()
+
+
 @api_router.post("/analyze", response_model=AnalysisResponse)
-async def analyze_form(request: AnalysisRequestAPI):
+async def analyze_form(
+    request: AnalysisRequestAPI,
+    ai_service: AIAnalysisService = Depends(get_ai_service),
+    deadline_ms: Optional[int] = Header(None, alias="X-Deadline-Ms")
+):
     """Анализ медицинской анкеты с помощью DeepSeek AI"""
     try:
-        logger.info(f"🧠 Analysis requested for user {request.user_id}")
-        logger.info(f"📝 Form data received: {list(request.form_data.keys())}")
-        
-        # Создаем экземпляр AI сервиса
-        ai_service = AIAnalysisService()
+        logger.debug("🧠 Analysis requested for user {}", request.user_id)
         
         # Преобразуем данные в формат AnalysisRequest
         analysis_request = AnalysisRequest(
@@ -67,63 +84,36 @@ async def analyze_form(request: AnalysisRequestAPI):
         )
         
         # Выполняем реальный анализ с помощью DeepSeek
-        logger.info("🚀 Calling DeepSeek API for analysis...")
-        ai_result = await ai_service.analyze_medical_form(analysis_request)
-        
-        # Преобразуем результат в формат API ответа
-        recommendations = []
+        ai_result = await ai_service.analyze_medical_form(
+            analysis_request,
+            deadline=Deadline.from_header(deadline_ms)
+        )
         
-        # Проверяем тип результата (AIAnalysisResponse или fallback)
-        if hasattr(ai_result, 'recommended_supplements'):
-            # Обычный AI анализ
-            for supp_rec in ai_result.recommended_supplements:
-                recommendations.append({
-                    "supplement_id": getattr(supp_rec, 'supplement_id', f"ai_{len(recommendations)}"),
-                    "name": supp_rec.name,
-                    "reason": supp_rec.reason,
-                    "dosage": supp_rec.dosage,
-                    "confidence": getattr(supp_rec, 'confidence', 0.85)
-                })
-            
-            analysis_data = {
-                "health_score": int(ai_result.confidence * 100),
-                "risk_factors": ["Анализ выполнен ИИ"],
-                "recommendations_count": len(recommendations)
+        # Преобразуем результат в формат API ответа (ключ hash map - ID БАДа)
+        recommendations = [
+            {
+                "supplement_id": supplement_id,
+                "name": supp_rec.name,
+                "reason": supp_rec.reason,
+                "dosage": supp_rec.dose,
+                "duration": supp_rec.duration,
+                "priority": supp_rec.priority,
+                "confidence": supp_rec.confidence,
             }
+            for supplement_id, supp_rec in ai_result.recommended_supplements.items()
+        ]
+        
+        if ai_result.source == "ai":
+            risk_factors = ["Анализ выполнен ИИ"]
         else:
-            # Fallback анализ (возвращает dict)
-            if isinstance(ai_result, dict) and 'supplements' in ai_result:
-                for supp_id, supp_rec in ai_result['supplements'].items():
-                    recommendations.append({
-                        "supplement_id": supp_id,
-                        "name": supp_rec.name if hasattr(supp_rec, 'name') else supp_rec.get('name', ''),
-                        "reason": supp_rec.reason if hasattr(supp_rec, 'reason') else supp_rec.get('reason', ''),
-                        "dosage": supp_rec.dosage if hasattr(supp_rec, 'dosage') else supp_rec.get('dosage', ''),
-                        "confidence": getattr(supp_rec, 'confidence', supp_rec.get('confidence', 0.7))
-                    })
-                
-                analysis_data = {
-                    "health_score": int(ai_result.get('confidence', 0.7) * 100),
-                    "risk_factors": ["Анализ выполнен (DeepSeek недоступен - недостаточно средств)"],
-                    "recommendations_count": len(recommendations)
-                }
-            else:
-                # Совсем простой fallback
-                recommendations = [{
-                    "supplement_id": "emergency_fallback",
-                    "name": "Мультивитамины",
-                    "reason": "Базовая поддержка организма",
-                    "dosage": "1 капсула в день",
-                    "confidence": 0.6
-                }]
-                
-                analysis_data = {
-                    "health_score": 60,
-                    "risk_factors": ["Ошибка ИИ анализа - недостаточно средств на DeepSeek"],
-                    "recommendations_count": 1
-                }
+            risk_factors = ["Анализ выполнен по правилам (DeepSeek недоступен)"]
+        analysis_data = {
+            "health_score": int(ai_result.confidence * 100),
+            "risk_factors": risk_factors,
+            "recommendations_count": len(recommendations)
+        }
         
-        logger.info(f"✅ Analysis completed: {len(recommendations)} recommendations")
+        logger.debug("✅ Analysis completed: {} recommendations", len(recommendations))
         
         return AnalysisResponse(
             success=True,
@@ -154,4 +144,74 @@ async def analyze_form(request: AnalysisRequestAPI):
                 "risk_factors": ["Ошибка ИИ анализа"],
                 "recommendations_count": len(fallback_recommendations)
             }
-        ) 
\ No newline at end of file
+        ) 
+
+
+@api_router.post("/analyze/stream")
+async def analyze_form_stream(
+    request: AnalysisRequestAPI,
+    ai_service: AIAnalysisService = Depends(get_ai_service)
+):
+    """Потоковый анализ анкеты (Server-Sent Events)"""
+    logger.debug("🧠 Streaming analysis requested for user {}", request.user_id)
+    analysis_request = AnalysisRequest(
+        form_id=f"form_{request.user_id}",
+        user_id=request.user_id,
+        answers=request.form_data
+    )
+    
+    async def event_stream():
+        async for event, data in ai_service.stream_medical_form(analysis_request):
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@api_router.post("/analyze/batch", response_model=BatchAnalysisResponse)
+async def analyze_batch(
+    batch: BatchAnalysisRequest,
+    ai_service: AIAnalysisService = Depends(get_ai_service)
+):
+    """Пакетный анализ анкет (до 10 за запрос)"""
+    logger.info(f"📦 Batch analysis requested: {len(batch.requests)} forms")
+    return await ai_service.analyze_batch(batch)
+
+
+
+@api_router.post("/analyses", response_model=AnalysisJobResponse, status_code=202)
+async def submit_analysis(
+    request: AnalysisRequestAPI,
+    ai_service: AIAnalysisService = Depends(get_ai_service)
+):
+    """Асинхронный анализ: сразу возвращает analysis_id для опроса статуса"""
+    analysis_request = AnalysisRequest(
+        form_id=f"form_{request.user_id}",
+        user_id=request.user_id,
+        answers=request.form_data
+    )
+    try:
+        job = await ai_service.submit_analysis(analysis_request)
+    except (JobQueueFullError, JobQueueUnavailableError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    logger.info(f"📋 Analysis job {job.analysis_id} queued for user {request.user_id}")
+    return job
+
+
+@api_router.get("/analyses/{analysis_id}", response_model=AnalysisJobResponse)
+async def get_analysis(
+    analysis_id: str,
+    ai_service: AIAnalysisService = Depends(get_ai_service)
+):
+    """Статус асинхронного анализа и результат после завершения"""
+    try:
+        job = await ai_service.get_analysis_status(analysis_id)
+    except JobQueueUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Анализ не найден")
+    return job
@@ -0,0 +1,35 @@
+"""
+Бюджет времени на обработку запроса
+"""
+import time
+from typing import Optional
+
+from .config import settings
+
+
+class Deadline:
+    """Абсолютный дедлайн запроса по монотонным часам"""
+
+    __slots__ = ("budget", "expires_at")
+
+    def __init__(self, budget_seconds: float):
+        self.budget = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+
+    @classmethod
+    def from_header(cls, budget_ms: Optional[int]) -> "Deadline":
+        """
+        Дедлайн из заголовка X-Deadline-Ms или ANALYSIS_DEADLINE_MS по умолчанию.
+        Бюджет клиента не может превышать ANALYSIS_MAX_DEADLINE_MS.
+        """
+        if budget_ms is None or budget_ms <= 0:
+            budget_ms = settings.ANALYSIS_DEADLINE_MS
+        return cls(min(budget_ms, settings.ANALYSIS_MAX_DEADLINE_MS) / 1000)
+
+    def remaining(self) -> float:
+        """Оставшееся время в секундах (не меньше нуля)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
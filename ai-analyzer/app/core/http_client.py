@@ -0,0 +1,34 @@
+"""
+Общий HTTP клиент для исходящих запросов к DeepSeek API
+"""
+import importlib.util
+
+import httpx
+from loguru import logger
+
+from .config import settings
+
+
+def create_deepseek_http_client() -> httpx.AsyncClient:
+    """
+    Создает долгоживущий httpx клиент с пулом keep-alive соединений.
+
+    Клиент создается один раз на процесс и разделяется всеми запросами,
+    поэтому TLS-рукопожатие выполняется только при открытии нового соединения.
+    """
+    http2 = settings.DEEPSEEK_HTTP2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("⚠️ Пакет h2 не установлен - HTTP/2 к DeepSeek отключен")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.DEEPSEEK_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.DEEPSEEK_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.DEEPSEEK_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        settings.DEEPSEEK_TIMEOUT,
+        connect=settings.DEEPSEEK_CONNECT_TIMEOUT,
+    )
+
+    return httpx.AsyncClient(http2=http2, limits=limits, timeout=timeout)
@@ -0,0 +1,56 @@
+"""
+Отложенный импорт тяжелых модулей (клиент DeepSeek, драйвер базы)
+"""
+import asyncio
+import importlib.util
+import sys
+import time
+from types import ModuleType
+from typing import Dict
+
+from loguru import logger
+
+
+def lazy_module(name: str) -> ModuleType:
+    """
+    Модуль, который выполняется при первом обращении к его атрибуту
+    (importlib.util.LazyLoader). Используется для пакетов верхнего уровня,
+    не нужных до конца старта: `openai = lazy_module("openai")` не стоит
+    ничего при импорте приложения.
+
+    LazyLoader в Python 3.11 не защищен от одновременной загрузки из двух
+    потоков, поэтому модуль загружается через load_modules до того, как
+    к нему обратится обработка запросов.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def import_modules(*names: str) -> Dict[str, float]:
+    """Синхронно выполняет отложенные модули; возвращает время загрузки каждого"""
+    seconds = {}
+    for name in names:
+        started = time.perf_counter()
+        # Любое обращение к атрибуту выполняет отложенный модуль
+        importlib.import_module(name).__name__
+        seconds[name] = time.perf_counter() - started
+    return seconds
+
+
+async def load_modules(*names: str) -> None:
+    """Выполняет отложенные модули в фоновом потоке, не блокируя event loop"""
+    seconds = await asyncio.to_thread(import_modules, *names)
+    logger.debug(
+        "📦 Загружены модули: {}",
+        ", ".join(f"{name} {value * 1000:.0f} мс" for name, value in seconds.items()),
+    )
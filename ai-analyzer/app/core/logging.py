@@ -1,10 +1,125 @@
 """
 Настройка логирования
 """
+import json
+import queue
+import random
 import sys
+import threading
+import traceback
+from typing import Any, Dict, Optional, TextIO
+
 from loguru import logger
 from .config import settings
 
+# Сколько записей фоновый поток пишет одним вызовом write
+_BATCH_SIZE = 256
+_STOP = object()
+
+
+class SampledLogger:
+    """
+    Логгер, сообщения которого пишутся с долей LOG_SAMPLE_RATES[key].
+    Выборка делается до вызова loguru: отброшенное сообщение не
+    форматируется и не превращается в запись (фильтр sink'а сработал бы
+    уже после форматирования).
+    """
+
+    __slots__ = ("key", "_logger")
+
+    def __init__(self, key: str):
+        self.key = key
+        # depth=1: в записи остаются функция и строка вызывающего кода
+        self._logger = logger.opt(depth=1)
+
+    def _keep(self) -> bool:
+        rate = settings.LOG_SAMPLE_RATES.get(self.key, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+    def debug(self, message: str, *args: Any, **kwargs: Any) -> None:
+        if self._keep():
+            self._logger.debug(message, *args, **kwargs)
+
+    def info(self, message: str, *args: Any, **kwargs: Any) -> None:
+        if self._keep():
+            self._logger.info(message, *args, **kwargs)
+
+    def warning(self, message: str, *args: Any, **kwargs: Any) -> None:
+        if self._keep():
+            self._logger.warning(message, *args, **kwargs)
+
+
+def sampled(key: str) -> SampledLogger:
+    """Логгер, сообщения которого пишутся с долей LOG_SAMPLE_RATES[key]"""
+    return SampledLogger(key)
+
+
+class QueuedJsonSink:
+    """
+    Неблокирующий sink: вызывающий поток только кладет запись loguru в
+    очередь, а сериализация в JSON и запись в поток вывода идут в фоновом
+    потоке пачками. При переполнении очереди записи отбрасываются и
+    считаются в dropped - логирование не тормозит обработку запросов.
+    """
+
+    def __init__(self, stream: TextIO, max_queue: Optional[int] = None):
+        self.stream = stream
+        self.dropped = 0
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue or settings.LOG_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, message: Any) -> None:
+        try:
+            self._queue.put_nowait(message.record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self) -> None:
+        """Дописывает очередь и останавливает поток (вызывается loguru при remove)"""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    @staticmethod
+    def serialize(record: Dict[str, Any]) -> str:
+        """Запись loguru одной JSON-строкой"""
+        data = {
+            "time": record["time"].isoformat(),
+            "level": record["level"].name,
+            "logger": record["name"],
+            "function": record["function"],
+            "line": record["line"],
+            "message": record["message"],
+        }
+        extra = record["extra"]
+        if extra:
+            data["extra"] = extra
+        exception = record["exception"]
+        if exception is not None:
+            data["exception"] = "".join(
+                traceback.format_exception(exception.type, exception.value, exception.traceback)
+            )
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+    def _run(self) -> None:
+        while True:
+            records = [self._queue.get()]
+            while len(records) < _BATCH_SIZE:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = records[-1] is _STOP
+            lines = [self.serialize(record) for record in records if record is not _STOP]
+            if lines:
+                try:
+                    self.stream.write("\n".join(lines) + "\n")
+                    self.stream.flush()
+                except (OSError, ValueError):
+                    self.dropped += len(lines)
+            if stop:
+                return
+
 
 def setup_logging():
     """Настройка системы логирования"""
@@ -12,13 +127,23 @@ def setup_logging():
     # Удаляем стандартный handler
     logger.remove()
     
-    # Добавляем новый handler с настройками
-    logger.add(
-        sys.stdout,
-        level=settings.LOG_LEVEL,
-        format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-        colorize=True
-    )
+    if settings.LOG_FORMAT == "json":
+        # Структурированный JSON через фоновый поток записи
+        logger.add(
+            QueuedJsonSink(sys.stdout),
+            level=settings.LOG_LEVEL,
+            format="{message}",
+            colorize=False,
+        )
+    else:
+        # Человекочитаемый вывод для разработки (тоже через очередь loguru)
+        logger.add(
+            sys.stdout,
+            level=settings.LOG_LEVEL,
+            format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
+            colorize=True,
+            enqueue=True,
+        )
     
     # Логирование в файл для production
     if settings.ENVIRONMENT == "production":
@@ -27,7 +152,8 @@ def setup_logging():
             rotation="1 day",
             retention="30 days",
             level="INFO",
-            format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}"
+            format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
+            enqueue=True,
         )
     
-    logger.info(f"🚀 Логирование настроено для окружения: {settings.ENVIRONMENT}") 
\ No newline at end of file
+    logger.info(f"🚀 Логирование настроено для окружения: {settings.ENVIRONMENT}")
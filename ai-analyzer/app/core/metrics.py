@@ -0,0 +1,156 @@
+"""
+Метрики Prometheus
+"""
+import os
+import time
+from typing import Any, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+from app.core import tracing
+
+# Этапы analyze_medical_form
+STAGES = (
+    "cache_lookup",
+    "validation",
+    "catalog",
+    "prompt_build",
+    "deepseek_call",
+    "json_parse",
+    "fallback",
+)
+# Внутренние этапы быстрые (микросекунды), вызов DeepSeek - секунды
+STAGE_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0,
+)
+
+ANALYSIS_STAGE_SECONDS = Histogram(
+    "ai_analysis_stage_seconds",
+    "Длительность этапов анализа анкеты",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+ANALYSIS_CACHE_TOTAL = Counter(
+    "ai_analysis_cache_total",
+    "Поиск анализа в кэше",
+    ["result"],
+)
+ANALYSIS_RESULTS_TOTAL = Counter(
+    "ai_analysis_results_total",
+    "Завершенные анализы по источнику результата",
+    ["source"],
+)
+ANALYSIS_FALLBACK_TOTAL = Counter(
+    "ai_analysis_fallback_total",
+    "Переходы на rule-based анализ по причине",
+    ["reason"],
+)
+DEEPSEEK_ERRORS_TOTAL = Counter(
+    "ai_deepseek_errors_total",
+    "Ошибки вызова DeepSeek по типу",
+    ["type"],
+)
+ANALYSIS_IN_FLIGHT = Gauge(
+    "ai_analysis_in_flight",
+    "Анализы, выполняющиеся сейчас",
+    ["mode"],
+    multiprocess_mode="livesum",
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "ai_http_requests_in_flight",
+    "HTTP запросы в обработке",
+    multiprocess_mode="livesum",
+)
+
+# Circuit breaker DeepSeek (у каждого воркера свой; в многопроцессном
+# режиме состояние - худшее среди живых воркеров)
+CIRCUIT_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+DEEPSEEK_CIRCUIT_STATE = Gauge(
+    "ai_deepseek_circuit_state",
+    "Состояние circuit breaker DeepSeek: 0 - closed, 1 - half_open, 2 - open",
+    multiprocess_mode="livemax",
+)
+DEEPSEEK_CIRCUIT_OPENS_TOTAL = Counter(
+    "ai_deepseek_circuit_opens_total",
+    "Размыкания circuit breaker DeepSeek",
+)
+DEEPSEEK_CIRCUIT_REJECTED_TOTAL = Counter(
+    "ai_deepseek_circuit_rejected_total",
+    "Вызовы DeepSeek, отклоненные разомкнутым circuit breaker",
+)
+
+# Ограничитель запросов к DeepSeek (окно и запросы в полете суммируются
+# по воркерам). Пауза по Retry-After экспортируется моментом окончания:
+# оставшаяся пауза = max(0, ai_deepseek_limiter_paused_until_seconds - time())
+DEEPSEEK_LIMITER_WINDOW = Gauge(
+    "ai_deepseek_limiter_window",
+    "AIMD окно параллельных запросов к DeepSeek",
+    multiprocess_mode="livesum",
+)
+DEEPSEEK_LIMITER_IN_FLIGHT = Gauge(
+    "ai_deepseek_limiter_in_flight",
+    "Запросы к DeepSeek, получившие разрешение ограничителя",
+    multiprocess_mode="livesum",
+)
+DEEPSEEK_LIMITER_PAUSED_UNTIL = Gauge(
+    "ai_deepseek_limiter_paused_until_seconds",
+    "Unix-время окончания паузы по Retry-After",
+    multiprocess_mode="livemax",
+)
+DEEPSEEK_LIMITER_OVERLOADS_TOTAL = Counter(
+    "ai_deepseek_limiter_overloads_total",
+    "Ответы 429 и таймауты DeepSeek, уменьшившие окно",
+)
+DEEPSEEK_LIMITER_ACQUIRE_TIMEOUTS_TOTAL = Counter(
+    "ai_deepseek_limiter_acquire_timeouts_total",
+    "Запросы, не дождавшиеся разрешения ограничителя",
+)
+
+# Заранее связанные метки: на горячем пути нет поиска по словарю меток
+_STAGE_TIMERS = {stage: ANALYSIS_STAGE_SECONDS.labels(stage) for stage in STAGES}
+CACHE_HIT = ANALYSIS_CACHE_TOTAL.labels("hit")
+CACHE_MISS = ANALYSIS_CACHE_TOTAL.labels("miss")
+
+
+class stage:
+    """
+    Этап анализа: длительность пишется в гистограмму, а при активной
+    трассе запроса этап становится ее спаном
+    """
+
+    __slots__ = ("_histogram", "_span", "_started")
+
+    def __init__(self, name: str):
+        self._histogram = _STAGE_TIMERS[name]
+        self._span = tracing.span(name)
+        self._started = 0.0
+
+    def __enter__(self) -> "stage":
+        self._span.__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._histogram.observe(time.perf_counter() - self._started)
+        self._span.__exit__(*exc_info)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Текст метрик для /metrics. При PROMETHEUS_MULTIPROC_DIR метрики
+    агрегируются по всем воркерам.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
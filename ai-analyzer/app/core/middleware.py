@@ -0,0 +1,109 @@
+"""
+ASGI middleware запросов: трассировка, request-id, access-лог и X-Process-Time
+"""
+import hmac
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.core import metrics, tracing
+from app.core.config import settings
+from app.core.logging import sampled
+
+REQUEST_ID_HEADER = b"x-request-id"
+_PROFILE_HEADER = b"x-profile"
+# Принимаем request-id клиента только разумной длины
+_MAX_REQUEST_ID_LENGTH = 128
+
+# Access-лог пишется с долей LOG_SAMPLE_RATES["access"]
+_access_log = sampled("access")
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key == name:
+            return value
+    return None
+
+
+class RequestContextMiddleware:
+    """
+    Чистый ASGI middleware вместо @app.middleware("http"): без
+    BaseHTTPMiddleware нет лишней задачи и буферизации тела, поэтому
+    потоковые ответы (SSE) проходят без изменений.
+
+    На каждый HTTP запрос:
+    - берет X-Request-Id клиента или создает новый, возвращает его в ответе
+      и добавляет в контекст логов (request_id в extra);
+    - ведет трассу запроса; Server-Timing и X-Process-Time (время до
+      отправки заголовков) добавляются в http.response.start;
+    - после отправки тела закрывает трассу и пишет одну строку access-лога
+      с полным временем ответа, включая поток.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        method = scope["method"]
+        path = scope["path"]
+        headers = scope.get("headers") or []
+
+        request_id = _header(headers, REQUEST_ID_HEADER)
+        if request_id is None or len(request_id) > _MAX_REQUEST_ID_LENGTH:
+            request_id = uuid.uuid4().hex.encode()
+        request_id_text = request_id.decode("latin-1")
+
+        # Профилирование запроса по админскому заголовку (сравнение за постоянное время)
+        profile_token = _header(headers, _PROFILE_HEADER)
+        profile = bool(settings.PROFILER_ADMIN_TOKEN) and profile_token is not None and (
+            hmac.compare_digest(profile_token, settings.PROFILER_ADMIN_TOKEN.encode())
+        )
+        trace = tracing.start_trace(f"{method} {path}", profile=profile)
+        status_code = 500
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_headers = list(message.get("headers") or [])
+                response_headers.append((REQUEST_ID_HEADER, request_id))
+                if trace is not None:
+                    response_headers.append((b"server-timing", trace.server_timing().encode()))
+                response_headers.append(
+                    (b"x-process-time", str(time.perf_counter() - started).encode())
+                )
+                message["headers"] = response_headers
+            await send(message)
+
+        try:
+            with logger.contextualize(request_id=request_id_text):
+                with metrics.HTTP_REQUESTS_IN_FLIGHT.track_inprogress():
+                    await self.app(scope, receive, send_wrapper)
+        finally:
+            if trace is not None:
+                trace.root.attributes["http.method"] = method
+                trace.root.attributes["http.route"] = path
+                trace.root.attributes["http.status_code"] = status_code
+                trace.root.attributes["http.request_id"] = request_id_text
+                tracing.finish_trace(trace)
+
+            # Одна строка access-лога на запрос; не попавшая в выборку строка
+            # отбрасывается до вызова loguru и не форматируется
+            client = scope.get("client")
+            _access_log.info(
+                "{method} {path} {status_code} {duration_ms}ms",
+                method=method,
+                path=path,
+                status_code=status_code,
+                duration_ms=round((time.perf_counter() - started) * 1000, 2),
+                client_ip=client[0] if client else None,
+                request_id=request_id_text,
+            )
@@ -0,0 +1,300 @@
+"""
+Трассировка запросов: дерево этапов, Server-Timing и экспорт в OTLP JSON
+"""
+import asyncio
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import httpx
+from loguru import logger
+
+from app.core.config import settings
+
+SERVICE_NAME = "ai-analyzer"
+# Смещение perf_counter относительно Unix-времени: спаны меряются
+# монотонными часами, а в экспорт идут как Unix-время
+_EPOCH_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+_PROFILE_MAX_DEPTH = 64
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    """Узел дерева этапов запроса"""
+
+    __slots__ = ("name", "span_id", "parent", "children", "start_ns", "end_ns", "attributes")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None):
+        self.name = name
+        self.span_id = random.getrandbits(64)
+        self.parent = parent
+        self.children: List["Span"] = []
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = 0
+        self.attributes: Dict[str, Any] = {}
+        if parent is not None:
+            parent.children.append(self)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns or time.perf_counter_ns()
+        return (end - self.start_ns) / 1e6
+
+    def walk(self):
+        """Спаны поддерева в порядке обхода в глубину"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+
+class Trace:
+    """Трасса одного HTTP запроса"""
+
+    __slots__ = ("trace_id", "root", "sampled", "profiler", "_token")
+
+    def __init__(self, name: str, sampled: bool = False):
+        self.trace_id = random.getrandbits(128)
+        self.root = Span(name)
+        self.sampled = sampled
+        self.profiler: Optional["SamplingProfiler"] = None
+        self._token: Optional[contextvars.Token] = None
+
+    def server_timing(self) -> str:
+        """
+        Значение заголовка Server-Timing: длительности этапов (одноименные
+        суммируются) и общее время обработки
+        """
+        totals: Dict[str, float] = {}
+        for node in self.root.walk():
+            if node is not self.root:
+                totals[node.name] = totals.get(node.name, 0.0) + node.duration_ms
+        metrics = [f"{name};dur={duration:.2f}" for name, duration in totals.items()]
+        metrics.append(f"total;dur={self.root.duration_ms:.2f}")
+        return ", ".join(metrics)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Трасса в формате OTLP/JSON (ExportTraceServiceRequest)"""
+        trace_id = f"{self.trace_id:032x}"
+        spans = []
+        for node in self.root.walk():
+            item: Dict[str, Any] = {
+                "traceId": trace_id,
+                "spanId": f"{node.span_id:016x}",
+                "name": node.name,
+                # 2 - SERVER для корня, 1 - INTERNAL для этапов
+                "kind": 2 if node is self.root else 1,
+                "startTimeUnixNano": str(node.start_ns + _EPOCH_OFFSET_NS),
+                "endTimeUnixNano": str((node.end_ns or node.start_ns) + _EPOCH_OFFSET_NS),
+                "attributes": [_otlp_attribute(k, v) for k, v in node.attributes.items()],
+            }
+            if node.parent is not None:
+                item["parentSpanId"] = f"{node.parent.span_id:016x}"
+            spans.append(item)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": spans}],
+            }]
+        }
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def start_trace(name: str, profile: bool = False) -> Optional[Trace]:
+    """
+    Начинает трассу запроса и делает ее корень текущим спаном. profile -
+    запрошено профилирование (админский заголовок); иначе профилировщик
+    включается с вероятностью PROFILER_SAMPLE_RATE.
+    """
+    if not settings.TRACING_ENABLED:
+        return None
+    trace = Trace(name, sampled=random.random() < settings.TRACE_SAMPLE_RATE)
+    if profile or (settings.PROFILER_SAMPLE_RATE and random.random() < settings.PROFILER_SAMPLE_RATE):
+        trace.sampled = True
+        trace.profiler = SamplingProfiler(threading.get_ident())
+        trace.profiler.start()
+    trace._token = _current_span.set(trace.root)
+    return trace
+
+
+def finish_trace(trace: Trace) -> None:
+    """Закрывает корень трассы, прикладывает профиль и ставит трассу на экспорт"""
+    trace.root.end_ns = time.perf_counter_ns()
+    if trace._token is not None:
+        try:
+            _current_span.reset(trace._token)
+        except ValueError:
+            # Трасса закрывается в другом контексте (например, после стрима)
+            pass
+        trace._token = None
+    if trace.profiler is not None:
+        trace.root.attributes["profile.folded"] = trace.profiler.stop()
+        trace.root.attributes["profile.interval_ms"] = trace.profiler.interval * 1000
+    if trace.sampled:
+        exporter.submit(trace)
+
+
+def set_attribute(key: str, value: Any) -> None:
+    """Атрибут текущего спана"""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes[key] = value
+
+
+class span:
+    """
+    Контекстный менеджер этапа запроса: дочерний спан текущего.
+    Без активной трассы ничего не делает.
+    """
+
+    __slots__ = ("name", "_span", "_token")
+
+    def __init__(self, name: str):
+        self.name = name
+        self._span: Optional[Span] = None
+        self._token: Optional[contextvars.Token] = None
+
+    def __enter__(self) -> "span":
+        parent = _current_span.get()
+        if parent is not None:
+            self._span = Span(self.name, parent)
+            self._token = _current_span.set(self._span)
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self._span is None:
+            return
+        self._span.end_ns = time.perf_counter_ns()
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Спан завершился в другом контексте (задача, переживающая запрос)
+            pass
+
+
+class SamplingProfiler:
+    """
+    Семплирующий профилировщик: фоновый поток раз в PROFILER_INTERVAL_MS
+    снимает стек потока event loop и копит его в свернутом формате
+    (folded stacks, вход для flamegraph). Поток event loop общий, поэтому
+    в профиль попадает и работа параллельных запросов.
+    """
+
+    def __init__(self, thread_id: int, interval: Optional[float] = None):
+        self.thread_id = thread_id
+        self.interval = interval or settings.PROFILER_INTERVAL_MS / 1000
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> str:
+        """Останавливает семплирование и возвращает профиль в формате folded"""
+        self._stop.set()
+        self._thread.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < _PROFILE_MAX_DEPTH:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+
+class TraceExporter:
+    """
+    Фоновый экспорт трасс в OTLP JSON: строкой в файл TRACE_EXPORT_PATH
+    и/или POST на коллектор TRACE_OTLP_ENDPOINT (/v1/traces).
+    Очередь ограничена - при переполнении трассы отбрасываются.
+    """
+
+    def __init__(self, max_queue: int = 1000):
+        self._queue: "asyncio.Queue[Trace]" = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self.exported = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.TRACE_EXPORT_PATH or settings.TRACE_OTLP_ENDPOINT)
+
+    async def start(self) -> None:
+        if not self.enabled:
+            return
+        if settings.TRACE_OTLP_ENDPOINT:
+            self._client = httpx.AsyncClient(timeout=5.0)
+        self._task = asyncio.create_task(self._run(), name="trace-exporter")
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    def submit(self, trace: Trace) -> None:
+        if self._task is None:
+            return
+        try:
+            self._queue.put_nowait(trace)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _run(self) -> None:
+        while True:
+            trace = await self._queue.get()
+            payload = trace.to_otlp()
+            try:
+                if settings.TRACE_EXPORT_PATH:
+                    await asyncio.to_thread(_append_line, settings.TRACE_EXPORT_PATH, payload)
+                if self._client is not None:
+                    await self._client.post(settings.TRACE_OTLP_ENDPOINT, json=payload)
+                self.exported += 1
+            except (OSError, httpx.HTTPError) as e:
+                self.dropped += 1
+                logger.warning(f"⚠️ Не удалось экспортировать трассу: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": self._queue.qsize(), "exported": self.exported, "dropped": self.dropped}
+
+
+def _append_line(path: str, payload: Dict[str, Any]) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+
+
+exporter = TraceExporter()
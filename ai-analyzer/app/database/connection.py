@@ -1,16 +1,88 @@
 """
 Подключение к базе данных
 """
+import asyncio
+from typing import TYPE_CHECKING, Optional
+
 from loguru import logger
+
 from ..core.config import settings
+from ..core.lazy_import import lazy_module, load_modules
+
+if TYPE_CHECKING:
+    from psycopg_pool import AsyncConnectionPool
+
+# Драйвер загружается при открытии пула, а не при импорте приложения
+psycopg = lazy_module("psycopg")
+psycopg_pool = lazy_module("psycopg_pool")
+
+_pool: Optional["AsyncConnectionPool"] = None
+# Результат последней проверки соединения с базой
+_connected = False
+
+
+def get_conninfo() -> str:
+    """DATABASE_URL в формате libpq (без драйвера из SQLAlchemy-URL)"""
+    return settings.DATABASE_URL.replace("postgresql+psycopg://", "postgresql://", 1)
+
+
+def get_pool() -> Optional["AsyncConnectionPool"]:
+    """Общий пул соединений процесса (None, если база не инициализирована)"""
+    return _pool
+
+
+async def check_db_connection(timeout: Optional[float] = None) -> bool:
+    """
+    Проверяет базу запросом SELECT 1 не дольше timeout секунд
+    (DATABASE_HEALTH_TIMEOUT по умолчанию). Результат отражает текущее
+    состояние: после сбоя базы проверка снова возвращает False.
+    """
+    global _connected
+    if _pool is None:
+        _connected = False
+        return False
+    timeout = settings.DATABASE_HEALTH_TIMEOUT if timeout is None else timeout
+    try:
+        async with _pool.connection(timeout=timeout) as conn:
+            await asyncio.wait_for(conn.execute("SELECT 1"), timeout)
+    except (psycopg.Error, OSError, asyncio.TimeoutError) as e:
+        if _connected:
+            logger.warning(f"⚠️ База данных недоступна: {type(e).__name__}: {e}")
+        _connected = False
+        return False
+    _connected = True
+    return True
+
+
+async def _on_connect(conn) -> None:
+    """Вызывается пулом для каждого нового соединения; первое - база доступна"""
+    global _connected
+    if not _connected:
+        _connected = True
+        logger.info("✅ База данных подключена успешно")
 
 
 async def init_db():
     """Инициализация подключения к базе данных"""
+    global _pool, _connected
     try:
+        _connected = False
         logger.info("🗄️ Инициализация подключения к базе данных...")
-        # Здесь будет реальная инициализация SQLAlchemy/Prisma
-        logger.info("✅ База данных подключена успешно")
+        await load_modules("psycopg_pool")
+        # Пул открывается без ожидания: соединения устанавливаются в фоне,
+        # и недоступная база не мешает старту сервиса
+        _pool = psycopg_pool.AsyncConnectionPool(
+            get_conninfo(),
+            min_size=settings.DATABASE_POOL_MIN_SIZE,
+            max_size=settings.DATABASE_POOL_MAX_SIZE,
+            timeout=settings.DATABASE_POOL_TIMEOUT,
+            kwargs={"autocommit": True},
+            name="ai-analyzer",
+            configure=_on_connect,
+            open=False,
+        )
+        await _pool.open(wait=False)
+        logger.info("⏳ Пул соединений открыт, подключение к базе данных в фоне...")
     except Exception as e:
         logger.error(f"❌ Ошибка подключения к базе данных: {e}")
         raise
@@ -18,9 +90,13 @@ async def init_db():
 
 async def close_db_connection():
     """Закрытие подключения к базе данных"""
+    global _pool, _connected
     try:
         logger.info("🔒 Закрытие подключения к базе данных...")
-        # Здесь будет реальное закрытие соединений
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
+        _connected = False
         logger.info("✅ Подключение к базе данных закрыто")
     except Exception as e:
-        logger.error(f"❌ Ошибка при закрытии подключения: {e}") 
\ No newline at end of file
+        logger.error(f"❌ Ошибка при закрытии подключения: {e}")
@@ -10,6 +10,16 @@ class SupplementRecommendation(BaseModel):
     duration: str = Field(..., description="Длительность приема (например: '1 месяц')")
     priority: str = Field(..., description="Приоритет: 'high', 'medium', 'low'")
     confidence: float = Field(default=0.0, ge=0.0, le=1.0, description="Уверенность ИИ (0-1)")
+    reason: str = Field(default="", description="Почему рекомендован БАД")
+
+class TokenUsage(BaseModel):
+    """Расход токенов DeepSeek на анализ (по полю usage ответа)"""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    prompt_cache_hit_tokens: int = Field(default=0, description="Токены промпта из кэша контекста DeepSeek")
+    prompt_cache_miss_tokens: int = 0
+    cost: float = Field(default=0.0, description="Стоимость вызова в USD")
 
 # Основная схема ответа ИИ-анализатора согласно требованиям заказчика
 class AIAnalysisResponse(BaseModel):
@@ -34,6 +44,8 @@ class AIAnalysisResponse(BaseModel):
     analysis_id: str = Field(..., description="ID анализа")
     confidence: float = Field(default=0.0, ge=0.0, le=1.0, description="Общая уверенность анализа")
     processing_time_ms: int = Field(default=0, description="Время обработки в миллисекундах")
+    source: str = Field(default="ai", description="Источник результата: 'ai' или 'fallback' (rule-based)")
+    usage: Optional[TokenUsage] = Field(default=None, description="Расход токенов DeepSeek")
     created_at: datetime = Field(default_factory=datetime.now, description="Время создания")
 
 class AnalysisRequest(BaseModel):
@@ -52,6 +64,10 @@ class AnalysisStatus(BaseModel):
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
 
+class AnalysisJobResponse(AnalysisStatus):
+    """Статус асинхронной задачи анализа вместе с результатом"""
+    result: Optional[AIAnalysisResponse] = Field(None, description="Результат, когда status=completed")
+
 # Схемы для error responses
 class ErrorResponse(BaseModel):
     """Стандартный ответ об ошибке"""
@@ -1,170 +1,702 @@
-import json
+import os
+import time
+import uuid
+import random
 import asyncio
-import hashlib
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
-import openai
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Any, Tuple
+import httpx
 from loguru import logger
+from pydantic import ValidationError
 
+from app.core import metrics, tracing
 from app.core.config import settings
+from app.core.deadline import Deadline
+from app.core.lazy_import import lazy_module, load_modules
+from app.core.logging import sampled
 from app.schemas.response import (
     AIAnalysisResponse, 
     SupplementRecommendation, 
     AnalysisRequest,
-    FormAnswersValidation
+    BatchAnalysisRequest,
+    BatchAnalysisResponse,
+    FormAnswersValidation,
+    AnalysisJobResponse
 )
 from app.services.database_service import DatabaseService
 from app.services.cache_service import CacheService
+from app.services.catalog_index import CatalogRetriever
+from app.services.fingerprint import AnswersFingerprinter
+from app.services.job_service import AnalysisJobQueue
+from app.services.rate_limiter import AdaptiveLimiter, LimiterTimeoutError, parse_retry_after
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.latency import LatencyTracker
+from app.services.token_accounting import TokenAccountant
+from app.services.preload import preloaded_state
+from app.services.prompt_builder import Prompt, PromptBuilder
+from app.services.response_parser import ResponseParseError, ResponseParser
+from app.services.rule_engine import RuleEngine
+from app.services.singleflight import FlightAbandonedError, SingleFlight
+from app.services.stream_parser import JsonStringFieldStreamer
+
+# openai загружается в start(), а не при импорте приложения
+openai = lazy_module("openai")
+
+# Отладочные строки горячего пути пишутся выборочно (LOG_SAMPLE_RATES)
+_request_log = sampled("deepseek_request")
+_response_log = sampled("deepseek_response")
 
 class AIAnalysisService:
     """Сервис для ИИ-анализа медицинских анкет"""
     
-    def __init__(self):
+    def __init__(self, http_client_factory: Optional[Callable[[], httpx.AsyncClient]] = None):
+        """
+        Сервис рассчитан на один экземпляр на процесс (создается в lifespan).
+        Клиент DeepSeek создается в start(); http_client_factory строит общий
+        пул соединений к DeepSeek, без нее openai создаст собственный клиент.
+        """
+        self._http_client_factory = http_client_factory
+        self.http_client: Optional[httpx.AsyncClient] = None
+        
         # DeepSeek клиент (единственный AI провайдер)
-        if settings.DEEPSEEK_API_KEY:
-            logger.info(f"🔑 DeepSeek API ключ найден: {settings.DEEPSEEK_API_KEY[:8]}...")
-            logger.info(f"🌐 DeepSeek URL: {settings.DEEPSEEK_BASE_URL}")
-            self.deepseek_client = openai.AsyncOpenAI(
-                api_key=settings.DEEPSEEK_API_KEY,
-                base_url=settings.DEEPSEEK_BASE_URL
-            )
-        else:
-            logger.warning("⚠️ DeepSeek API ключ не найден - только rule-based анализ")
-            self.deepseek_client = None
+        self.deepseek_client = None
+        self._provider_started = asyncio.Event()
+        self.ready = False
         
-        self.db_service = DatabaseService()
+        # В многопроцессном режиме каталог, правила, индекс и шаблон промпта
+        # построены в master до fork (gunicorn.conf.py) - воркер их не пересобирает
+        preloaded = preloaded_state()
+        if preloaded is not None:
+            self.db_service = DatabaseService(preloaded.catalog)
+            self.rule_engine = preloaded.rule_engine
+            self.catalog_retriever = preloaded.retriever
+            self.prompt_builder = preloaded.prompt_builder
+        else:
+            self.db_service = DatabaseService()
+            self.rule_engine = RuleEngine()
+            self.catalog_retriever = CatalogRetriever()
+            self.prompt_builder = PromptBuilder(self.catalog_retriever)
         self.cache_service = CacheService()
+        self._singleflight = SingleFlight()
+        self._fingerprinter = AnswersFingerprinter()
+        self.jobs = AnalysisJobQueue(self)
+        self.token_accountant = TokenAccountant(self.prompt_builder.counter)
+        self.response_parser = ResponseParser()
+        self._limiter = AdaptiveLimiter()
+        self._breaker = CircuitBreaker("deepseek")
+        self._provider_latency = LatencyTracker(min_samples=settings.DEEPSEEK_HEDGE_MIN_SAMPLES)
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.deadline_fallbacks = 0
+    
+    async def start(self) -> None:
+        """
+        Подключение внешних ресурсов. При старте приложения выполняется в
+        фоне после открытия порта: запросы, пришедшие раньше, ждут только
+        клиента DeepSeek (_provider), каталог до загрузки - встроенный,
+        маршруты задач до запуска очереди отвечают 503.
+        """
+        try:
+            if settings.DEEPSEEK_API_KEY:
+                # openai импортируется в фоновом потоке, event loop отвечает на запросы
+                await load_modules("openai")
+            self._start_provider()
+        finally:
+            self._provider_started.set()
+        # Очередь задач локальная (SQLite) и не ждет сетевых ресурсов
+        await self.jobs.start()
+        await self.cache_service.connect()
+        await self.db_service.start()
+        self.ready = True
+    
+    def _start_provider(self) -> None:
+        if not settings.DEEPSEEK_API_KEY:
+            logger.warning("⚠️ DeepSeek API ключ не найден - только rule-based анализ")
+            return
+        logger.info(f"🔑 DeepSeek API ключ найден: {settings.DEEPSEEK_API_KEY[:8]}...")
+        logger.info(f"🌐 DeepSeek URL: {settings.DEEPSEEK_BASE_URL}")
+        if self._http_client_factory is not None:
+            self.http_client = self._http_client_factory()
+        self.deepseek_client = openai.AsyncOpenAI(
+            api_key=settings.DEEPSEEK_API_KEY,
+            base_url=settings.DEEPSEEK_BASE_URL,
+            http_client=self.http_client,
+            # Повторы выполняет _chat_completion с учетом ограничителя
+            max_retries=0
+        )
+    
+    async def _provider(self) -> Optional[Any]:
+        """
+        Клиент DeepSeek. Запрос, пришедший до окончания фонового старта,
+        ждет создания клиента не дольше STARTUP_PROVIDER_WAIT секунд
+        """
+        if not self._provider_started.is_set() and settings.DEEPSEEK_API_KEY:
+            try:
+                await asyncio.wait_for(
+                    self._provider_started.wait(), settings.STARTUP_PROVIDER_WAIT
+                )
+            except asyncio.TimeoutError:
+                logger.warning("⚠️ Клиент DeepSeek еще не создан - rule-based анализ")
+        return self.deepseek_client
+    
+    async def close(self) -> None:
+        """Останавливает задачи, закрывает клиент DeepSeek, общий пул HTTP соединений и кэш"""
+        await self.jobs.close()
+        await self.db_service.close()
+        await self.cache_service.close()
+        if self.deepseek_client:
+            await self.deepseek_client.close()
+        if self.http_client and not self.http_client.is_closed:
+            await self.http_client.aclose()
+        logger.info("🔒 Пул соединений DeepSeek закрыт")
         
-    async def analyze_medical_form(self, request: AnalysisRequest) -> AIAnalysisResponse:
+    async def analyze_medical_form(
+        self,
+        request: AnalysisRequest,
+        deadline: Optional[Deadline] = None,
+        raise_on_error: bool = False
+    ) -> AIAnalysisResponse:
         """
         Основной метод анализа медицинской анкеты
         Возвращает hash map с БАДами + текст рекомендаций согласно требованиям заказчика
+        
+        С дедлайном: если бюджет времени истек, возвращается rule-based результат,
+        а анализ DeepSeek продолжается в фоне и заполняет кэш.
+        При ошибке возвращается пустой ответ failed_<form_id>; raise_on_error=True
+        пробрасывает исключение (асинхронные задачи помечают его статусом failed).
         """
         start_time = datetime.now()
         
+        with metrics.ANALYSIS_IN_FLIGHT.labels("sync").track_inprogress():
+            try:
+                return await self._analyze_medical_form(request, deadline, start_time)
+            except Exception as e:
+                logger.error(f"Analysis failed for form {request.form_id}: {str(e)}")
+                if raise_on_error:
+                    raise
+                # Возвращаем пустой ответ в случае ошибки
+                return self._failed_response(request, start_time)
+    
+    async def _cached_analysis(
+        self,
+        cache_key: str,
+        deadline: Optional[Deadline]
+    ) -> Optional[AIAnalysisResponse]:
+        """Результат из кэша; поиск не дольше остатка дедлайна (не успели - промах)"""
+        lookup = self.cache_service.get_analysis(cache_key)
+        if deadline is None:
+            return await lookup
+        try:
+            return await asyncio.wait_for(lookup, timeout=deadline.remaining())
+        except asyncio.TimeoutError:
+            return None
+    
+    def _failed_response(self, request: AnalysisRequest, start_time: datetime) -> AIAnalysisResponse:
+        """Пустой ответ для анкеты, анализ которой завершился ошибкой"""
+        return AIAnalysisResponse(
+            analysis_id=f"failed_{request.form_id}",
+            recommended_supplements={},
+            recommendations_text="К сожалению, произошла ошибка при анализе анкеты. Пожалуйста, обратитесь к специалисту.",
+            confidence=0.0,
+            processing_time_ms=int((datetime.now() - start_time).total_seconds() * 1000)
+        )
+    
+    async def _analyze_medical_form(
+        self,
+        request: AnalysisRequest,
+        deadline: Optional[Deadline],
+        start_time: datetime
+    ) -> AIAnalysisResponse:
+        # Проверяем кэш
+        with metrics.stage("cache_lookup"):
+            fingerprint = self._fingerprinter.fingerprint(request.answers)
+            cache_key = fingerprint.key
+            cached_result = await self._cached_analysis(cache_key, deadline)
+        
+        if cached_result:
+            metrics.CACHE_HIT.inc()
+            self._fingerprinter.record_hit(fingerprint)
+            logger.debug("Returning cached analysis for form {}", request.form_id)
+            return self._reuse_result(request, cached_result, start_time)
+        metrics.CACHE_MISS.inc()
+        
+        # Одинаковые анкеты, которые анализируются прямо сейчас, ждут один вызов
+        flight = self._shared_analysis(request, cache_key, start_time, deadline)
+        if deadline is None:
+            return await flight
+        
+        try:
+            # Задача анализа защищена shield внутри SingleFlight и
+            # не отменяется по таймауту
+            return await asyncio.wait_for(flight, timeout=deadline.remaining())
+        except asyncio.TimeoutError:
+            self.deadline_fallbacks += 1
+            logger.warning(
+                f"⏱️ Бюджет {int(deadline.budget * 1000)}ms для формы {request.form_id} исчерпан - "
+                "rule-based результат, анализ DeepSeek продолжается в фоне"
+            )
+            return await self._deadline_fallback(request, start_time)
+    
+    async def analyze_batch(self, batch: BatchAnalysisRequest) -> BatchAnalysisResponse:
+        """
+        Пакетный анализ: одинаковые анкеты анализируются один раз, результаты
+        из кэша отдаются сразу, остальные выполняются параллельно с ограничением
+        BATCH_MAX_CONCURRENCY. Ошибка одной анкеты не прерывает весь пакет.
+        
+        results содержит по одному ответу на каждую анкету в порядке запроса:
+        дубли получают копию результата со своим analysis_id, анкета с ошибкой -
+        пустой ответ failed_<form_id> (подробности в failed_analyses).
+        """
+        started = time.perf_counter()
+        start_time = datetime.now()
+        batch_id = batch.batch_id or f"batch_{uuid.uuid4().hex[:12]}"
+        
+        fingerprints = [self._fingerprinter.fingerprint(item.answers) for item in batch.requests]
+        
+        # Первая анкета с данным ключом представляет все дубли
+        unique_requests: Dict[str, AnalysisRequest] = {}
+        for item, fingerprint in zip(batch.requests, fingerprints):
+            unique_requests.setdefault(fingerprint.key, item)
+        
+        results: Dict[str, Any] = await self.cache_service.get_many_analyses(list(unique_requests))
+        for fingerprint in fingerprints:
+            if fingerprint.key in results:
+                self._fingerprinter.record_hit(fingerprint)
+        # Результаты из кэша получены для других анкет - переоформляются на каждую
+        answered: set = set(results)
+        
+        semaphore = asyncio.Semaphore(settings.BATCH_MAX_CONCURRENCY)
+        
+        async def run(cache_key: str, item: AnalysisRequest) -> AIAnalysisResponse:
+            async with semaphore:
+                return await self._shared_analysis(item, cache_key, datetime.now())
+        
+        pending = [key for key in unique_requests if key not in results]
+        fallback_reason = await self._batch_fallback_reason() if pending else None
+        if fallback_reason:
+            # DeepSeek недоступен: весь пакет оценивается правилами за один проход
+            outcomes = await self._batch_fallback(
+                [unique_requests[key] for key in pending], pending, start_time, fallback_reason
+            )
+        else:
+            outcomes = await asyncio.gather(
+                *(run(key, unique_requests[key]) for key in pending),
+                return_exceptions=True
+            )
+        results.update(zip(pending, outcomes))
+        
+        analyses: List[AIAnalysisResponse] = []
+        failed_analyses: List[Dict[str, str]] = []
+        for item, fingerprint in zip(batch.requests, fingerprints):
+            result = results[fingerprint.key]
+            if isinstance(result, BaseException):
+                logger.error(f"Batch {batch_id}: analysis failed for form {item.form_id}: {result}")
+                failed_analyses.append({"form_id": item.form_id, "error": str(result)})
+                analyses.append(self._failed_response(item, start_time))
+                continue
+            if fingerprint.key in answered:
+                # Дубль в пакете или попадание в кэш: тот же результат под
+                # собственным analysis_id анкеты
+                result = self._reuse_result(item, result, start_time)
+                await self.db_service.save_analysis_result(item.form_id, item.user_id, result)
+            answered.add(fingerprint.key)
+            analyses.append(result)
+        
+        processing_time = int((time.perf_counter() - started) * 1000)
+        logger.info(
+            f"Batch {batch_id} completed: {len(analyses) - len(failed_analyses)} ok, {len(failed_analyses)} failed, "
+            f"{len(pending)} analyzed, {processing_time}ms"
+        )
+        return BatchAnalysisResponse(
+            batch_id=batch_id,
+            results=analyses,
+            failed_analyses=failed_analyses,
+            total_processed=len(batch.requests),
+            processing_time_ms=processing_time
+        )
+    
+    async def _batch_fallback_reason(self) -> Optional[str]:
+        """Причина сразу оценить пакет правилами или None, если DeepSeek доступен"""
+        if not await self._provider():
+            return "no_client"
+        if self._breaker.is_open:
+            return "circuit_open"
+        return None
+    
+    async def _batch_fallback(
+        self,
+        requests: List[AnalysisRequest],
+        cache_keys: List[str],
+        start_time: datetime,
+        reason: str
+    ) -> List[AIAnalysisResponse]:
+        """Rule-based анализ пакета анкет одним векторизованным вызовом evaluate_batch"""
+        logger.info(f"Using fallback rule-based analysis for batch of {len(requests)} ({reason})")
+        metrics.ANALYSIS_FALLBACK_TOTAL.labels(reason).inc(len(requests))
+        
+        with metrics.stage("validation"):
+            profiles = [self._validate_form_answers(request.answers) for request in requests]
+        with metrics.stage("catalog"):
+            supplements_catalog = await self.db_service.get_supplements_catalog()
+        with metrics.stage("fallback"):
+            recommended = self.rule_engine.evaluate_batch(profiles, supplements_catalog)
+        
+        return [
+            await self._complete_analysis(
+                request, cache_key, self._rule_based_result(supplements), start_time
+            )
+            for request, cache_key, supplements in zip(requests, cache_keys, recommended)
+        ]
+    
+    async def _shared_analysis(
+        self,
+        request: AnalysisRequest,
+        cache_key: str,
+        start_time: datetime,
+        deadline: Optional[Deadline] = None
+    ) -> AIAnalysisResponse:
+        """
+        Анализ через single-flight. Если анкету с тем же ключом уже анализирует
+        другой запрос, его результат переоформляется на эту анкету.
+        """
+        ran = False
+        
+        async def run() -> AIAnalysisResponse:
+            nonlocal ran
+            ran = True
+            return await self._run_analysis(request, cache_key, start_time, deadline)
+        
+        result = await self._singleflight.do(cache_key, run)
+        return result if ran else self._reuse_result(request, result, start_time)
+    
+    async def _run_analysis(
+        self,
+        request: AnalysisRequest,
+        cache_key: str,
+        start_time: datetime,
+        deadline: Optional[Deadline] = None
+    ) -> AIAnalysisResponse:
+        """
+        Анализ анкеты, которой нет в кэше (выполняется один раз на ключ кэша).
+        Дедлайн ограничивает ожидание квоты DeepSeek; блокировка ключа
+        продлевается, пока идет анализ.
+        """
+        lock_token = await self.cache_service.acquire_lock(cache_key)
+        if lock_token is None:
+            # Эту же анкету уже анализирует другой воркер - ждем его результат
+            shared_result = await self.cache_service.wait_for_analysis(cache_key)
+            if shared_result:
+                self._singleflight.record_remote_hit()
+                return self._reuse_result(request, shared_result, start_time)
+        
+        hold_lock = asyncio.create_task(self.cache_service.hold_lock(cache_key, lock_token))
         try:
-            # Проверяем кэш
-            cache_key = self._generate_cache_key(request.answers)
-            cached_result = await self.cache_service.get_analysis(cache_key)
-            
-            if cached_result:
-                logger.info(f"Returning cached analysis for form {request.form_id}")
-                return cached_result
-            
             # Валидация входных данных
-            validated_answers = self._validate_form_answers(request.answers)
+            with metrics.stage("validation"):
+                validated_answers = self._validate_form_answers(request.answers)
             
-            # Получаем каталог БАДов из базы данных
-            supplements_catalog = await self.db_service.get_supplements_catalog()
+            # Каталог БАДов из снимка в памяти
+            with metrics.stage("catalog"):
+                supplements_catalog = await self.db_service.get_supplements_catalog()
             
             # Анализ через DeepSeek API
             analysis_result = await self._analyze_with_ai(
                 validated_answers, 
-                supplements_catalog
-            )
-            
-            # Формируем ответ в требуемом формате
-            processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
-            
-            response = AIAnalysisResponse(
-                analysis_id=f"analysis_{request.form_id}_{int(datetime.now().timestamp())}",
-                recommended_supplements=analysis_result["supplements"],
-                recommendations_text=analysis_result["text"],
-                confidence=analysis_result["confidence"],
-                processing_time_ms=processing_time
+                supplements_catalog,
+                deadline
             )
             
-            # Сохраняем результат в кэш
+            return await self._complete_analysis(request, cache_key, analysis_result, start_time)
+        finally:
+            hold_lock.cancel()
+            await self.cache_service.release_lock(cache_key, lock_token)
+    
+    async def _deadline_fallback(
+        self,
+        request: AnalysisRequest,
+        start_time: datetime
+    ) -> AIAnalysisResponse:
+        """Rule-based ответ при исчерпании бюджета времени (не кэшируется)"""
+        validated_answers = self._validate_form_answers(request.answers)
+        supplements_catalog = await self.db_service.get_supplements_catalog()
+        analysis_result = await self._fallback_rule_based_analysis(
+            validated_answers, supplements_catalog, reason="deadline"
+        )
+        return self._make_response(request, analysis_result, start_time)
+    
+    def _make_response(
+        self,
+        request: AnalysisRequest,
+        analysis_result: Dict[str, Any],
+        start_time: datetime
+    ) -> AIAnalysisResponse:
+        """Формирует ответ в требуемом формате"""
+        processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
+        
+        return AIAnalysisResponse(
+            analysis_id=self._analysis_id(request),
+            recommended_supplements=analysis_result["supplements"],
+            recommendations_text=analysis_result["text"],
+            confidence=analysis_result["confidence"],
+            processing_time_ms=processing_time,
+            source=analysis_result["source"],
+            usage=analysis_result.get("usage")
+        )
+    
+    def _analysis_id(self, request: AnalysisRequest) -> str:
+        return f"analysis_{request.form_id}_{int(datetime.now().timestamp())}"
+    
+    def _reuse_result(
+        self,
+        request: AnalysisRequest,
+        result: AIAnalysisResponse,
+        start_time: datetime
+    ) -> AIAnalysisResponse:
+        """
+        Готовый результат (из кэша или чужого вызова) под analysis_id и
+        временем обработки этой анкеты: id исходного запроса содержит
+        чужой form_id и не должен попадать другому пользователю
+        """
+        return result.model_copy(update={
+            "analysis_id": self._analysis_id(request),
+            "processing_time_ms": int((datetime.now() - start_time).total_seconds() * 1000)
+        })
+    
+    async def _complete_analysis(
+        self,
+        request: AnalysisRequest,
+        cache_key: str,
+        analysis_result: Dict[str, Any],
+        start_time: datetime
+    ) -> AIAnalysisResponse:
+        """Формирует ответ, сохраняет его в кэш и в базу данных"""
+        response = self._make_response(request, analysis_result, start_time)
+        metrics.ANALYSIS_RESULTS_TOTAL.labels(response.source).inc()
+        
+        # Сохраняем результат в кэш; rule-based результат не кэшируем, чтобы
+        # после восстановления DeepSeek анкета получила полноценный анализ
+        if response.source == "ai":
             await self.cache_service.store_analysis(cache_key, response)
+        
+        # Сохраняем в базу данных
+        await self.db_service.save_analysis_result(
+            request.form_id,
+            request.user_id,
+            response
+        )
+        
+        logger.info(
+            "Analysis completed for form {form_id} in {processing_time_ms}ms",
+            form_id=request.form_id,
+            processing_time_ms=response.processing_time_ms,
+            source=response.source,
+        )
+        return response
+    
+    async def stream_medical_form(
+        self,
+        request: AnalysisRequest
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Потоковый анализ анкеты. Выдает события (имя, данные):
+        "start" сразу, "text" с фрагментами recommendations_text по мере
+        генерации DeepSeek, "error" при сбое провайдера и финальное "result"
+        с полным AIAnalysisResponse. Результат сохраняется в кэш.
+        """
+        with metrics.ANALYSIS_IN_FLIGHT.labels("stream").track_inprogress():
+            async for event in self._stream_medical_form(request):
+                yield event
+    
+    async def _stream_medical_form(
+        self,
+        request: AnalysisRequest
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        start_time = datetime.now()
+        yield "start", {"form_id": request.form_id}
+        
+        with metrics.stage("cache_lookup"):
+            fingerprint = self._fingerprinter.fingerprint(request.answers)
+            cache_key = fingerprint.key
+            cached_result = await self.cache_service.get_analysis(cache_key)
+        if cached_result:
+            metrics.CACHE_HIT.inc()
+            self._fingerprinter.record_hit(fingerprint)
+            response = self._reuse_result(request, cached_result, start_time)
+            yield "text", {"delta": response.recommendations_text}
+            yield "result", response.model_dump(mode="json")
+            return
+        metrics.CACHE_MISS.inc()
+        
+        # Поток участвует в single-flight наравне с обычным анализом: если
+        # анкету уже анализируют, ждем готовый результат вместо второго вызова
+        flight = self._singleflight.lead(cache_key)
+        if flight is None:
+            response = await self._shared_analysis(request, cache_key, start_time)
+            yield "text", {"delta": response.recommendations_text}
+            yield "result", response.model_dump(mode="json")
+            return
+        
+        lock_token = None
+        hold_lock = None
+        try:
+            lock_token = await self.cache_service.acquire_lock(cache_key)
+            if lock_token is None:
+                # Эту же анкету уже анализирует другой воркер - ждем его результат
+                shared_result = await self.cache_service.wait_for_analysis(cache_key)
+                if shared_result:
+                    self._singleflight.record_remote_hit()
+                    response = self._reuse_result(request, shared_result, start_time)
+                    flight.set_result(response)
+                    yield "text", {"delta": response.recommendations_text}
+                    yield "result", response.model_dump(mode="json")
+                    return
+            hold_lock = asyncio.create_task(self.cache_service.hold_lock(cache_key, lock_token))
             
-            # Сохраняем в базу данных
-            await self.db_service.save_analysis_result(
-                request.form_id,
-                request.user_id,
-                response
-            )
-            
-            logger.info(f"Analysis completed for form {request.form_id} in {processing_time}ms")
-            return response
+            with metrics.stage("validation"):
+                validated_answers = self._validate_form_answers(request.answers)
+            with metrics.stage("catalog"):
+                supplements_catalog = await self.db_service.get_supplements_catalog()
             
-        except Exception as e:
-            logger.error(f"Analysis failed for form {request.form_id}: {str(e)}")
-            # Возвращаем пустой ответ в случае ошибки
-            return AIAnalysisResponse(
-                analysis_id=f"failed_{request.form_id}",
-                recommended_supplements={},
-                recommendations_text="К сожалению, произошла ошибка при анализе анкеты. Пожалуйста, обратитесь к специалисту.",
-                confidence=0.0,
-                processing_time_ms=int((datetime.now() - start_time).total_seconds() * 1000)
+            analysis_result = None
+            streamed_text = False
+            reason = "no_client"
+            if await self._provider():
+                streamer = JsonStringFieldStreamer("text")
+                chunks: List[str] = []
+                stream_usage = None
+                finish_reason = None
+                prompt = self._build_prompt(validated_answers, supplements_catalog)
+                max_tokens = self.token_accountant.max_tokens()
+                estimated_tokens = prompt.estimated_tokens + max_tokens
+                call_started = time.perf_counter()
+                try:
+                    self._breaker.before_call()
+                    try:
+                        async with self._limiter.slot(estimated_tokens) as limiter:
+                            try:
+                                stream = await self.deepseek_client.chat.completions.create(
+                                    model=settings.DEEPSEEK_MODEL,
+                                    messages=prompt.messages,
+                                    max_tokens=max_tokens,
+                                    temperature=settings.DEEPSEEK_TEMPERATURE,
+                                    timeout=settings.DEEPSEEK_TIMEOUT,
+                                    stream=True,
+                                    stream_options={"include_usage": True},
+                                    **self._response_format()
+                                )
+                                async for chunk in stream:
+                                    if chunk.usage:
+                                        stream_usage = chunk.usage
+                                    if chunk.choices and chunk.choices[0].finish_reason:
+                                        finish_reason = chunk.choices[0].finish_reason
+                                    if not chunk.choices or not chunk.choices[0].delta.content:
+                                        continue
+                                    delta = chunk.choices[0].delta.content
+                                    chunks.append(delta)
+                                    text_piece = streamer.feed(delta)
+                                    if text_piece:
+                                        streamed_text = True
+                                        yield "text", {"delta": text_piece}
+                            except openai.RateLimitError as e:
+                                limiter.on_overload(parse_retry_after(e.response.headers.get("retry-after")))
+                                raise
+                            except openai.APITimeoutError:
+                                limiter.on_overload()
+                                raise
+                            limiter.on_success(
+                                estimated_tokens, stream_usage.total_tokens if stream_usage else None
+                            )
+                    except BaseException as e:
+                        self._record_provider_error(e)
+                        raise
+                    self._breaker.record_success()
+                
+                    analysis_result = self._process_ai_response("".join(chunks))
+                    analysis_result["usage"] = self.token_accountant.record(
+                        stream_usage,
+                        prompt.estimated_tokens,
+                        time.perf_counter() - call_started,
+                        finish_reason,
+                    )
+                except Exception as e:
+                    reason = self._fallback_reason(e)
+                    logger.error(f"❌ DeepSeek streaming error: {type(e).__name__}: {e}")
+                    yield "error", {"message": "DeepSeek недоступен, используется rule-based анализ"}
+        
+            if analysis_result is None:
+                analysis_result = await self._fallback_rule_based_analysis(
+                    validated_answers, supplements_catalog, reason
+                )
+                if not streamed_text:
+                    yield "text", {"delta": analysis_result["text"]}
+        
+            response = await self._complete_analysis(
+                request, cache_key, analysis_result, start_time
             )
+            flight.set_result(response)
+            yield "result", response.model_dump(mode="json")
+        finally:
+            if not flight.done():
+                # Клиент отключился или поток упал: ожидающие выполнят анализ сами
+                flight.set_exception(FlightAbandonedError(cache_key))
+            if hold_lock is not None:
+                hold_lock.cancel()
+            await self.cache_service.release_lock(cache_key, lock_token)
     
     async def _analyze_with_ai(
         self, 
         form_answers: Dict[str, Any], 
-        supplements_catalog: List[Dict]
+        supplements_catalog: List[Dict],
+        deadline: Optional[Deadline] = None
     ) -> Dict[str, Any]:
         """Анализ через DeepSeek API"""
         
-        # Подготавливаем промпт для ИИ
-        prompt = self._build_analysis_prompt(form_answers, supplements_catalog)
-        
-        system_message = """Ты - медицинский ИИ-консультант, специализирующийся на общих рекомендациях по здоровью. 
-        Анализируй медицинские анкеты и давай общие рекомендации по образу жизни и питанию.
-        
-        ВАЖНО: Отвечай СТРОГО в JSON формате:
-        {
-            "recommendations": {
-                "rec_1": {
-                    "name": "Название рекомендации",
-                    "dosage": "Рекомендация по применению",
-                    "priority": "high",
-                    "reason": "Причина рекомендации"
-                }
-            },
-            "text": "Подробный текст с рекомендациями...",
-            "confidence": 0.85
-        }
-        
-        Никогда не ставь медицинские диагнозы. Всегда указывай, что нужна консультация врача."""
-        
         # Пробуем DeepSeek
-        if self.deepseek_client:
+        reason = "no_client"
+        if await self._provider():
             try:
-                logger.info("🧠 Отправляем запрос в DeepSeek API...")
-                logger.info(f"📝 Модель: {settings.DEEPSEEK_MODEL}")
-                logger.info(f"🔧 Параметры: max_tokens={settings.DEEPSEEK_MAX_TOKENS}, temp={settings.DEEPSEEK_TEMPERATURE}")
-                logger.info(f"📊 Размер промпта: {len(prompt)} символов")
-                
-                response = await self.deepseek_client.chat.completions.create(
-                    model=settings.DEEPSEEK_MODEL,
-                    messages=[
-                        {"role": "system", "content": system_message},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=settings.DEEPSEEK_MAX_TOKENS,
-                    temperature=settings.DEEPSEEK_TEMPERATURE,
-                    timeout=settings.DEEPSEEK_TIMEOUT
+                with metrics.stage("prompt_build"):
+                    prompt = self._build_prompt(form_answers, supplements_catalog)
+                max_tokens = self.token_accountant.max_tokens()
+                _request_log.debug(
+                    "🧠 Запрос в DeepSeek: model={} max_tokens={} temp={} prompt~{} токенов",
+                    settings.DEEPSEEK_MODEL, max_tokens, settings.DEEPSEEK_TEMPERATURE,
+                    prompt.estimated_tokens,
                 )
                 
-                logger.info("✅ Получен ответ от DeepSeek API")
+                call_started = time.perf_counter()
+                with metrics.stage("deepseek_call"):
+                    response = await self._hedged_chat_completion(
+                        deadline=deadline,
+                        model=settings.DEEPSEEK_MODEL,
+                        messages=prompt.messages,
+                        max_tokens=max_tokens,
+                        temperature=settings.DEEPSEEK_TEMPERATURE,
+                        timeout=settings.DEEPSEEK_TIMEOUT,
+                        **self._response_format()
+                    )
+                usage = self.token_accountant.record(
+                    response.usage,
+                    prompt.estimated_tokens,
+                    time.perf_counter() - call_started,
+                    response.choices[0].finish_reason,
+                )
                 
                 # Парсим ответ DeepSeek
                 ai_response = response.choices[0].message.content
-                logger.info(f"📄 Ответ DeepSeek: {ai_response[:200]}...")
+                _response_log.debug("📄 Ответ DeepSeek: {}...", ai_response[:200])
                 
-                # Пытаемся распарсить JSON
-                try:
-                    analysis_data = json.loads(ai_response)
-                    logger.info("✅ JSON успешно распарсен")
-                except json.JSONDecodeError as json_error:
-                    logger.error(f"❌ Ошибка парсинга JSON от DeepSeek: {json_error}")
-                    logger.error(f"🔍 Полный ответ: {ai_response}")
-                    raise
+                # Ответ уже оплачен - разбираем его устойчиво к обертке и обрыву
+                analysis_result = self._process_ai_response(ai_response)
                 
-                logger.info("✅ DeepSeek анализ успешно завершен")
-                return self._process_ai_response(analysis_data)
+                analysis_result["usage"] = usage
+                return analysis_result
                 
+            except CircuitOpenError:
+                reason = "circuit_open"
+                logger.debug("🔌 DeepSeek circuit разомкнут - сразу rule-based анализ")
             except Exception as e:
+                reason = self._fallback_reason(e)
                 logger.error(f"❌ DeepSeek API error: {e}")
                 logger.error(f"🔍 Тип ошибки: {type(e).__name__}")
                 logger.info("🔧 Переключаемся на rule-based анализ...")
@@ -173,115 +705,180 @@ class AIAnalysisService:
         
         # Если DeepSeek недоступен - используем rule-based анализ
         logger.warning("🔧 Используем rule-based анализ (DeepSeek недоступен)")
-        return await self._fallback_rule_based_analysis(form_answers, supplements_catalog)
-    
-    def _process_ai_response(self, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Обрабатываем ответ от AI API"""
-        recommendations_dict = {}
-        
-        for rec_id, rec_data in analysis_data.get("recommendations", {}).items():
-            recommendations_dict[rec_id] = SupplementRecommendation(
-                name=rec_data.get("name", ""),
-                dosage=rec_data.get("dosage", ""),
-                priority=rec_data.get("priority", "medium"),
-                reason=rec_data.get("reason", "")
-            )
-        
-        return {
-            "supplements": recommendations_dict,
-            "text": analysis_data.get("text", "Рекомендации недоступны"),
-            "confidence": analysis_data.get("confidence", 0.7)
-        }
+        return await self._fallback_rule_based_analysis(form_answers, supplements_catalog, reason)
     
-    def _build_analysis_prompt(
-        self, 
-        form_answers: Dict[str, Any], 
-        supplements_catalog: List[Dict]
-    ) -> str:
-        """Строим промпт для ИИ"""
-        
-        # Базовая информация о пользователе
-        user_info = f"""
-        Анализируемые данные пользователя:
-        - Возраст: {form_answers.get('age', 'не указан')}
-        - Пол: {form_answers.get('gender', 'не указан')}
-        - Вес: {form_answers.get('weight', 'не указан')} кг
-        - Рост: {form_answers.get('height', 'не указан')} см
-        - Хронические заболевания: {', '.join(form_answers.get('chronic_diseases', [])) or 'нет'}
-        - Текущие лекарства: {', '.join(form_answers.get('current_medications', [])) or 'нет'}
-        - Симптомы: {', '.join(form_answers.get('symptoms', [])) or 'нет'}
-        - Цели: {', '.join(form_answers.get('goals', [])) or 'не указаны'}
+    async def _chat_completion(self, deadline: Optional[Deadline] = None, **params: Any) -> Any:
         """
-        
-        # Каталог доступных БАДов
-        catalog_info = "\nДоступные БАДы:\n"
-        for supplement in supplements_catalog[:20]:  # Ограничиваем для промпта
-            catalog_info += f"- ID: {supplement['id']}, Название: {supplement['name']}, "
-            catalog_info += f"Описание: {supplement['description']}, Теги: {', '.join(supplement.get('tags', []))}\n"
-        
-        instructions = """
-        
-        Задача:
-        1. Проанализируй данные пользователя
-        2. Выбери 3-5 наиболее подходящих БАДов из каталога
-        3. Для каждого БАДа укажи дозировку и длительность приема
-        4. Напиши подробный текст с рекомендациями (200-400 слов)
-        5. Обязательно упомяни необходимость консультации с врачом
-        
-        Принципы подбора:
-        - Учитывай возраст, пол, симптомы и цели
-        - Избегай БАДов с противопоказаниями
-        - Отдавай приоритет безопасным и базовым БАДам
-        - Не рекомендуй БАДы без четких показаний
+        Единая точка вызова DeepSeek chat.completions: ограничитель скорости
+        и параллельности, повторы при 429, таймаутах, 5xx и обрывах соединения
+        с учетом Retry-After. Очередь ограничителя и пауза между повторами
+        не выходят за остаток дедлайна запроса.
+        """
+        estimated_tokens = self.token_accountant.estimate_request(
+            params["messages"], params.get("max_tokens", settings.DEEPSEEK_MAX_TOKENS)
+        )
+        attempt = 0
+        while True:
+            # Разомкнутый circuit сразу отправляет запрос в rule-based анализ
+            self._breaker.before_call()
+            retry_after = None
+            acquire_timeout = settings.DEEPSEEK_ACQUIRE_TIMEOUT
+            if deadline is not None:
+                acquire_timeout = min(acquire_timeout, deadline.remaining())
+            try:
+                async with self._limiter.slot(estimated_tokens, acquire_timeout) as limiter:
+                    try:
+                        call_started = time.perf_counter()
+                        response = await self.deepseek_client.chat.completions.create(**params)
+                        self._provider_latency.observe(time.perf_counter() - call_started)
+                    except openai.RateLimitError as e:
+                        retry_after = parse_retry_after(e.response.headers.get("retry-after"))
+                        limiter.on_overload(retry_after)
+                        raise
+                    except openai.APITimeoutError:
+                        limiter.on_overload()
+                        raise
+                    except openai.InternalServerError as e:
+                        retry_after = parse_retry_after(e.response.headers.get("retry-after"))
+                        raise
+                    usage = getattr(response, "usage", None)
+                    limiter.on_success(estimated_tokens, usage.total_tokens if usage else None)
+            except (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as e:
+                # Временные ошибки провайдера: 429, таймаут, обрыв соединения, 5xx
+                metrics.DEEPSEEK_ERRORS_TOTAL.labels(type(e).__name__).inc()
+                self._breaker.record_failure()
+                error: Exception = e
+            except BaseException as e:
+                # Включая отмену (проигравший хедж-вызов)
+                self._record_provider_error(e)
+                raise
+            else:
+                self._breaker.record_success()
+                return response
+            
+            attempt += 1
+            if attempt > settings.DEEPSEEK_MAX_RETRIES:
+                raise error
+            backoff = min(8.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0)
+            delay = retry_after if retry_after is not None else backoff
+            if deadline is not None and delay >= deadline.remaining():
+                # Повтор не успеет до дедлайна - сразу отдаем ошибку
+                raise error
+            await asyncio.sleep(delay)
+    
+    async def _hedged_chat_completion(self, deadline: Optional[Deadline] = None, **params: Any) -> Any:
+        """
+        Вызов DeepSeek с хеджированием: если первый вызов дольше наблюдаемого
+        перцентиля задержки, параллельно запускается второй и берется
+        первый успешный ответ
         """
+        hedge_delay = None
+        if settings.DEEPSEEK_HEDGE_ENABLED:
+            hedge_delay = self._provider_latency.percentile(settings.DEEPSEEK_HEDGE_PERCENTILE)
+        if hedge_delay is None:
+            return await self._chat_completion(deadline, **params)
         
-        return user_info + catalog_info + instructions
+        primary = asyncio.ensure_future(self._chat_completion(deadline, **params))
+        hedge = None
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                self.hedges += 1
+                hedge = asyncio.ensure_future(self._chat_completion(deadline, **params))
+                tasks.add(hedge)
+            
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
     
-    async def _fallback_rule_based_analysis(
+    @staticmethod
+    def _fallback_reason(error: BaseException) -> str:
+        """Причина перехода на rule-based анализ для метрик"""
+        if isinstance(error, CircuitOpenError):
+            return "circuit_open"
+        if isinstance(error, LimiterTimeoutError):
+            return "rate_limited"
+        if isinstance(error, (ResponseParseError, ValidationError)):
+            return "parse_error"
+        return "provider_error"
+    
+    def _record_provider_error(self, error: BaseException) -> None:
+        """Учитывает ошибку в circuit breaker, если она говорит о состоянии провайдера"""
+        # Отмена, отключение клиента потока, разомкнутый circuit и очередь
+        # ограничителя (считается в ai_deepseek_limiter_acquire_timeouts_total)
+        # - не ошибки провайдера
+        if not isinstance(
+            error, (asyncio.CancelledError, GeneratorExit, CircuitOpenError, LimiterTimeoutError)
+        ):
+            metrics.DEEPSEEK_ERRORS_TOTAL.labels(type(error).__name__).inc()
+        if isinstance(error, openai.APIConnectionError):
+            self._breaker.record_failure()
+        elif isinstance(error, openai.APIStatusError) and (
+            error.status_code >= 500 or error.status_code in (401, 402, 403, 429)
+        ):
+            # 402 - у DeepSeek недостаточно средств на балансе
+            self._breaker.record_failure()
+        else:
+            self._breaker.record_ignored()
+    
+    def _build_prompt(
         self,
         form_answers: Dict[str, Any],
         supplements_catalog: List[Dict]
+    ) -> Prompt:
+        """Сообщения для DeepSeek в пределах бюджета токенов промпта"""
+        return self.prompt_builder.build(form_answers, supplements_catalog)
+    
+    @staticmethod
+    def _response_format() -> Dict[str, Any]:
+        """Параметр JSON mode для chat.completions (если включен)"""
+        if settings.DEEPSEEK_JSON_MODE:
+            return {"response_format": {"type": "json_object"}}
+        return {}
+    
+    def _process_ai_response(self, ai_response: Optional[str]) -> Dict[str, Any]:
+        """Разбирает ответ DeepSeek в результат анализа (ResponseParseError - если нечего взять)"""
+        with metrics.stage("json_parse"):
+            try:
+                return self.response_parser.parse(ai_response)
+            except ResponseParseError as e:
+                logger.error(f"❌ Ошибка разбора ответа DeepSeek: {e}")
+                _response_log.debug("🔍 Полный ответ: {}", ai_response)
+                raise
+    
+    async def _fallback_rule_based_analysis(
+        self,
+        form_answers: Dict[str, Any],
+        supplements_catalog: List[Dict],
+        reason: str = "provider_error"
     ) -> Dict[str, Any]:
-        """Резервный rule-based анализ"""
-        
-        logger.info("Using fallback rule-based analysis")
-        
-        # Базовые правила подбора БАДов
-        recommended_supplements = {}
-        
-        age = form_answers.get('age', 30)
-        gender = form_answers.get('gender', 'unknown')
-        symptoms = form_answers.get('symptoms', [])
-        goals = form_answers.get('goals', [])
+        """Резервный rule-based анализ; reason - причина перехода для метрик"""
         
-        # Правило 1: Базовая поддержка для всех
-        basic_supplements = [
-            {'id': 'vitamin_d3', 'name': 'Витамин D3', 'priority': 'high'},
-            {'id': 'omega_3', 'name': 'Омега-3', 'priority': 'medium'},
-            {'id': 'magnesium', 'name': 'Магний', 'priority': 'medium'}
-        ]
-        
-        for supp in basic_supplements:
-            if any(cat_supp['name'].lower() in supp['name'].lower() 
-                   for cat_supp in supplements_catalog):
-                recommended_supplements[supp['id']] = SupplementRecommendation(
-                    name=supp['name'],
-                    dose="По инструкции",
-                    duration="1-2 месяца",
-                    priority=supp['priority'],
-                    confidence=0.7
-                )
-        
-        # Правило 2: Специфические рекомендации по симптомам
-        if 'усталость' in symptoms or 'упадок сил' in symptoms:
-            recommended_supplements['b_complex'] = SupplementRecommendation(
-                name="Витамины группы B",
-                dose="1 капсула утром",
-                duration="1 месяц",
-                priority="high",
-                confidence=0.8
-            )
+        logger.info(f"Using fallback rule-based analysis ({reason})")
+        metrics.ANALYSIS_FALLBACK_TOTAL.labels(reason).inc()
         
+        with metrics.stage("fallback"):
+            recommended_supplements = self.rule_engine.evaluate(form_answers, supplements_catalog)
+        return self._rule_based_result(recommended_supplements)
+    
+    @staticmethod
+    def _rule_based_result(
+        recommended_supplements: Dict[str, SupplementRecommendation]
+    ) -> Dict[str, Any]:
+        """Результат rule-based анализа с текстом рекомендаций"""
         # Текст рекомендаций
         recommendations_text = f"""
         На основе анализа вашей анкеты подобраны следующие БАДы:
@@ -302,7 +899,8 @@ class AIAnalysisService:
         return {
             "supplements": recommended_supplements,
             "text": recommendations_text.strip(),
-            "confidence": 0.6
+            "confidence": 0.6,
+            "source": "fallback"
         }
     
     def _validate_form_answers(self, answers: Dict[str, Any]) -> Dict[str, Any]:
@@ -315,13 +913,48 @@ class AIAnalysisService:
             return answers
     
     def _generate_cache_key(self, answers: Dict[str, Any]) -> str:
-        """Генерация ключа кэша на основе ответов"""
-        answers_str = json.dumps(answers, sort_keys=True)
-        return hashlib.md5(answers_str.encode()).hexdigest()
+        """Генерация ключа кэша по канонической форме ответов"""
+        return self._fingerprinter.fingerprint(answers).key
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика компонентов сервиса"""
+        return {
+            "cache": self.cache_service.stats(),
+            "singleflight": self._singleflight.stats(),
+            "fingerprint": self._fingerprinter.stats(),
+            "jobs": self.jobs.stats(),
+            "deepseek_limiter": self._limiter.stats(),
+            "deepseek_circuit": self._breaker.stats(),
+            "rules": self.rule_engine.stats(),
+            "catalog": self.db_service.catalog.stats(),
+            "catalog_retrieval": self.catalog_retriever.stats(),
+            "prompt": self.prompt_builder.stats(),
+            "tokens": self.token_accountant.stats(),
+            "response_parser": self.response_parser.stats(),
+            "tracing": tracing.exporter.stats(),
+            "latency": {
+                "deepseek": self._provider_latency.stats(),
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "deadline_fallbacks": self.deadline_fallbacks,
+            },
+        }
+    
+    async def submit_analysis(self, request: AnalysisRequest) -> AnalysisJobResponse:
+        """Ставит анализ в очередь; результат доступен через get_analysis_status"""
+        return await self.jobs.submit(request)
+    
+    def get_health(self) -> Dict[str, Any]:
+        """Состояние провайдера для /health"""
+        return {
+            "deepseek_circuit": self._breaker.effective_state,
+            "ready": self.ready,
+            "worker_pid": os.getpid(),
+        }
     
-    async def get_analysis_status(self, analysis_id: str) -> Optional[Dict[str, Any]]:
-        """Получение статуса анализа"""
-        return await self.db_service.get_analysis_status(analysis_id)
+    async def get_analysis_status(self, analysis_id: str) -> Optional[AnalysisJobResponse]:
+        """Получение статуса (и результата) асинхронного анализа"""
+        return await self.jobs.get(analysis_id)
     
     async def explain_recommendation(
         self, 
@@ -334,11 +967,11 @@ class AIAnalysisService:
             return None
             
         # Запрос объяснения у DeepSeek
-        if not self.deepseek_client:
+        if not await self._provider():
             return "Объяснение недоступно - DeepSeek API не настроен."
             
         try:
-            response = await self.deepseek_client.chat.completions.create(
+            response = await self._chat_completion(
                 model=settings.DEEPSEEK_MODEL,
                 messages=[
                     {
@@ -1,38 +1,585 @@
 """
-Заглушка для CacheService
+Сервис кэширования результатов анализа
 """
-from typing import Optional, Any
+import asyncio
+import secrets
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+from loguru import logger
+from pydantic import ValidationError
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.schemas.response import AIAnalysisResponse, CachedAnalysis
+
+
+class _CacheEntry:
+    """Запись кэша: сериализованный результат + поля CachedAnalysis"""
+
+    __slots__ = ("payload", "cached_at", "expires_at", "expires_at_monotonic", "hit_count")
+
+    def __init__(self, payload: bytes, ttl_seconds: float, monotonic_now: float):
+        now = datetime.now()
+        self.payload = payload
+        self.cached_at = now
+        self.expires_at = now + timedelta(seconds=ttl_seconds)
+        self.expires_at_monotonic = monotonic_now + ttl_seconds
+        self.hit_count = 0
+
+
+class LocalAnalysisCache:
+    """
+    In-process LRU кэш с ограничением по количеству записей, по объему
+    в байтах и временем жизни каждой записи.
+
+    Хранит только байты, поэтому размер записи известен точно и кэш
+    не удерживает графы pydantic объектов. clock - источник монотонного
+    времени для TTL (подменяется в тестах).
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries or settings.CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or settings.CACHE_MAX_BYTES
+        self.ttl_seconds = ttl_seconds or settings.CACHE_TTL_SECONDS
+        self._clock = clock
+
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Возвращает payload и помечает запись как недавно использованную"""
+        entry = self._get_entry(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        entry.hit_count += 1
+        self.hits += 1
+        return entry.payload
+
+    def get_entry(self, key: str) -> Optional[_CacheEntry]:
+        """Возвращает запись без учета в статистике попаданий"""
+        return self._get_entry(key)
+
+    def set(self, key: str, payload: bytes, ttl_seconds: Optional[float] = None) -> bool:
+        """Сохраняет payload; записи больше лимита по объему не кэшируются"""
+        size = len(payload)
+        if size > self.max_bytes:
+            logger.warning(f"Запись кэша {key[:16]} ({size} байт) превышает лимит кэша")
+            return False
+
+        self.delete(key)
+        self._entries[key] = _CacheEntry(payload, ttl_seconds or self.ttl_seconds, self._clock())
+        self._bytes += size
+        self._evict()
+        return True
+
+    def delete(self, key: str) -> bool:
+        """Удаляет запись"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= len(entry.payload)
+        return True
+
+    def clear(self) -> None:
+        """Очищает кэш"""
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики для подбора размеров кэша"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _get_entry(self, key: str) -> Optional[_CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        if entry.expires_at_monotonic <= self._clock():
+            self.delete(key)
+            self.expirations += 1
+            return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+    def _evict(self) -> None:
+        """Вытесняет самые давно использованные записи до соблюдения лимитов"""
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= len(entry.payload)
+            self.evictions += 1
+
+
+# Формат записи в Redis: 1 байт версии + zlib(JSON)
+_L2_FORMAT_ZLIB_JSON = b"\x01"
+
+
+# Снимает блокировку, только если она все еще принадлежит владельцу токена
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+_REFRESH_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def _encode_l2(payload: bytes) -> bytes:
+    """Компактное бинарное представление записи для Redis"""
+    return _L2_FORMAT_ZLIB_JSON + zlib.compress(payload, 1)
+
+
+def _decode_l2(data: bytes) -> Optional[bytes]:
+    """Обратное преобразование; записи неизвестного формата и поврежденные - None"""
+    if data[:1] != _L2_FORMAT_ZLIB_JSON:
+        return None
+    try:
+        return zlib.decompress(data[1:])
+    except zlib.error:
+        return None
+
+
+class RedisAnalysisCache:
+    """
+    Общий для всех воркеров и реплик кэш (L2) в Redis.
+
+    Ошибки Redis никогда не пробрасываются: после сбоя кэш считается
+    недоступным на REDIS_RETRY_INTERVAL секунд и запросы к нему не отправляются.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        key_prefix: Optional[str] = None,
+        ttl_seconds: Optional[int] = None,
+    ):
+        self.key_prefix = key_prefix or settings.REDIS_KEY_PREFIX
+        self.ttl_seconds = ttl_seconds or settings.REDIS_TTL
+        self._client = aioredis.Redis.from_url(
+            url or settings.REDIS_URL,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+        self._release_lock = self._client.register_script(_RELEASE_LOCK_SCRIPT)
+        self._refresh_lock = self._client.register_script(_REFRESH_LOCK_SCRIPT)
+        self._down_until = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalid = 0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _key(self, cache_key: str) -> str:
+        return self.key_prefix + cache_key
+
+    def _mark_down(self, error: Exception) -> None:
+        self.errors += 1
+        if self.available:
+            logger.warning(
+                f"⚠️ [CACHE] Redis недоступен ({type(error).__name__}: {error}) - "
+                f"работаем только с локальным кэшем {settings.REDIS_RETRY_INTERVAL}с"
+            )
+        self._down_until = time.monotonic() + settings.REDIS_RETRY_INTERVAL
+
+    async def ping(self) -> bool:
+        """Проверка соединения при старте"""
+        try:
+            await self._client.ping()
+            return True
+        except (RedisError, OSError) as e:
+            self._mark_down(e)
+            return False
+
+    async def get_many(
+        self, cache_keys: List[str], record_stats: bool = True
+    ) -> List[Optional[Tuple[bytes, float]]]:
+        """
+        Получает записи одним round trip: GET и PTTL для каждого ключа в одном pipeline.
+        Возвращает (payload, оставшийся TTL в секундах) или None. record_stats=False -
+        служебное чтение (опрос результата другого воркера), не влияет на hits/misses.
+        """
+        if not cache_keys or not self.available:
+            return [None] * len(cache_keys)
+
+        try:
+            async with self._client.pipeline(transaction=False) as pipe:
+                for cache_key in cache_keys:
+                    pipe.get(self._key(cache_key))
+                    pipe.pttl(self._key(cache_key))
+                replies = await pipe.execute()
+        except (RedisError, OSError) as e:
+            self._mark_down(e)
+            return [None] * len(cache_keys)
+
+        results: List[Optional[Tuple[bytes, float]]] = []
+        invalid: List[str] = []
+        for cache_key, data, pttl in zip(cache_keys, replies[::2], replies[1::2]):
+            payload = _decode_l2(data) if data else None
+            if payload is None:
+                if data:
+                    invalid.append(cache_key)
+                if record_stats:
+                    self.misses += 1
+                results.append(None)
+                continue
+            if record_stats:
+                self.hits += 1
+            ttl = pttl / 1000 if pttl and pttl > 0 else self.ttl_seconds
+            results.append((payload, ttl))
+
+        for cache_key in invalid:
+            logger.warning(f"⚠️ [CACHE] Нечитаемая запись Redis {cache_key[:16]} удалена")
+            await self.discard(cache_key)
+        return results
+
+    async def set(self, cache_key: str, payload: bytes) -> bool:
+        """Сохраняет запись с TTL"""
+        if not self.available:
+            return False
+        try:
+            await self._client.set(self._key(cache_key), _encode_l2(payload), ex=self.ttl_seconds)
+            return True
+        except (RedisError, OSError) as e:
+            self._mark_down(e)
+            return False
+
+    async def discard(self, cache_key: str) -> None:
+        """
+        Удаляет нечитаемую запись (повреждена или записана в другом формате):
+        она считается промахом и будет перезаписана новым анализом
+        """
+        self.invalid += 1
+        await self.delete(cache_key)
+
+    async def delete(self, cache_key: str) -> bool:
+        """Удаляет запись"""
+        if not self.available:
+            return False
+        try:
+            await self._client.delete(self._key(cache_key))
+            return True
+        except (RedisError, OSError) as e:
+            self._mark_down(e)
+            return False
+
+    async def clear(self) -> None:
+        """Удаляет все записи с префиксом сервиса"""
+        if not self.available:
+            return
+        try:
+            batch = []
+            async for key in self._client.scan_iter(match=self.key_prefix + "*", count=500):
+                batch.append(key)
+                if len(batch) >= 500:
+                    await self._client.unlink(*batch)
+                    batch.clear()
+            if batch:
+                await self._client.unlink(*batch)
+        except (RedisError, OSError) as e:
+            self._mark_down(e)
+
+    async def acquire_lock(self, cache_key: str, token: str, ttl_seconds: float) -> Optional[bool]:
+        """
+        Короткоживущая блокировка на вычисление ключа (SET NX PX).
+        None - Redis недоступен и блокировка невозможна.
+        """
+        if not self.available:
+            return None
+        try:
+            acquired = await self._client.set(
+                self._lock_key(cache_key), token, nx=True, px=int(ttl_seconds * 1000)
+            )
+            return bool(acquired)
+        except (RedisError, OSError) as e:
+            self._mark_down(e)
+            return None
+
+    async def release_lock(self, cache_key: str, token: str) -> None:
+        """Снимает блокировку, если она наша"""
+        if not self.available:
+            return
+        try:
+            await self._release_lock(keys=[self._lock_key(cache_key)], args=[token])
+        except (RedisError, OSError) as e:
+            self._mark_down(e)
+
+    async def refresh_lock(self, cache_key: str, token: str, ttl_seconds: float) -> bool:
+        """Продлевает блокировку, если она наша; False - блокировка потеряна"""
+        if not self.available:
+            return False
+        try:
+            return bool(await self._refresh_lock(
+                keys=[self._lock_key(cache_key)], args=[token, int(ttl_seconds * 1000)]
+            ))
+        except (RedisError, OSError) as e:
+            self._mark_down(e)
+            return False
+
+    async def is_locked(self, cache_key: str) -> bool:
+        """Проверяет, держит ли кто-то блокировку на ключ"""
+        if not self.available:
+            return False
+        try:
+            return bool(await self._client.exists(self._lock_key(cache_key)))
+        except (RedisError, OSError) as e:
+            self._mark_down(e)
+            return False
+
+    def _lock_key(self, cache_key: str) -> str:
+        return self.key_prefix + "lock:" + cache_key
+
+    async def close(self) -> None:
+        """Закрывает пул соединений Redis"""
+        await self._client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики L2"""
+        return {
+            "available": self.available,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "invalid": self.invalid,
+        }
 
 
 class CacheService:
-    """Заглушка для сервиса кэширования"""
-    
-    def __init__(self):
-        # Простой in-memory кэш
-        self._cache = {}
-    
-    async def get_analysis(self, cache_key: str) -> Optional[Any]:
+    """
+    Двухуровневый кэш результатов анализа: локальный LRU (L1) перед общим
+    Redis (L2). Без Redis работает только с L1.
+    """
+
+    def __init__(
+        self,
+        local_cache: Optional[LocalAnalysisCache] = None,
+        shared_cache: Optional[RedisAnalysisCache] = None,
+    ):
+        self._local = local_cache if local_cache is not None else LocalAnalysisCache()
+        if shared_cache is None and settings.REDIS_ENABLED:
+            shared_cache = RedisAnalysisCache()
+        self._shared = shared_cache
+
+    async def connect(self) -> None:
+        """Проверяет доступность Redis при старте"""
+        if self._shared and await self._shared.ping():
+            logger.info("✅ [CACHE] Redis кэш подключен")
+
+    async def close(self) -> None:
+        """Закрывает соединения с Redis"""
+        if self._shared:
+            await self._shared.close()
+
+    async def get_analysis(self, cache_key: str) -> Optional[AIAnalysisResponse]:
         """Получает анализ из кэша"""
-        result = self._cache.get(cache_key)
-        if result:
-            print(f"🔍 [CACHE] Найден кэш для ключа {cache_key[:16]}...")
+        results = await self.get_many_analyses([cache_key])
+        return results.get(cache_key)
+
+    async def get_many_analyses(self, cache_keys: List[str]) -> Dict[str, AIAnalysisResponse]:
+        """
+        Получает несколько анализов: сначала из L1, промахи - одним
+        pipeline из Redis с прогревом L1.
+        """
+        found: Dict[str, AIAnalysisResponse] = {}
+        missing: List[str] = []
+
+        for cache_key in cache_keys:
+            payload = self._local.get(cache_key)
+            result = await self._parse(cache_key, payload) if payload is not None else None
+            if result is None:
+                missing.append(cache_key)
+            else:
+                found[cache_key] = result
+
+        if missing and self._shared:
+            for cache_key, shared_entry in zip(missing, await self._shared.get_many(missing)):
+                if shared_entry is None:
+                    continue
+                payload, ttl = shared_entry
+                result = await self._parse(cache_key, payload)
+                if result is None:
+                    continue
+                self._local.set(cache_key, payload, ttl)
+                found[cache_key] = result
+
+        if found:
+            logger.debug(f"🔍 [CACHE] Найдено в кэше: {len(found)} из {len(cache_keys)}")
+        return found
+
+    async def acquire_lock(self, cache_key: str) -> Optional[str]:
+        """
+        Блокировка на анализ ключа между воркерами.
+        Возвращает токен владельца ("" если общего кэша нет и блокировка
+        не нужна) или None, если ключ уже анализирует другой воркер.
+        """
+        if not self._shared:
+            return ""
+        token = secrets.token_hex(8)
+        acquired = await self._shared.acquire_lock(
+            cache_key, token, settings.SINGLEFLIGHT_LOCK_TTL
+        )
+        if acquired is False:
+            return None
+        return token if acquired else ""
+
+    async def release_lock(self, cache_key: str, token: Optional[str]) -> None:
+        """Снимает блокировку, полученную через acquire_lock"""
+        if self._shared and token:
+            await self._shared.release_lock(cache_key, token)
+
+    async def hold_lock(self, cache_key: str, token: Optional[str]) -> None:
+        """
+        Продлевает блокировку на SINGLEFLIGHT_LOCK_TTL каждую треть TTL, пока
+        владелец анализирует ключ (анализ с повторами DeepSeek может идти
+        дольше TTL). Запускается задачей и отменяется при release_lock.
+        """
+        if not self._shared or not token:
+            return
+        ttl = settings.SINGLEFLIGHT_LOCK_TTL
+        while True:
+            await asyncio.sleep(ttl / 3)
+            await self._shared.refresh_lock(cache_key, token, ttl)
+
+    async def wait_for_analysis(self, cache_key: str) -> Optional[AIAnalysisResponse]:
+        """
+        Ждет, пока другой воркер сохранит анализ в общий кэш.
+        Возвращает None, если блокировка снята без результата или истек таймаут.
+        Опрос читает L2 напрямую и не искажает счетчики промахов L1/L2.
+        """
+        if not self._shared:
+            return None
+
+        deadline = time.monotonic() + settings.SINGLEFLIGHT_WAIT_TIMEOUT
+        delay = 0.05
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            result = await self._poll_shared(cache_key)
+            if result:
+                return result
+            if not await self._shared.is_locked(cache_key):
+                return await self._poll_shared(cache_key)
+            delay = min(delay * 2, 0.5)
+        return None
+
+    async def _poll_shared(self, cache_key: str) -> Optional[AIAnalysisResponse]:
+        """Читает результат из L2 без учета в статистике и прогревает L1"""
+        shared_entry = (await self._shared.get_many([cache_key], record_stats=False))[0]
+        if shared_entry is None:
+            return None
+        payload, ttl = shared_entry
+        result = await self._parse(cache_key, payload)
+        if result is not None:
+            self._local.set(cache_key, payload, ttl)
         return result
-    
-    async def store_analysis(self, cache_key: str, analysis_result: Any) -> bool:
+
+    async def _parse(self, cache_key: str, payload: bytes) -> Optional[AIAnalysisResponse]:
+        """
+        Результат из записи кэша. Запись, не проходящая схему (повреждена или
+        сохранена прежней версией сервиса), удаляется из обоих уровней и
+        считается промахом.
+        """
+        try:
+            return AIAnalysisResponse.model_validate_json(payload)
+        except ValidationError as e:
+            logger.warning(
+                f"⚠️ [CACHE] Запись {cache_key[:16]} не соответствует схеме ответа - удалена: "
+                f"{e.error_count()} ошибок"
+            )
+            self._local.delete(cache_key)
+            if self._shared:
+                await self._shared.discard(cache_key)
+            return None
+
+    async def get_cached_analysis(self, cache_key: str) -> Optional[CachedAnalysis]:
+        """Получает запись кэша вместе с метаданными"""
+        entry = self._local.get_entry(cache_key)
+        if entry is None:
+            return None
+        result = await self._parse(cache_key, entry.payload)
+        if result is None:
+            return None
+
+        return CachedAnalysis(
+            cache_key=cache_key,
+            result=result,
+            cached_at=entry.cached_at,
+            expires_at=entry.expires_at,
+            hit_count=entry.hit_count,
+        )
+
+    async def store_analysis(self, cache_key: str, analysis_result: AIAnalysisResponse) -> bool:
         """Сохраняет анализ в кэш"""
-        self._cache[cache_key] = analysis_result
-        print(f"💾 [CACHE] Сохранен анализ для ключа {cache_key[:16]}...")
-        return True
-    
+        payload = analysis_result.model_dump_json().encode()
+        stored = self._local.set(cache_key, payload)
+        if self._shared:
+            stored = await self._shared.set(cache_key, payload) or stored
+        if stored:
+            logger.debug(f"💾 [CACHE] Сохранен анализ для ключа {cache_key[:16]}...")
+        return stored
+
     async def invalidate_cache(self, cache_key: str) -> bool:
         """Удаляет запись из кэша"""
-        if cache_key in self._cache:
-            del self._cache[cache_key]
-            print(f"🗑️ [CACHE] Удален кэш для ключа {cache_key[:16]}...")
+        deleted = self._local.delete(cache_key)
+        if self._shared:
+            deleted = await self._shared.delete(cache_key) or deleted
+        if deleted:
+            logger.debug(f"🗑️ [CACHE] Удален кэш для ключа {cache_key[:16]}...")
         return True
-    
+
     async def clear_cache(self) -> bool:
         """Очищает весь кэш"""
-        self._cache.clear()
-        print("🧹 [CACHE] Кэш очищен")
-        return True 
\ No newline at end of file
+        self._local.clear()
+        if self._shared:
+            await self._shared.clear()
+        logger.info("🧹 [CACHE] Кэш очищен")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика кэша по уровням"""
+        return {
+            "l1": self._local.stats(),
+            "l2": self._shared.stats() if self._shared else None,
+        }
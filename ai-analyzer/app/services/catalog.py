@@ -0,0 +1,293 @@
+"""
+Снимок каталога БАДов в памяти с фоновым обновлением
+"""
+import asyncio
+import hashlib
+import json
+import time
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Mapping, Optional, Tuple
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.lazy_import import lazy_module
+from app.database.connection import get_conninfo, get_pool
+from app.services.fingerprint import normalize_text
+
+if TYPE_CHECKING:
+    from psycopg_pool import AsyncConnectionPool
+
+psycopg = lazy_module("psycopg")
+
+CatalogItem = Mapping[str, Any]
+
+# Каталог по умолчанию: в схеме сервера таблицы supplements больше нет
+# (миграция 20250730111542_add_consultations_and_remove_supplements)
+BUILTIN_CATALOG = (
+    {
+        "id": "vitamin_d3",
+        "name": "Витамин D3",
+        "description": "Поддержка иммунной системы и костей",
+        "category": "vitamins",
+        "tags": ["витамин d", "иммунитет", "кости"],
+        "recommended_dose": "2000 МЕ в день",
+    },
+    {
+        "id": "omega_3",
+        "name": "Омега-3",
+        "description": "Поддержка сердечно-сосудистой системы",
+        "category": "fatty_acids",
+        "tags": ["омега-3", "сердце", "мозг"],
+        "recommended_dose": "1000 мг в день",
+    },
+    {
+        "id": "magnesium",
+        "name": "Магний",
+        "description": "Улучшение качества сна и снятие стресса",
+        "category": "minerals",
+        "tags": ["магний", "сон", "стресс", "нервы"],
+        "recommended_dose": "400 мг в день",
+    },
+    {
+        "id": "vitamin_b12",
+        "name": "Витамин B12",
+        "description": "Поддержка нервной системы и энергии",
+        "category": "vitamins",
+        "tags": ["витамин b12", "энергия", "нервы"],
+        "recommended_dose": "1000 мкг в день",
+    },
+    {
+        "id": "zinc",
+        "name": "Цинк",
+        "description": "Поддержка иммунитета и заживления",
+        "category": "minerals",
+        "tags": ["цинк", "иммунитет", "кожа"],
+        "recommended_dose": "15 мг в день",
+    },
+)
+
+_CATALOG_QUERY = (
+    "SELECT id, name, price, description, tags FROM supplements "
+    "WHERE in_stock ORDER BY id"
+)
+# Дешевая проверка изменений перед полной перезагрузкой
+_CATALOG_CHANGES_QUERY = "SELECT count(*), max(updated_at) FROM supplements"
+
+
+def _freeze(item: Dict[str, Any]) -> CatalogItem:
+    item = dict(item)
+    item["tags"] = tuple(item.get("tags") or ())
+    return MappingProxyType(item)
+
+
+class CatalogSnapshot:
+    """
+    Неизменяемый снимок каталога: элементы и индексы по id, тегу и
+    категории строятся один раз при загрузке. Обновление каталога
+    подменяет снимок целиком, поэтому запрос видит согласованную версию.
+    Индекс для подбора позиций под анкету строит CatalogRetriever.
+    """
+
+    __slots__ = ("version", "digest", "source", "loaded_at", "items", "by_id", "by_tag", "by_category")
+
+    def __init__(self, items: Iterable[Dict[str, Any]], version: int, source: str):
+        self.version = version
+        self.source = source
+        self.loaded_at = time.time()
+        self.items: Tuple[CatalogItem, ...] = tuple(_freeze(item) for item in items)
+        self.digest = catalog_digest(self.items)
+
+        by_tag: Dict[str, list] = {}
+        by_category: Dict[str, list] = {}
+        for item in self.items:
+            for tag in item["tags"]:
+                by_tag.setdefault(normalize_text(tag), []).append(item)
+            if item.get("category"):
+                by_category.setdefault(item["category"], []).append(item)
+
+        self.by_id: Mapping[str, CatalogItem] = MappingProxyType(
+            {str(item["id"]): item for item in self.items}
+        )
+        self.by_tag: Mapping[str, Tuple[CatalogItem, ...]] = MappingProxyType(
+            {tag: tuple(items) for tag, items in by_tag.items()}
+        )
+        self.by_category: Mapping[str, Tuple[CatalogItem, ...]] = MappingProxyType(
+            {category: tuple(items) for category, items in by_category.items()}
+        )
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+def catalog_digest(items: Iterable[CatalogItem]) -> str:
+    """Хэш содержимого каталога: версия растет только при реальных изменениях"""
+    data = json.dumps([dict(item) for item in items], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+
+class CatalogStore:
+    """
+    Держит текущий снимок каталога. По умолчанию это встроенный каталог;
+    с CATALOG_DB_ENABLED снимок загружается из таблицы supplements и
+    обновляется в фоне: по уведомлению Postgres (LISTEN на
+    CATALOG_NOTIFY_CHANNEL) и опросом раз в CATALOG_REFRESH_INTERVAL секунд.
+    Обработка запросов читает только снимок и в базу за каталогом не ходит.
+    """
+
+    def __init__(
+        self,
+        pool_getter: Callable[[], Optional["AsyncConnectionPool"]] = get_pool,
+        refresh_interval: Optional[float] = None,
+        channel: Optional[str] = None,
+        enabled: Optional[bool] = None,
+    ):
+        self._pool_getter = pool_getter
+        self.enabled = settings.CATALOG_DB_ENABLED if enabled is None else enabled
+        self.refresh_interval = refresh_interval or settings.CATALOG_REFRESH_INTERVAL
+        self.channel = channel or settings.CATALOG_NOTIFY_CHANNEL
+        self.snapshot = CatalogSnapshot(BUILTIN_CATALOG, version=1, source="builtin")
+        self._changes: Optional[Tuple[Any, ...]] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._last_error: Optional[str] = None
+
+        self.refreshes = 0
+        self.notifications = 0
+        self.errors = 0
+
+    async def start(self) -> None:
+        """
+        Первичная загрузка и запуск фонового обновления. Старт не ждет
+        базу дольше CATALOG_STARTUP_TIMEOUT - до загрузки работает
+        встроенный каталог. Если каталог из базы уже загружен до fork
+        (preload), старт его не ждет - проверку выполнит фоновое обновление.
+        """
+        if not self.enabled:
+            logger.info(f"📦 Каталог БАДов встроенный: {len(self.snapshot)} позиций")
+            return
+        if self.snapshot.source != "database":
+            try:
+                await asyncio.wait_for(self.refresh(), settings.CATALOG_STARTUP_TIMEOUT)
+            except asyncio.TimeoutError:
+                self._report_error("превышено время первичной загрузки")
+        if self._pool_getter() is not None:
+            self._task = asyncio.create_task(self._watch(), name="catalog-refresh")
+
+    async def close(self) -> None:
+        """Останавливает фоновое обновление"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def refresh(self, force: bool = False) -> bool:
+        """Перечитывает каталог, если он изменился; True - снимок заменен"""
+        if not self.enabled:
+            return False
+        pool = self._pool_getter()
+        if pool is None:
+            return False
+        try:
+            async with pool.connection() as conn:
+                changes = await (await conn.execute(_CATALOG_CHANGES_QUERY)).fetchone()
+                if not force and changes == self._changes:
+                    return False
+                rows = await (await conn.execute(_CATALOG_QUERY)).fetchall()
+        except (psycopg.Error, OSError, asyncio.TimeoutError) as e:
+            self.errors += 1
+            self._report_error(f"{type(e).__name__}: {e}")
+            return False
+
+        return self._apply(changes, rows)
+
+    def preload(self) -> bool:
+        """
+        Синхронная загрузка каталога до запуска event loop - в master-процессе
+        перед fork воркеров (см. gunicorn.conf.py). Воркеры получают готовый
+        снимок, а их первое фоновое обновление не перечитывает неизменный каталог.
+        """
+        if not self.enabled:
+            return False
+        try:
+            with psycopg.connect(
+                get_conninfo(),
+                autocommit=True,
+                connect_timeout=max(1, int(settings.CATALOG_STARTUP_TIMEOUT)),
+            ) as conn:
+                changes = conn.execute(_CATALOG_CHANGES_QUERY).fetchone()
+                rows = conn.execute(_CATALOG_QUERY).fetchall()
+        except (psycopg.Error, OSError) as e:
+            self.errors += 1
+            self._report_error(f"{type(e).__name__}: {e}")
+            return False
+        return self._apply(changes, rows)
+
+    def _apply(self, changes: Optional[Tuple[Any, ...]], rows: Iterable[Tuple[Any, ...]]) -> bool:
+        self._changes = changes
+        self._last_error = None
+        items = [
+            {
+                "id": str(row[0]),
+                "name": row[1],
+                "price": float(row[2]) if row[2] is not None else None,
+                "description": row[3] or "",
+                "tags": list(row[4] or []),
+            }
+            for row in rows
+        ]
+        if not items:
+            self._report_error("таблица supplements пуста")
+            return False
+        if catalog_digest(_freeze(item) for item in items) == self.snapshot.digest:
+            return False
+
+        self.snapshot = CatalogSnapshot(items, version=self.snapshot.version + 1, source="database")
+        self.refreshes += 1
+        logger.info(f"📦 Каталог БАДов v{self.snapshot.version}: {len(self.snapshot)} позиций")
+        return True
+
+    def _report_error(self, message: str) -> None:
+        # Одна и та же ошибка логируется один раз, а не на каждом опросе
+        if message != self._last_error:
+            logger.warning(
+                f"⚠️ Каталог из базы недоступен ({message}) - "
+                f"используется снимок v{self.snapshot.version} ({self.snapshot.source})"
+            )
+        self._last_error = message
+
+    async def _watch(self) -> None:
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    get_conninfo(), autocommit=True
+                ) as conn:
+                    listen = psycopg.sql.SQL("LISTEN {}").format(psycopg.sql.Identifier(self.channel))
+                    await conn.execute(listen)
+                    await self.refresh()
+                    while True:
+                        # Пачку уведомлений обрабатываем одной перезагрузкой
+                        notified = False
+                        async for _ in conn.notifies(timeout=self.refresh_interval, stop_after=1):
+                            notified = True
+                        if notified:
+                            self.notifications += 1
+                        await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except (psycopg.Error, OSError) as e:
+                # Без LISTEN-соединения продолжаем обновлять каталог опросом
+                logger.debug(f"Catalog LISTEN unavailable: {e}")
+                await asyncio.sleep(self.refresh_interval)
+                await self.refresh()
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние снимка каталога"""
+        return {
+            "version": self.snapshot.version,
+            "items": len(self.snapshot),
+            "source": self.snapshot.source,
+            "loaded_at": self.snapshot.loaded_at,
+            "refreshes": self.refreshes,
+            "notifications": self.notifications,
+            "errors": self.errors,
+        }
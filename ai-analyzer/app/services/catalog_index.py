@@ -0,0 +1,147 @@
+"""
+Отбор релевантных анкете позиций каталога для промпта (TF-IDF)
+"""
+import math
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.catalog import CatalogItem
+from app.services.fingerprint import normalize_text
+
+# Поля анкеты, по которым ищутся БАДы
+QUERY_FIELDS = ("symptoms", "goals", "chronic_diseases")
+# Совпадение по тегу весит больше совпадения по описанию
+TAG_WEIGHT = 2.0
+# Грубый стемминг: слово обрезается до префикса, чтобы "иммунитет" и
+# "иммунитета" давали один термин
+STEM_LENGTH = 6
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def tokenize(text: Any) -> List[str]:
+    """Термины текста: слова в casefold, обрезанные до STEM_LENGTH"""
+    return [word[:STEM_LENGTH] for word in _WORD_RE.findall(normalize_text(text)) if len(word) > 1]
+
+
+class CatalogIndex:
+    """
+    Инвертированный индекс каталога с нормированными весами TF-IDF по
+    описанию и тегам. Строится один раз на снимок каталога; запрос
+    складывает веса только по постингам терминов анкеты.
+    """
+
+    def __init__(self, catalog: Sequence[CatalogItem]):
+        self.catalog = catalog
+        size = len(catalog)
+
+        counts: List[Dict[str, float]] = []
+        document_frequency: Dict[str, int] = {}
+        for item in catalog:
+            tf: Dict[str, float] = {}
+            for term in tokenize(item.get("description", "")):
+                tf[term] = tf.get(term, 0.0) + 1.0
+            for tag in item.get("tags") or ():
+                for term in tokenize(tag):
+                    tf[term] = tf.get(term, 0.0) + TAG_WEIGHT
+            for term in tokenize(item.get("name", "")):
+                tf[term] = tf.get(term, 0.0) + 1.0
+            counts.append(tf)
+            for term in tf:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+
+        self.idf = {
+            term: math.log((1 + size) / (1 + df)) + 1.0 for term, df in document_frequency.items()
+        }
+
+        postings: Dict[str, Tuple[List[int], List[float]]] = {}
+        for position, tf in enumerate(counts):
+            weights = {term: (1.0 + math.log(count)) * self.idf[term] for term, count in tf.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for term, weight in weights.items():
+                documents, values = postings.setdefault(term, ([], []))
+                documents.append(position)
+                values.append(weight / norm)
+
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {
+            term: (np.array(documents, dtype=np.int32), np.array(values, dtype=np.float32))
+            for term, (documents, values) in postings.items()
+        }
+
+    def query_terms(self, form_answers: Dict[str, Any]) -> Dict[str, float]:
+        """Термины анкеты с весами IDF (неизвестные каталогу отбрасываются)"""
+        terms: Dict[str, float] = {}
+        for field in QUERY_FIELDS:
+            values = form_answers.get(field) or []
+            if isinstance(values, str):
+                values = [values]
+            for value in values:
+                for term in tokenize(value):
+                    if term in self.idf:
+                        terms[term] = self.idf[term]
+        return terms
+
+    def scores(self, form_answers: Dict[str, Any]) -> np.ndarray:
+        """Релевантность каждой позиции каталога анкете"""
+        scores = np.zeros(len(self.catalog), dtype=np.float32)
+        for term, weight in self.query_terms(form_answers).items():
+            documents, values = self.postings[term]
+            scores[documents] += values * weight
+        return scores
+
+    def top_k(self, form_answers: Dict[str, Any], k: int) -> List[CatalogItem]:
+        """
+        K наиболее релевантных позиций по убыванию оценки. Если совпадений
+        меньше K, список добирается позициями в порядке каталога, чтобы
+        модели было из чего выбрать.
+        """
+        size = len(self.catalog)
+        if size <= k:
+            order = np.argsort(-self.scores(form_answers), kind="stable")
+            return [self.catalog[i] for i in order]
+
+        scores = self.scores(form_answers)
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        # Устойчивый порядок: по оценке, при равенстве - по позиции в каталоге
+        order = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [self.catalog[i] for i in order]
+
+
+class CatalogRetriever:
+    """Строит индекс для текущего снимка каталога и отбирает top-K позиций"""
+
+    def __init__(self, top_k: Optional[int] = None):
+        self.top_k = top_k or settings.CATALOG_PROMPT_TOP_K
+        self._index: Optional[CatalogIndex] = None
+
+        self.index_builds = 0
+        self.selections = 0
+        self.selected_total = 0
+
+    def index_for(self, catalog: Sequence[CatalogItem]) -> CatalogIndex:
+        """Индекс каталога; снимок неизменяем, поэтому пересборка - только при смене объекта"""
+        if self._index is None or self._index.catalog is not catalog:
+            self._index = CatalogIndex(catalog)
+            self.index_builds += 1
+        return self._index
+
+    def select(
+        self, form_answers: Dict[str, Any], catalog: Sequence[CatalogItem], k: Optional[int] = None
+    ) -> List[CatalogItem]:
+        """Релевантные анкете позиции каталога для промпта"""
+        selected = self.index_for(catalog).top_k(form_answers, k or self.top_k)
+        self.selections += 1
+        self.selected_total += len(selected)
+        return selected
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики отбора"""
+        return {
+            "top_k": self.top_k,
+            "index_builds": self.index_builds,
+            "selections": self.selections,
+            "avg_selected": round(self.selected_total / self.selections, 2) if self.selections else 0.0,
+        }
@@ -0,0 +1,156 @@
+"""
+Circuit breaker для провайдера DeepSeek
+"""
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from loguru import logger
+
+from app.core import metrics
+from app.core.config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Провайдер считается недоступным - запрос не отправляется"""
+
+
+class CircuitBreaker:
+    """
+    Размыкается, когда доля ошибок за скользящее окно превышает порог.
+    В разомкнутом состоянии вызовы отклоняются сразу; через
+    CIRCUIT_OPEN_SECONDS пропускается ограниченное число пробных
+    вызовов (half-open), успех пробы замыкает цепь, ошибка - снова размыкает.
+    clock - источник монотонного времени (подменяется в тестах).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: Optional[float] = None,
+        window_seconds: Optional[float] = None,
+        min_calls: Optional[int] = None,
+        open_seconds: Optional[float] = None,
+        half_open_probes: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_rate = failure_rate or settings.CIRCUIT_FAILURE_RATE
+        self.window_seconds = window_seconds or settings.CIRCUIT_WINDOW_SECONDS
+        self.min_calls = min_calls or settings.CIRCUIT_MIN_CALLS
+        self.open_seconds = open_seconds or settings.CIRCUIT_OPEN_SECONDS
+        self.half_open_probes = half_open_probes or settings.CIRCUIT_HALF_OPEN_PROBES
+        self._clock = clock
+
+        self.state = CLOSED
+        self._calls: Deque[Tuple[float, bool]] = deque()
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+
+        self.rejected = 0
+        self.opened = 0
+        metrics.DEEPSEEK_CIRCUIT_STATE.set(metrics.CIRCUIT_STATE_VALUES[CLOSED])
+
+    @property
+    def is_open(self) -> bool:
+        """Разомкнут и время до пробного вызова еще не истекло (проверка без учета вызова)"""
+        return self.state == OPEN and self._clock() - self._opened_at < self.open_seconds
+
+    @property
+    def effective_state(self) -> str:
+        """
+        Состояние с учетом времени: разомкнутая цепь, у которой истекло
+        open_seconds, пропустит следующий вызов как пробный (half_open)
+        """
+        if self.state == OPEN and not self.is_open:
+            return HALF_OPEN
+        return self.state
+
+    def before_call(self) -> None:
+        """Проверяет, можно ли вызывать провайдера; иначе CircuitOpenError"""
+        if self.state == OPEN:
+            if self._clock() - self._opened_at < self.open_seconds:
+                self._reject()
+                raise CircuitOpenError(f"Circuit '{self.name}' is open")
+            self._transition(HALF_OPEN)
+
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_probes:
+                self._reject()
+                raise CircuitOpenError(f"Circuit '{self.name}' is half-open, probe in flight")
+            self._probes_in_flight += 1
+
+    def record_success(self) -> None:
+        """Успешный вызов"""
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            self._transition(CLOSED)
+            return
+        self._record(True)
+
+    def record_failure(self) -> None:
+        """Ошибка провайдера (таймаут, 429, 5xx, нет средств)"""
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            self._transition(OPEN)
+            return
+        self._record(False)
+        if self.state == CLOSED and self._should_open():
+            self._transition(OPEN)
+
+    def record_ignored(self) -> None:
+        """Вызов завершился без информации о здоровье провайдера"""
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _record(self, success: bool) -> None:
+        now = self._clock()
+        self._calls.append((now, success))
+        cutoff = now - self.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+
+    def _should_open(self) -> bool:
+        total = len(self._calls)
+        if total < self.min_calls:
+            return False
+        failures = sum(1 for _, success in self._calls if not success)
+        return failures / total >= self.failure_rate
+
+    def _reject(self) -> None:
+        self.rejected += 1
+        metrics.DEEPSEEK_CIRCUIT_REJECTED_TOTAL.inc()
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        previous, self.state = self.state, state
+        metrics.DEEPSEEK_CIRCUIT_STATE.set(metrics.CIRCUIT_STATE_VALUES[state])
+        if state == OPEN:
+            self.opened += 1
+            metrics.DEEPSEEK_CIRCUIT_OPENS_TOTAL.inc()
+            self._opened_at = self._clock()
+            logger.warning(
+                f"🔌 Circuit '{self.name}': {previous} -> open на {self.open_seconds}с, "
+                "запросы идут в rule-based анализ"
+            )
+        elif state == CLOSED:
+            self._calls.clear()
+            logger.info(f"🔌 Circuit '{self.name}': {previous} -> closed")
+        else:
+            logger.info(f"🔌 Circuit '{self.name}': {previous} -> half_open, пробный запрос")
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние для /health и метрик"""
+        failures = sum(1 for _, success in self._calls if not success)
+        return {
+            "state": self.effective_state,
+            "window_calls": len(self._calls),
+            "window_failures": failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
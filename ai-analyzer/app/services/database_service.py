@@ -1,58 +1,52 @@
 """
-Заглушка для DatabaseService
+Сервис базы данных: каталог БАДов и результаты анализа
 """
-from typing import List, Dict, Any, Optional
+from typing import Dict, Any, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from app.services.catalog import CatalogItem, CatalogSnapshot, CatalogStore
+from app.services.fingerprint import normalize_text
 
 
 class DatabaseService:
-    """Заглушка для сервиса базы данных"""
+    """Доступ к данным сервиса; каталог отдается из снимка в памяти"""
+    
+    def __init__(self, catalog: Optional[CatalogStore] = None):
+        self.catalog = catalog if catalog is not None else CatalogStore()
+    
+    async def start(self) -> None:
+        """Загружает каталог и запускает его фоновое обновление"""
+        await self.catalog.start()
+    
+    async def close(self) -> None:
+        """Останавливает фоновое обновление каталога"""
+        await self.catalog.close()
+    
+    @property
+    def catalog_snapshot(self) -> CatalogSnapshot:
+        """Текущий снимок каталога (один объект на весь запрос)"""
+        return self.catalog.snapshot
+    
+    async def get_supplements_catalog(self) -> Sequence[CatalogItem]:
+        """Возвращает каталог БАДов из снимка в памяти без запроса к базе"""
+        return self.catalog.snapshot.items
+    
+    async def get_supplement(self, supplement_id: str) -> Optional[CatalogItem]:
+        """Позиция каталога по id (индекс снимка)"""
+        return self.catalog.snapshot.by_id.get(str(supplement_id))
     
-    def __init__(self):
-        pass
+    async def get_supplements_by_tag(self, tag: str) -> Tuple[CatalogItem, ...]:
+        """Позиции каталога с тегом (без учета регистра и лишних пробелов)"""
+        return self.catalog.snapshot.by_tag.get(normalize_text(tag), ())
     
-    async def get_supplements_catalog(self) -> List[Dict]:
-        """Возвращает каталог БАДов"""
-        return [
-            {
-                "id": "vitamin_d3",
-                "name": "Витамин D3",
-                "description": "Поддержка иммунной системы и костей",
-                "category": "vitamins",
-                "recommended_dose": "2000 МЕ в день"
-            },
-            {
-                "id": "omega_3",
-                "name": "Омега-3",
-                "description": "Поддержка сердечно-сосудистой системы",
-                "category": "fatty_acids",
-                "recommended_dose": "1000 мг в день"
-            },
-            {
-                "id": "magnesium",
-                "name": "Магний",
-                "description": "Улучшение качества сна и снятие стресса",
-                "category": "minerals",
-                "recommended_dose": "400 мг в день"
-            },
-            {
-                "id": "vitamin_b12",
-                "name": "Витамин B12",
-                "description": "Поддержка нервной системы и энергии",
-                "category": "vitamins",
-                "recommended_dose": "1000 мкг в день"
-            },
-            {
-                "id": "zinc",
-                "name": "Цинк",
-                "description": "Поддержка иммунитета и заживления",
-                "category": "minerals",
-                "recommended_dose": "15 мг в день"
-            }
-        ]
+    async def get_supplements_by_category(self, category: str) -> Tuple[CatalogItem, ...]:
+        """Позиции каталога из категории"""
+        return self.catalog.snapshot.by_category.get(category, ())
     
     async def save_analysis_result(self, analysis_id: str, result: Dict[str, Any], user_id: str = None) -> bool:
         """Сохраняет результат анализа (заглушка)"""
-        print(f"📝 [DATABASE] Сохранение анализа {analysis_id}")
+        logger.debug("📝 Сохранение анализа {}", analysis_id)
         return True
     
     async def get_analysis_status(self, analysis_id: str) -> Optional[Dict]:
@@ -0,0 +1,151 @@
+"""
+Канонический отпечаток анкеты для ключа кэша
+"""
+import hashlib
+import json
+import math
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.schemas.response import FormAnswersValidation
+
+# Поля анкеты, которые попадают в промпт; остальные на результат не влияют
+PROMPT_FIELDS = (
+    "age",
+    "gender",
+    "weight",
+    "height",
+    "chronic_diseases",
+    "current_medications",
+    "symptoms",
+    "goals",
+)
+LIST_FIELDS = {"chronic_diseases", "current_medications", "symptoms", "goals"}
+NUMERIC_FIELDS = {"age", "weight", "height"}
+
+
+class Fingerprint(NamedTuple):
+    """Ключ кэша и признак того, что нормализация изменила ответы"""
+    key: str
+    normalized: bool
+
+
+def normalize_text(value: Any) -> str:
+    """Схлопывает пробелы и приводит строку к casefold"""
+    return " ".join(str(value).split()).casefold()
+
+
+def _normalize_list(values: Any) -> Optional[List[str]]:
+    if isinstance(values, str):
+        values = [values]
+    if not isinstance(values, (list, tuple, set)):
+        return None
+    items = {normalize_text(value) for value in values}
+    items.discard("")
+    return sorted(items) or None
+
+
+def _normalize_number(value: Any, bucket: float) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(number) or math.isinf(number):
+        return None
+    if bucket > 0:
+        number = float(math.floor(number / bucket) * bucket)
+    # 70.0 и 70 должны давать одинаковый ключ
+    return int(number) if number.is_integer() else round(number, 1)
+
+
+def _numeric_buckets() -> Dict[str, float]:
+    return {
+        "age": settings.CACHE_AGE_BUCKET,
+        "weight": settings.CACHE_WEIGHT_BUCKET,
+        "height": settings.CACHE_HEIGHT_BUCKET,
+    }
+
+
+def canonicalize_answers(answers: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Приводит анкету к канонической форме: только поля промпта,
+    нормализованные строки, отсортированные списки без дублей и
+    (опционально) округленные до корзин числовые поля.
+    """
+    try:
+        source = FormAnswersValidation(**answers).model_dump(exclude_none=True)
+    except ValidationError:
+        source = answers
+
+    buckets = _numeric_buckets()
+    canonical: Dict[str, Any] = {}
+    for field in PROMPT_FIELDS:
+        value = source.get(field)
+        if value is None:
+            continue
+        if field in LIST_FIELDS:
+            value = _normalize_list(value)
+        elif field in NUMERIC_FIELDS:
+            value = _normalize_number(value, buckets[field])
+        else:
+            value = normalize_text(value) or None
+        if value is not None:
+            canonical[field] = value
+    return canonical
+
+
+class AnswersFingerprinter:
+    """
+    Считает ключ кэша по канонической анкете с помощью keyed BLAKE2b.
+    В ключ входят версия промпта и модель, поэтому смена любой из них
+    не отдает устаревшие ответы из кэша.
+    """
+
+    def __init__(
+        self,
+        secret: Optional[str] = None,
+        prompt_version: Optional[str] = None,
+        model: Optional[str] = None,
+    ):
+        self._secret = (secret or settings.CACHE_KEY_SECRET).encode()[:64]
+        self._prompt_version = prompt_version or settings.PROMPT_VERSION
+        self._salt = f"{self._prompt_version}|{model or settings.DEEPSEEK_MODEL}|".encode()
+
+        self.fingerprints = 0
+        self.normalized = 0
+        self.hits = 0
+        self.canonical_hits = 0
+
+    def fingerprint(self, answers: Dict[str, Any]) -> Fingerprint:
+        """Отпечаток анкеты"""
+        canonical = canonicalize_answers(answers)
+        data = json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        digest = hashlib.blake2b(
+            self._salt + data.encode(), key=self._secret, digest_size=16
+        ).hexdigest()
+
+        normalized = canonical != answers
+        self.fingerprints += 1
+        if normalized:
+            self.normalized += 1
+        return Fingerprint(key=f"p{self._prompt_version}:{digest}", normalized=normalized)
+
+    def record_hit(self, fingerprint: Fingerprint) -> None:
+        """
+        Учитывает попадание в кэш. canonical_hits - попадания, которые
+        дала нормализация (исходные ответы отличались от канонических).
+        """
+        self.hits += 1
+        if fingerprint.normalized:
+            self.canonical_hits += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики нормализации"""
+        return {
+            "fingerprints": self.fingerprints,
+            "normalized": self.normalized,
+            "hits": self.hits,
+            "canonical_hits": self.canonical_hits,
+        }
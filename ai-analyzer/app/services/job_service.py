@@ -0,0 +1,399 @@
+"""
+Асинхронные задачи анализа с опросом статуса
+"""
+import asyncio
+import os
+import socket
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from app.core.config import settings
+from app.schemas.response import AIAnalysisResponse, AnalysisJobResponse, AnalysisRequest
+
+if TYPE_CHECKING:
+    from app.services.ai_service import AIAnalysisService
+
+
+class JobQueueFullError(Exception):
+    """Очередь задач анализа переполнена"""
+
+
+class JobQueueUnavailableError(Exception):
+    """Очередь задач еще не запущена (старт сервиса) или уже остановлена"""
+
+
+class AnalysisJobStore:
+    """
+    Локальное хранилище задач в SQLite, общее для воркеров gunicorn.
+
+    Задачу выполняет тот воркер, который атомарно перевел ее из pending в
+    processing (claim) и записал себя владельцем. Владелец продлевает
+    аренду (updated_at), пока выполняет задачу; задача с истекшей арендой
+    (воркер убит) возвращается в pending. Методы блокирующие - вызывать
+    через asyncio.to_thread.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.JOBS_DB_PATH
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def open(self) -> None:
+        """Открывает базу и создает таблицу задач"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS analysis_jobs (
+                analysis_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                progress INTEGER NOT NULL DEFAULT 0,
+                message TEXT,
+                request_json TEXT NOT NULL,
+                result_json TEXT,
+                owner TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """
+        )
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(analysis_jobs)")}
+        if "owner" not in columns:
+            # База, созданная до появления аренды задач
+            try:
+                self._conn.execute("ALTER TABLE analysis_jobs ADD COLUMN owner TEXT")
+            except sqlite3.OperationalError:
+                # Колонку одновременно добавил другой воркер
+                pass
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS analysis_jobs_status ON analysis_jobs (status)"
+        )
+
+    @property
+    def is_open(self) -> bool:
+        return self._conn is not None
+
+    def close(self) -> None:
+        """Закрывает базу"""
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def create(self, analysis_id: str, request: AnalysisRequest) -> None:
+        """Создает задачу в статусе pending"""
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO analysis_jobs "
+                "(analysis_id, status, progress, request_json, created_at, updated_at) "
+                "VALUES (?, 'pending', 0, ?, ?, ?)",
+                (analysis_id, request.model_dump_json(), now, now),
+            )
+
+    def claim(self, analysis_id: str, owner: str) -> bool:
+        """
+        Атомарно забирает задачу в работу: pending -> processing с владельцем.
+        False - задачу уже забрал другой воркер или она завершена.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE analysis_jobs SET status = 'processing', progress = 10, owner = ?, "
+                "updated_at = ? WHERE analysis_id = ? AND status = 'pending'",
+                (owner, datetime.now().isoformat(), analysis_id),
+            )
+        return cursor.rowcount == 1
+
+    def renew(self, analysis_id: str, owner: str) -> bool:
+        """Продлевает аренду задачи; False - задача больше не принадлежит владельцу"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE analysis_jobs SET updated_at = ? "
+                "WHERE analysis_id = ? AND owner = ? AND status = 'processing'",
+                (datetime.now().isoformat(), analysis_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def update(
+        self,
+        analysis_id: str,
+        owner: str,
+        status: str,
+        progress: int,
+        message: Optional[str] = None,
+        result: Optional[AIAnalysisResponse] = None,
+    ) -> bool:
+        """Обновляет статус задачи, если она все еще принадлежит владельцу"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE analysis_jobs SET status = ?, progress = ?, message = ?, "
+                "result_json = ?, updated_at = ? "
+                "WHERE analysis_id = ? AND owner = ? AND status = 'processing'",
+                (
+                    status,
+                    progress,
+                    message,
+                    result.model_dump_json() if result else None,
+                    datetime.now().isoformat(),
+                    analysis_id,
+                    owner,
+                ),
+            )
+        return cursor.rowcount == 1
+
+    def get(self, analysis_id: str) -> Optional[AnalysisJobResponse]:
+        """Возвращает статус и результат задачи"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM analysis_jobs WHERE analysis_id = ?", (analysis_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return AnalysisJobResponse(
+            analysis_id=row["analysis_id"],
+            status=row["status"],
+            progress=row["progress"],
+            message=row["message"],
+            created_at=datetime.fromisoformat(row["created_at"]),
+            updated_at=datetime.fromisoformat(row["updated_at"]),
+            result=(
+                AIAnalysisResponse.model_validate_json(row["result_json"])
+                if row["result_json"]
+                else None
+            ),
+        )
+
+    def get_request(self, analysis_id: str) -> Optional[AnalysisRequest]:
+        """Возвращает исходный запрос задачи"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT request_json FROM analysis_jobs WHERE analysis_id = ?", (analysis_id,)
+            ).fetchone()
+        return AnalysisRequest.model_validate_json(row["request_json"]) if row else None
+
+    def release(self, owner: str) -> int:
+        """Возвращает в pending задачи владельца (плавная остановка воркера)"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE analysis_jobs SET status = 'pending', progress = 0, owner = NULL, "
+                "updated_at = ? WHERE owner = ? AND status = 'processing'",
+                (datetime.now().isoformat(), owner),
+            )
+        return cursor.rowcount
+
+    def recover_expired(self, lease_expired_before: datetime) -> int:
+        """Возвращает в pending задачи, аренда которых истекла (воркер убит)"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE analysis_jobs SET status = 'pending', progress = 0, owner = NULL, "
+                "updated_at = ? WHERE status = 'processing' AND updated_at < ?",
+                (datetime.now().isoformat(), lease_expired_before.isoformat()),
+            )
+        return cursor.rowcount
+
+    def pending(self) -> List[str]:
+        """ID задач, ожидающих выполнения"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT analysis_id FROM analysis_jobs "
+                "WHERE status = 'pending' ORDER BY created_at"
+            ).fetchall()
+        return [row["analysis_id"] for row in rows]
+
+    def purge(self, older_than: datetime) -> int:
+        """Удаляет завершенные задачи старше указанного времени"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM analysis_jobs "
+                "WHERE status IN ('completed', 'failed') AND updated_at < ?",
+                (older_than.isoformat(),),
+            )
+        return cursor.rowcount
+
+
+class AnalysisJobQueue:
+    """Очередь задач анализа с ограниченным пулом воркеров внутри сервиса"""
+
+    def __init__(self, ai_service: "AIAnalysisService", store: Optional[AnalysisJobStore] = None):
+        self.ai_service = ai_service
+        self.store = store or AnalysisJobStore()
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._queued: Set[str] = set()
+        self._workers: List["asyncio.Task[None]"] = []
+        self._sweeper: Optional["asyncio.Task[None]"] = None
+        self.started = False
+        # Владелец задач в общем хранилище: воркер gunicorn и экземпляр очереди
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.recovered = 0
+
+    async def start(self) -> None:
+        """
+        Открывает хранилище, возвращает в pending задачи с истекшей арендой,
+        ставит в очередь ожидающие задачи и запускает воркеры. Ожидающие
+        задачи могут стоять и в очереди другого воркера - выполнит их тот,
+        кто первым заберет (claim). Задачи воркеров, упавших позже, подбирает
+        периодический обход (_sweep_expired).
+        """
+        await asyncio.to_thread(self.store.open)
+
+        purged = await asyncio.to_thread(
+            self.store.purge, datetime.now() - timedelta(hours=settings.JOBS_RETENTION_HOURS)
+        )
+        recovered, queued = await self._recover()
+        if queued or purged:
+            logger.info(
+                f"📋 Задачи анализа: в очереди {queued} "
+                f"(из них с истекшей арендой {recovered}), удалено старых {purged}"
+            )
+
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"analysis-job-worker-{i}")
+            for i in range(settings.JOBS_WORKERS)
+        ]
+        self._sweeper = asyncio.create_task(self._sweep_expired(), name="analysis-job-sweeper")
+        self.started = True
+
+    async def close(self) -> None:
+        """
+        Останавливает воркеры. Прерванные задачи возвращаются в pending и
+        выполняются следующим запущенным воркером.
+        """
+        self.started = False
+        tasks = self._workers + ([self._sweeper] if self._sweeper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._sweeper = None
+        if self.store.is_open:
+            await asyncio.to_thread(self.store.release, self.owner)
+        await asyncio.to_thread(self.store.close)
+
+    async def submit(self, request: AnalysisRequest) -> AnalysisJobResponse:
+        """Ставит анализ в очередь и сразу возвращает его статус"""
+        self._check_started()
+        if self._queue.qsize() >= settings.JOBS_MAX_QUEUE:
+            raise JobQueueFullError("Очередь анализа переполнена")
+
+        analysis_id = f"job_{uuid.uuid4().hex}"
+        await asyncio.to_thread(self.store.create, analysis_id, request)
+        self._enqueue(analysis_id)
+        self.submitted += 1
+        return await self.get(analysis_id)
+
+    async def get(self, analysis_id: str) -> Optional[AnalysisJobResponse]:
+        """Статус задачи и результат, если она завершена"""
+        self._check_started()
+        return await asyncio.to_thread(self.store.get, analysis_id)
+
+    def _check_started(self) -> None:
+        if not self.started:
+            raise JobQueueUnavailableError("Очередь анализа еще не запущена, повторите запрос позже")
+
+    def _enqueue(self, analysis_id: str) -> None:
+        self._queued.add(analysis_id)
+        self._queue.put_nowait(analysis_id)
+
+    async def _recover(self) -> Tuple[int, int]:
+        """
+        Возвращает в pending задачи с истекшей арендой и ставит в очередь
+        ожидающие задачи, которых в ней еще нет. Возвращает число
+        восстановленных и поставленных в очередь задач.
+        """
+        recovered = await asyncio.to_thread(
+            self.store.recover_expired,
+            datetime.now() - timedelta(seconds=settings.JOBS_LEASE_SECONDS),
+        )
+        self.recovered += recovered
+        pending = await asyncio.to_thread(self.store.pending)
+        queued = 0
+        for analysis_id in pending:
+            if analysis_id not in self._queued:
+                self._enqueue(analysis_id)
+                queued += 1
+        return recovered, queued
+
+    async def _sweep_expired(self) -> None:
+        """
+        Раз в половину аренды подбирает задачи воркеров, упавших после
+        старта: иначе они остались бы в processing до следующего перезапуска
+        """
+        while True:
+            await asyncio.sleep(settings.JOBS_LEASE_SECONDS / 2)
+            try:
+                recovered, queued = await self._recover()
+            except Exception as e:
+                logger.warning(f"⚠️ Обход задач с истекшей арендой не удался: {e}")
+                continue
+            if recovered:
+                logger.info(
+                    f"📋 Возвращены задачи с истекшей арендой: {recovered}, "
+                    f"поставлено в очередь {queued}"
+                )
+
+    async def _worker(self) -> None:
+        while True:
+            analysis_id = await self._queue.get()
+            self._queued.discard(analysis_id)
+            try:
+                await self._process(analysis_id)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, analysis_id: str) -> None:
+        if not await asyncio.to_thread(self.store.claim, analysis_id, self.owner):
+            # Задачу уже выполняет или выполнил другой воркер
+            return
+        request = await asyncio.to_thread(self.store.get_request, analysis_id)
+        if request is None:
+            return
+
+        heartbeat = asyncio.create_task(self._renew_lease(analysis_id))
+        try:
+            result = await self.ai_service.analyze_medical_form(request, raise_on_error=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Analysis job {analysis_id} failed: {e}")
+            self.failed += 1
+            await asyncio.to_thread(
+                self.store.update, analysis_id, self.owner, "failed", 100, str(e)
+            )
+            return
+        finally:
+            heartbeat.cancel()
+
+        self.completed += 1
+        await asyncio.to_thread(
+            self.store.update, analysis_id, self.owner, "completed", 100, None, result
+        )
+
+    async def _renew_lease(self, analysis_id: str) -> None:
+        """Продлевает аренду, пока задача выполняется"""
+        while True:
+            await asyncio.sleep(settings.JOBS_LEASE_SECONDS / 3)
+            await asyncio.to_thread(self.store.renew, analysis_id, self.owner)
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики очереди"""
+        return {
+            "queued": self._queue.qsize(),
+            "workers": len(self._workers),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "recovered": self.recovered,
+        }
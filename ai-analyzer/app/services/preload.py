@@ -0,0 +1,75 @@
+"""
+Состояние, которое строится один раз в master-процессе до fork воркеров
+"""
+import time
+from typing import Optional
+
+from loguru import logger
+
+from app.core.lazy_import import import_modules
+from app.services.catalog import CatalogStore
+from app.services.catalog_index import CatalogRetriever
+from app.services.prompt_builder import PromptBuilder
+from app.services.rule_engine import RuleEngine
+
+
+class PreloadedState:
+    """
+    Снимок каталога, скомпилированные правила, индекс каталога и шаблон
+    промпта. Объекты не держат соединений и задач event loop, поэтому
+    переживают fork: воркеры читают их из общих страниц памяти
+    (copy-on-write) вместо того, чтобы строить заново.
+    """
+
+    __slots__ = ("catalog", "rule_engine", "retriever", "prompt_builder", "seconds")
+
+    def __init__(
+        self,
+        catalog: CatalogStore,
+        rule_engine: RuleEngine,
+        retriever: CatalogRetriever,
+        prompt_builder: PromptBuilder,
+        seconds: float,
+    ):
+        self.catalog = catalog
+        self.rule_engine = rule_engine
+        self.retriever = retriever
+        self.prompt_builder = prompt_builder
+        self.seconds = seconds
+
+
+_state: Optional[PreloadedState] = None
+
+
+def preload_state() -> PreloadedState:
+    """Загружает каталог и компилирует структуры горячего пути (вызывается до fork)"""
+    global _state
+    started = time.perf_counter()
+
+    # Отложенные модули (клиент DeepSeek, драйвер базы) тоже загружаются до fork
+    import_modules("openai", "psycopg_pool")
+    catalog = CatalogStore()
+    catalog.preload()
+    rule_engine = RuleEngine()
+    retriever = CatalogRetriever()
+    prompt_builder = PromptBuilder(retriever)
+
+    # Индекс и шаблон строятся для текущего снимка сейчас, а не на первом запросе воркера
+    items = catalog.snapshot.items
+    retriever.index_for(items)
+    prompt_builder.template_for(items)
+
+    _state = PreloadedState(
+        catalog, rule_engine, retriever, prompt_builder, time.perf_counter() - started
+    )
+    logger.info(
+        f"📦 Состояние для воркеров подготовлено за {_state.seconds * 1000:.0f} мс: "
+        f"каталог v{catalog.snapshot.version} ({catalog.snapshot.source}), "
+        f"{len(rule_engine.rules.rule_ids)} правил"
+    )
+    return _state
+
+
+def preloaded_state() -> Optional[PreloadedState]:
+    """Подготовленное до fork состояние или None (запуск без preload)"""
+    return _state
@@ -0,0 +1,209 @@
+"""
+Шаблоны промпта DeepSeek с общим префиксом для кэша контекста провайдера
+"""
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from app.core.config import settings
+from app.services.catalog import CatalogItem
+from app.services.catalog_index import CatalogRetriever
+from app.services.fingerprint import LIST_FIELDS
+from app.services.token_accounting import TokenCounter
+
+# "text" идет первым, чтобы при потоковой генерации его можно было
+# показывать пользователю, не дожидаясь списка рекомендаций
+SYSTEM_MESSAGE = """Ты - медицинский ИИ-консультант, специализирующийся на общих рекомендациях по здоровью.
+Анализируй медицинские анкеты и давай общие рекомендации по образу жизни и питанию.
+
+ВАЖНО: Отвечай СТРОГО одним JSON объектом без пояснений и markdown:
+{
+    "text": "Подробный текст с рекомендациями...",
+    "recommendations": {
+        "<ID БАДа из каталога>": {
+            "name": "Название БАДа",
+            "dose": "1 капсула 2 раза в день",
+            "duration": "1 месяц",
+            "priority": "high",
+            "confidence": 0.8,
+            "reason": "Причина рекомендации"
+        }
+    },
+    "confidence": 0.85
+}
+priority - одно из "high", "medium", "low"; confidence - число от 0 до 1.
+
+Никогда не ставь медицинские диагнозы. Всегда указывай, что нужна консультация врача."""
+
+INSTRUCTIONS = """Задача:
+1. Проанализируй данные пользователя
+2. Выбери 3-5 наиболее подходящих БАДов из каталога
+3. Для каждого БАДа укажи дозировку и длительность приема
+4. Напиши подробный текст с рекомендациями (200-400 слов)
+5. Обязательно упомяни необходимость консультации с врачом
+
+Принципы подбора:
+- Учитывай возраст, пол, симптомы и цели
+- Избегай БАДов с противопоказаниями
+- Отдавай приоритет безопасным и базовым БАДам
+- Не рекомендуй БАДы без четких показаний
+"""
+
+USER_TEMPLATE = """Анализируемые данные пользователя:
+- Возраст: {age}
+- Пол: {gender}
+- Вес: {weight} кг
+- Рост: {height} см
+- Хронические заболевания: {chronic_diseases}
+- Текущие лекарства: {current_medications}
+- Симптомы: {symptoms}
+- Цели: {goals}
+"""
+
+
+def format_catalog(items: Sequence[CatalogItem]) -> str:
+    """Блок каталога для промпта"""
+    lines = ["Доступные БАДы:"]
+    for supplement in items:
+        lines.append(
+            f"- ID: {supplement['id']}, Название: {supplement['name']}, "
+            f"Описание: {supplement.get('description', '')}, "
+            f"Теги: {', '.join(supplement.get('tags') or [])}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def _join(values: Any, empty: str) -> str:
+    if isinstance(values, str):
+        return values or empty
+    return ", ".join(str(value) for value in values or []) or empty
+
+
+def format_user_data(form_answers: Dict[str, Any]) -> str:
+    """Данные анкеты - единственная часть промпта, уникальная для запроса"""
+    return USER_TEMPLATE.format(
+        age=form_answers.get("age", "не указан"),
+        gender=form_answers.get("gender", "не указан"),
+        weight=form_answers.get("weight", "не указан"),
+        height=form_answers.get("height", "не указан"),
+        chronic_diseases=_join(form_answers.get("chronic_diseases"), "нет"),
+        current_medications=_join(form_answers.get("current_medications"), "нет"),
+        symptoms=_join(form_answers.get("symptoms"), "нет"),
+        goals=_join(form_answers.get("goals"), "не указаны"),
+    )
+
+
+class Prompt(NamedTuple):
+    """Сообщения для DeepSeek и оценка токенов промпта"""
+    messages: List[Dict[str, str]]
+    estimated_tokens: int
+
+
+class PromptTemplate:
+    """
+    Промпт, скомпилированный для одной версии каталога. Статический
+    префикс (системное сообщение, инструкции и - если каталог помещается
+    в top-K - весь каталог) одинаков для всех запросов, поэтому DeepSeek
+    берет его из кэша контекста; после него идет короткий суффикс анкеты.
+    """
+
+    __slots__ = ("catalog", "static_prefix", "catalog_in_prefix")
+
+    def __init__(self, catalog: Sequence[CatalogItem], top_k: int):
+        self.catalog = catalog
+        self.catalog_in_prefix = len(catalog) <= top_k
+        prefix = INSTRUCTIONS
+        if self.catalog_in_prefix:
+            prefix += "\n" + format_catalog(catalog)
+        self.static_prefix = prefix + "\n"
+
+    def user_content(self, form_answers: Dict[str, Any], selected: Optional[Sequence[CatalogItem]]) -> str:
+        """Сообщение пользователя: статический префикс + суффикс анкеты"""
+        suffix = format_user_data(form_answers)
+        if selected is not None:
+            # Каталог больше top-K: релевантная выборка уникальна для анкеты
+            # и идет после общего префикса
+            suffix += "\n" + format_catalog(selected)
+        return self.static_prefix + suffix
+
+
+class PromptBuilder:
+    """
+    Компилирует шаблон на версию каталога и собирает сообщения для DeepSeek
+    в пределах PROMPT_INPUT_TOKEN_BUDGET: свободный текст анкеты урезается
+    до PROMPT_FREE_TEXT_MAX_TOKENS на значение, а если промпт все равно
+    не помещается - сокращается выборка каталога (не меньше
+    PROMPT_MIN_CATALOG_ITEMS позиций).
+    """
+
+    def __init__(self, retriever: CatalogRetriever, counter: Optional[TokenCounter] = None):
+        self.retriever = retriever
+        self.counter = counter or TokenCounter()
+        self._template: Optional[PromptTemplate] = None
+
+        self.compiled = 0
+        self.built = 0
+        self.trimmed = 0
+        self.build_seconds_total = 0.0
+
+    def template_for(self, catalog: Sequence[CatalogItem]) -> PromptTemplate:
+        """Шаблон для снимка каталога; перекомпилируется только при смене снимка"""
+        if self._template is None or self._template.catalog is not catalog:
+            self._template = PromptTemplate(catalog, self.retriever.top_k)
+            self.compiled += 1
+        return self._template
+
+    def _trim_answers(self, form_answers: Dict[str, Any]) -> Dict[str, Any]:
+        limit = settings.PROMPT_FREE_TEXT_MAX_TOKENS
+        trimmed = dict(form_answers)
+        for field, value in form_answers.items():
+            if isinstance(value, str):
+                trimmed[field] = self.counter.truncate(value, limit)
+            elif field in LIST_FIELDS and isinstance(value, (list, tuple)):
+                trimmed[field] = [
+                    self.counter.truncate(item, limit) if isinstance(item, str) else item
+                    for item in value
+                ]
+        return trimmed
+
+    def _messages(self, user_content: str) -> Prompt:
+        messages = [
+            {"role": "system", "content": SYSTEM_MESSAGE},
+            {"role": "user", "content": user_content},
+        ]
+        return Prompt(messages, self.counter.count_messages(messages))
+
+    def build(self, form_answers: Dict[str, Any], catalog: Sequence[CatalogItem]) -> Prompt:
+        """Сообщения для DeepSeek: системная инструкция + префикс + данные анкеты"""
+        started = time.perf_counter()
+        budget = settings.PROMPT_INPUT_TOKEN_BUDGET
+        template = self.template_for(catalog)
+        answers = self._trim_answers(form_answers)
+
+        k = self.retriever.top_k
+        selected = None if template.catalog_in_prefix else self.retriever.select(answers, catalog, k)
+        prompt = self._messages(template.user_content(answers, selected))
+
+        if prompt.estimated_tokens > budget:
+            self.trimmed += 1
+            # Каталог в префиксе не помещается - переходим на выборку без
+            # общего префикса каталога и сокращаем ее вдвое до минимума
+            template = PromptTemplate(catalog, top_k=0)
+            while prompt.estimated_tokens > budget and k > settings.PROMPT_MIN_CATALOG_ITEMS:
+                k = max(settings.PROMPT_MIN_CATALOG_ITEMS, k // 2)
+                selected = self.retriever.select(answers, catalog, k)
+                prompt = self._messages(template.user_content(answers, selected))
+
+        self.built += 1
+        self.build_seconds_total += time.perf_counter() - started
+        return prompt
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики сборки промпта"""
+        return {
+            "templates_compiled": self.compiled,
+            "prompts_built": self.built,
+            "prompts_trimmed": self.trimmed,
+            "avg_build_us": (
+                round(self.build_seconds_total / self.built * 1e6, 1) if self.built else 0.0
+            ),
+        }
@@ -0,0 +1,192 @@
+"""
+Клиентский ограничитель исходящих запросов к DeepSeek
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, Optional
+
+from loguru import logger
+
+from app.core import metrics
+from app.core.config import settings
+
+
+class LimiterTimeoutError(Exception):
+    """Не удалось дождаться разрешения на запрос к провайдеру"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After в секундах (число секунд или HTTP-дата)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Token bucket с пополнением rate_per_minute единиц в минуту"""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.refill_per_second = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Сколько ждать, пока в бакете наберется amount"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount: float) -> None:
+        """Списывает amount (может уйти в минус при доплате по факту)"""
+        self._refill()
+        self.tokens -= amount
+
+
+class AdaptiveLimiter:
+    """
+    Token bucket по квоте провайдера (запросы и токены в минуту) плюс
+    AIMD-окно параллельных запросов: окно уменьшается вдвое при 429 или
+    таймауте и растет на 1 за каждое окно успешных ответов.
+    Retry-After приостанавливает выдачу разрешений для всех запросов.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        initial_window: Optional[int] = None,
+        min_window: Optional[int] = None,
+        max_window: Optional[int] = None,
+    ):
+        self._requests = TokenBucket(requests_per_minute or settings.DEEPSEEK_RATE_LIMIT_RPM)
+        self._tokens = TokenBucket(tokens_per_minute or settings.DEEPSEEK_RATE_LIMIT_TPM)
+        self.min_window = float(min_window or settings.DEEPSEEK_CONCURRENCY_MIN)
+        self.max_window = float(max_window or settings.DEEPSEEK_CONCURRENCY_MAX)
+        self.window = float(initial_window or settings.DEEPSEEK_CONCURRENCY_INITIAL)
+
+        self.in_flight = 0
+        self._paused_until = 0.0
+        self._condition = asyncio.Condition()
+
+        self.granted = 0
+        self.successes = 0
+        self.overloads = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        metrics.DEEPSEEK_LIMITER_WINDOW.set(self.window)
+
+    @asynccontextmanager
+    async def slot(
+        self, estimated_tokens: int, timeout: Optional[float] = None
+    ) -> AsyncIterator["AdaptiveLimiter"]:
+        """
+        Разрешение на один запрос к провайдеру. Исход запроса сообщается
+        через on_success/on_overload до выхода из контекста.
+        """
+        await self.acquire(estimated_tokens, timeout)
+        try:
+            yield self
+        finally:
+            await self._release()
+
+    async def acquire(self, estimated_tokens: int, timeout: Optional[float] = None) -> None:
+        """
+        Ждет свободное место в окне и квоту в бакетах не дольше timeout
+        (DEEPSEEK_ACQUIRE_TIMEOUT по умолчанию, остаток дедлайна запроса).
+        Свободное место выдается и при нулевом timeout.
+        """
+        started = time.monotonic()
+        if timeout is None:
+            timeout = settings.DEEPSEEK_ACQUIRE_TIMEOUT
+        deadline = started + timeout
+
+        async with self._condition:
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    self._paused_until - now,
+                    self._requests.wait_time(1),
+                    self._tokens.wait_time(estimated_tokens),
+                )
+                if self.in_flight < int(self.window) and wait <= 0:
+                    break
+                if now >= deadline:
+                    self.timeouts += 1
+                    metrics.DEEPSEEK_LIMITER_ACQUIRE_TIMEOUTS_TOTAL.inc()
+                    raise LimiterTimeoutError("Превышено время ожидания квоты DeepSeek")
+
+                timeout = min(deadline - now, wait) if wait > 0 else deadline - now
+                try:
+                    await asyncio.wait_for(self._condition.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+            self._requests.consume(1)
+            self._tokens.consume(estimated_tokens)
+            self.in_flight += 1
+            metrics.DEEPSEEK_LIMITER_IN_FLIGHT.inc()
+            self.granted += 1
+            self.wait_seconds_total += time.monotonic() - started
+
+    async def _release(self) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            metrics.DEEPSEEK_LIMITER_IN_FLIGHT.dec()
+            self._condition.notify_all()
+
+    def on_success(self, estimated_tokens: int = 0, actual_tokens: Optional[int] = None) -> None:
+        """Успешный ответ: аддитивное увеличение окна и доплата по фактическим токенам"""
+        self.successes += 1
+        self.window = min(self.max_window, self.window + 1.0 / self.window)
+        metrics.DEEPSEEK_LIMITER_WINDOW.set(self.window)
+        if actual_tokens is not None:
+            self._tokens.consume(actual_tokens - estimated_tokens)
+
+    def on_overload(self, retry_after: Optional[float] = None) -> None:
+        """429 или таймаут: мультипликативное уменьшение окна и пауза по Retry-After"""
+        self.overloads += 1
+        metrics.DEEPSEEK_LIMITER_OVERLOADS_TOTAL.inc()
+        self.window = max(self.min_window, self.window / 2)
+        metrics.DEEPSEEK_LIMITER_WINDOW.set(self.window)
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            # Монотонные часы не сравнимы между процессами - в метрику пишется unix-время
+            metrics.DEEPSEEK_LIMITER_PAUSED_UNTIL.set(
+                time.time() + self._paused_until - time.monotonic()
+            )
+        logger.warning(
+            f"⚠️ DeepSeek перегружен: окно параллельности {self.window:.1f}"
+            + (f", пауза {retry_after:.1f}с" if retry_after else "")
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние ограничителя"""
+        return {
+            "window": round(self.window, 2),
+            "in_flight": self.in_flight,
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 3),
+            "request_tokens_available": round(self._requests.tokens, 1),
+            "llm_tokens_available": round(self._tokens.tokens, 1),
+            "granted": self.granted,
+            "successes": self.successes,
+            "overloads": self.overloads,
+            "acquire_timeouts": self.timeouts,
+            "wait_seconds_total": round(self.wait_seconds_total, 3),
+        }
@@ -0,0 +1,207 @@
+"""
+Разбор ответа DeepSeek: устойчивое извлечение JSON и валидация в схему
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+from pydantic import TypeAdapter, ValidationError
+
+from app.schemas.response import SupplementRecommendation
+
+# Синонимы полей рекомендации, которые модель использует вместо полей схемы
+FIELD_ALIASES = {
+    "dosage": "dose",
+    "dosing": "dose",
+    "course": "duration",
+    "course_duration": "duration",
+    "title": "name",
+    "rationale": "reason",
+}
+PRIORITIES = ("high", "medium", "low")
+DEFAULT_DURATION = "По согласованию с врачом"
+DEFAULT_TEXT = "Рекомендации недоступны"
+DEFAULT_CONFIDENCE = 0.7
+# Оборванный ответ режется только между рекомендациями (уровень вложенности
+# не глубже recommendations), чтобы недогенерированная рекомендация
+# отбрасывалась целиком, а не достраивалась
+_TRUNCATION_MAX_DEPTH = 2
+
+# Схема один раз компилируется в валидатор pydantic-core
+_RECOMMENDATIONS = TypeAdapter(Dict[str, SupplementRecommendation])
+_DECODER = json.JSONDecoder()
+
+
+class ResponseParseError(ValueError):
+    """В ответе модели нет пригодного результата"""
+
+
+def _strip_fences(text: str) -> str:
+    """Убирает обертку ```json ... ``` вокруг ответа"""
+    text = text.strip()
+    if text.startswith("```"):
+        newline = text.find("\n")
+        text = text[newline + 1:] if newline >= 0 else text[3:]
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text
+
+
+def _close_truncated(fragment: str) -> Optional[str]:
+    """
+    Достраивает оборванный JSON (ответ, обрезанный по max_tokens): отрезает
+    все после последней завершенной рекомендации или поля верхнего уровня
+    и закрывает открытые скобки.
+    """
+    stack: List[str] = []
+    in_string = False
+    escape = False
+    # Позиция, на которой документ можно обрезать, и стек скобок на ней
+    cut: Optional[Tuple[int, List[str]]] = None
+    for i, char in enumerate(fragment):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if not stack:
+                return None
+            stack.pop()
+            if not stack:
+                return fragment[:i + 1]
+            if len(stack) <= _TRUNCATION_MAX_DEPTH:
+                cut = (i + 1, list(stack))
+        elif char == "," and len(stack) <= _TRUNCATION_MAX_DEPTH:
+            cut = (i, list(stack))
+    if cut is None:
+        return None
+    end, open_brackets = cut
+    return fragment[:end] + "".join(reversed(open_brackets))
+
+
+def extract_json_object(text: str) -> Tuple[Dict[str, Any], str]:
+    """
+    Внешний JSON объект ответа и способ, которым он получен: "clean" -
+    ответ целиком JSON, "extracted" - объект найден внутри ограждения или
+    текста, "truncated" - оборванный ответ достроен.
+    """
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return data, "clean"
+    except json.JSONDecodeError:
+        pass
+
+    body = _strip_fences(text)
+    start = body.find("{")
+    if start < 0:
+        raise ResponseParseError("в ответе нет JSON объекта")
+    try:
+        # raw_decode разбирает объект за один проход и игнорирует текст после него
+        data, _ = _DECODER.raw_decode(body, start)
+        return data, "extracted"
+    except json.JSONDecodeError as e:
+        repaired = _close_truncated(body[start:])
+        if repaired is None:
+            raise ResponseParseError(f"не удалось разобрать JSON: {e}") from e
+        try:
+            return json.loads(repaired), "truncated"
+        except json.JSONDecodeError as repair_error:
+            raise ResponseParseError(f"не удалось разобрать JSON: {e}") from repair_error
+
+
+def _confidence(value: Any) -> float:
+    """Уверенность в [0, 1]; проценты (85) переводятся в доли"""
+    try:
+        confidence = float(value)
+    except (TypeError, ValueError):
+        return DEFAULT_CONFIDENCE
+    if 1 < confidence <= 100:
+        confidence /= 100
+    return min(1.0, max(0.0, confidence))
+
+
+def _normalize_item(item: Any) -> Any:
+    """Приводит рекомендацию к полям схемы; невосстановимые значения оставляет валидатору"""
+    if not isinstance(item, dict):
+        return item
+    normalized = {FIELD_ALIASES.get(key, key): value for key, value in item.items()}
+    priority = str(normalized.get("priority", "medium")).strip().lower()
+    normalized["priority"] = priority if priority in PRIORITIES else "medium"
+    if not normalized.get("duration"):
+        normalized["duration"] = DEFAULT_DURATION
+    normalized["confidence"] = _confidence(normalized.get("confidence", DEFAULT_CONFIDENCE))
+    return normalized
+
+
+class ResponseParser:
+    """
+    Превращает текст ответа DeepSeek в результат анализа. Рекомендации
+    проверяются одним вызовом скомпилированного TypeAdapter; если часть
+    из них невалидна, отбрасываются только они, остальные сохраняются.
+    """
+
+    def __init__(self):
+        self.parsed = {"clean": 0, "extracted": 0, "truncated": 0}
+        self.failed = 0
+        self.items_dropped = 0
+
+    def parse(self, content: Optional[str]) -> Dict[str, Any]:
+        """Результат анализа из ответа модели; ResponseParseError - если брать нечего"""
+        try:
+            data, method = extract_json_object(content or "")
+        except ResponseParseError:
+            self.failed += 1
+            raise
+
+        supplements = self._recommendations(data.get("recommendations"))
+        text = data.get("text")
+        if not isinstance(text, str) or not text.strip():
+            text = None
+        if text is None and not supplements:
+            self.failed += 1
+            raise ResponseParseError("в ответе нет ни текста, ни валидных рекомендаций")
+
+        self.parsed[method] += 1
+        if method != "clean":
+            logger.debug("🧩 Ответ DeepSeek восстановлен ({})", method)
+        return {
+            "supplements": supplements,
+            "text": text or DEFAULT_TEXT,
+            "confidence": _confidence(data.get("confidence", DEFAULT_CONFIDENCE)),
+            "source": "ai",
+        }
+
+    def _recommendations(self, raw: Any) -> Dict[str, SupplementRecommendation]:
+        if isinstance(raw, list):
+            raw = {
+                str(item.get("id") or f"rec_{i + 1}") if isinstance(item, dict) else f"rec_{i + 1}": item
+                for i, item in enumerate(raw)
+            }
+        if not isinstance(raw, dict) or not raw:
+            return {}
+        items = {str(key): _normalize_item(value) for key, value in raw.items()}
+        try:
+            return _RECOMMENDATIONS.validate_python(items)
+        except ValidationError as e:
+            invalid = {error["loc"][0] for error in e.errors() if error["loc"]}
+        self.items_dropped += len(invalid)
+        valid = {key: value for key, value in items.items() if key not in invalid}
+        logger.warning(f"⚠️ Отброшено невалидных рекомендаций DeepSeek: {len(invalid)}")
+        return _RECOMMENDATIONS.validate_python(valid) if valid else {}
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики разбора ответов"""
+        return {
+            **self.parsed,
+            "failed": self.failed,
+            "items_dropped": self.items_dropped,
+        }
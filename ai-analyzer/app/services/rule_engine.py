@@ -0,0 +1,280 @@
+"""
+Скомпилированный rule-based подбор БАДов (резервный путь без DeepSeek)
+"""
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.core.config import settings
+from app.schemas.response import SupplementRecommendation
+from app.services.fingerprint import normalize_text
+
+# Поля анкеты, по которым правило задает условие "любой из терминов"
+TERM_FIELDS = ("symptoms", "goals", "chronic_diseases", "current_medications", "gender")
+MAX_CONFIDENCE = 0.95
+
+DEFAULT_RULES_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rules", "supplement_rules.json"
+)
+
+
+class RuleSetError(ValueError):
+    """Файл правил не прошел проверку"""
+
+
+class CompiledRuleSet:
+    """
+    Правила, скомпилированные в матрицы:
+
+    - conditions: термины x поля x правила, 1 если термин входит в условие
+      правила по этому полю; поле без условия помечено в has_condition
+    - age_min / age_max: границы возраста по правилам (nan - без границы)
+    - weights: правила x БАДы, вклад сработавшего правила в оценку БАДа
+
+    Оценка пакета анкет - несколько матричных умножений без циклов по правилам.
+    """
+
+    def __init__(self, data: Dict[str, Any], mtime: float = 0.0):
+        self.version = data.get("version", 0)
+        self.mtime = mtime
+        self.threshold = float(data.get("threshold", 0.6))
+        self.max_recommendations = int(data.get("max_recommendations", 5))
+
+        supplements = data.get("supplements") or {}
+        rules = data.get("rules") or []
+        if not supplements or not rules:
+            raise RuleSetError("В файле правил нет supplements или rules")
+
+        self.supplement_ids: Tuple[str, ...] = tuple(supplements)
+        self.supplements: Dict[str, Dict[str, Any]] = supplements
+        supplement_index = {sid: i for i, sid in enumerate(self.supplement_ids)}
+        self.requires_catalog = np.array(
+            [bool(supplements[sid].get("requires_catalog", True)) for sid in self.supplement_ids]
+        )
+
+        self.vocabulary: Dict[Tuple[str, str], int] = {}
+        entries: List[Tuple[int, int, int]] = []
+        self.rule_ids: List[str] = []
+        self.age_min = np.full(len(rules), np.nan)
+        self.age_max = np.full(len(rules), np.nan)
+        self.has_condition = np.zeros((len(TERM_FIELDS), len(rules)), dtype=bool)
+        self.weights = np.zeros((len(rules), len(self.supplement_ids)), dtype=np.float32)
+
+        for r, rule in enumerate(rules):
+            rule_id = rule.get("id") or f"rule_{r}"
+            supplement = rule.get("supplement")
+            if supplement not in supplement_index:
+                raise RuleSetError(f"Правило {rule_id}: неизвестный БАД {supplement!r}")
+            weight = float(rule.get("weight", 0))
+            self.rule_ids.append(rule_id)
+            self.weights[r, supplement_index[supplement]] = weight
+
+            when = rule.get("when") or {}
+            unknown = set(when) - set(TERM_FIELDS) - {"age_min", "age_max"}
+            if unknown:
+                raise RuleSetError(f"Правило {rule_id}: неизвестные условия {sorted(unknown)}")
+            if "age_min" in when:
+                self.age_min[r] = float(when["age_min"])
+            if "age_max" in when:
+                self.age_max[r] = float(when["age_max"])
+
+            for k, field in enumerate(TERM_FIELDS):
+                terms = when.get(field)
+                if not terms:
+                    continue
+                if isinstance(terms, str):
+                    terms = [terms]
+                self.has_condition[k, r] = True
+                for term in terms:
+                    term = normalize_text(term)
+                    column = self.vocabulary.setdefault((field, term), len(self.vocabulary))
+                    entries.append((column, k, r))
+
+        self.conditions = np.zeros(
+            (len(self.vocabulary), len(TERM_FIELDS), len(rules)), dtype=np.float32
+        )
+        for column, k, r in entries:
+            self.conditions[column, k, r] = 1.0
+
+        self._availability: Tuple[Optional[Sequence], Optional[np.ndarray]] = (None, None)
+
+    def encode(self, profiles: Sequence[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Анкеты -> бинарная матрица терминов и вектор возрастов (nan - не указан)"""
+        features = np.zeros((len(profiles), len(self.vocabulary)), dtype=np.float32)
+        ages = np.full(len(profiles), np.nan)
+        for p, profile in enumerate(profiles):
+            for field in TERM_FIELDS:
+                values = profile.get(field)
+                if not values:
+                    continue
+                if isinstance(values, str):
+                    values = [values]
+                for value in values:
+                    column = self.vocabulary.get((field, normalize_text(value)))
+                    if column is not None:
+                        features[p, column] = 1.0
+            try:
+                ages[p] = float(profile.get("age"))
+            except (TypeError, ValueError):
+                pass
+        return features, ages
+
+    def fired(self, features: np.ndarray, ages: np.ndarray) -> np.ndarray:
+        """Матрица анкеты x правила: какие правила сработали"""
+        hits = np.einsum("pv,vkr->pkr", features, self.conditions) > 0
+        terms_ok = (hits | ~self.has_condition).all(axis=1)
+
+        column = ages[:, None]
+        with np.errstate(invalid="ignore"):
+            min_ok = np.isnan(self.age_min) | (column >= self.age_min)
+            max_ok = np.isnan(self.age_max) | (column <= self.age_max)
+        return terms_ok & min_ok & max_ok
+
+    def available(self, catalog: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """
+        Маска БАДов, которые можно рекомендовать при данном каталоге.
+        Совпадение по id или по вхождению названия; результат запоминается
+        для последнего каталога (снимок каталога - неизменяемый кортеж,
+        поэтому достаточно сравнить объект).
+        """
+        cached_catalog, cached = self._availability
+        if cached_catalog is catalog and cached is not None:
+            return cached
+        pairs = tuple((item.get("id"), item.get("name")) for item in catalog)
+
+        ids = {str(item_id) for item_id, _ in pairs if item_id is not None}
+        names = [normalize_text(name) for _, name in pairs if name]
+        in_catalog = np.array([
+            sid in ids
+            or any(
+                name and (name in normalize_text(self.supplements[sid]["name"])
+                          or normalize_text(self.supplements[sid]["name"]) in name)
+                for name in names
+            )
+            for sid in self.supplement_ids
+        ])
+        mask = ~self.requires_catalog | in_catalog
+        # Список может измениться на месте - запоминаем только кортежи
+        self._availability = (catalog if isinstance(catalog, tuple) else None, mask)
+        return mask
+
+    def score(
+        self, profiles: Sequence[Dict[str, Any]], catalog: Sequence[Dict[str, Any]]
+    ) -> np.ndarray:
+        """Оценки анкеты x БАДы; недоступные в каталоге БАДы получают -inf"""
+        features, ages = self.encode(profiles)
+        scores = self.fired(features, ages).astype(np.float32) @ self.weights
+        scores[:, ~self.available(catalog)] = -np.inf
+        return scores
+
+    def recommendations(self, scores: np.ndarray) -> Dict[str, SupplementRecommendation]:
+        """Строка оценок -> рекомендации выше порога, по убыванию оценки"""
+        order = np.argsort(-scores, kind="stable")[:self.max_recommendations]
+        result: Dict[str, SupplementRecommendation] = {}
+        for s in order:
+            value = float(scores[s])
+            if not math.isfinite(value) or value < self.threshold:
+                break
+            sid = self.supplement_ids[s]
+            meta = self.supplements[sid]
+            result[sid] = SupplementRecommendation(
+                name=meta["name"],
+                dose=meta.get("dose", "По инструкции"),
+                duration=meta.get("duration", "1-2 месяца"),
+                priority=meta.get("priority", "medium"),
+                confidence=round(min(value, MAX_CONFIDENCE), 2),
+            )
+        return result
+
+
+class RuleEngine:
+    """
+    Загружает правила из JSON файла и перекомпилирует их при изменении
+    файла (проверка mtime не чаще RULES_RELOAD_INTERVAL секунд).
+    Если новый файл содержит ошибку, продолжают работать прежние правила.
+    """
+
+    def __init__(self, path: Optional[str] = None, reload_interval: Optional[float] = None):
+        self.path = path or settings.RULES_PATH or DEFAULT_RULES_PATH
+        self.reload_interval = (
+            settings.RULES_RELOAD_INTERVAL if reload_interval is None else reload_interval
+        )
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._failed_mtime: Optional[float] = None
+        self.reloads = 0
+        self.reload_errors = 0
+        self.evaluations = 0
+        self.rules = self._compile()
+
+    def _compile(self) -> CompiledRuleSet:
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        rules = CompiledRuleSet(data, mtime)
+        logger.info(
+            f"📐 Правила rule-based анализа v{rules.version}: {len(rules.rule_ids)} правил, "
+            f"{len(rules.supplement_ids)} БАДов, {len(rules.vocabulary)} терминов"
+        )
+        return rules
+
+    def _maybe_reload(self) -> CompiledRuleSet:
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return self.rules
+        with self._lock:
+            if now - self._checked_at < self.reload_interval:
+                return self.rules
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError as e:
+                logger.error(f"❌ Файл правил {self.path} недоступен: {e}")
+                return self.rules
+            if mtime in (self.rules.mtime, self._failed_mtime):
+                return self.rules
+            try:
+                self.rules = self._compile()
+                self.reloads += 1
+            except (OSError, ValueError) as e:
+                # Ошибочный файл не перечитываем, пока его не изменят снова
+                self._failed_mtime = mtime
+                self.reload_errors += 1
+                logger.error(f"❌ Не удалось перезагрузить правила {self.path}: {e}")
+        return self.rules
+
+    def evaluate(
+        self, profile: Dict[str, Any], catalog: Sequence[Dict[str, Any]]
+    ) -> Dict[str, SupplementRecommendation]:
+        """Рекомендации для одной анкеты"""
+        return self.evaluate_batch([profile], catalog)[0]
+
+    def evaluate_batch(
+        self, profiles: Sequence[Dict[str, Any]], catalog: Sequence[Dict[str, Any]]
+    ) -> List[Dict[str, SupplementRecommendation]]:
+        """Рекомендации для пакета анкет за один векторизованный проход"""
+        rules = self._maybe_reload()
+        if not profiles:
+            return []
+        self.evaluations += len(profiles)
+        scores = rules.score(profiles, catalog)
+        return [rules.recommendations(row) for row in scores]
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние движка правил"""
+        rules = self.rules
+        return {
+            "version": rules.version,
+            "rules": len(rules.rule_ids),
+            "supplements": len(rules.supplement_ids),
+            "terms": len(rules.vocabulary),
+            "evaluations": self.evaluations,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+        }
@@ -0,0 +1,84 @@
+"""
+Объединение одинаковых одновременных запросов (single-flight)
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class FlightAbandonedError(Exception):
+    """Лидер ключа завершился без результата (клиент потокового анализа отключился)"""
+
+
+class SingleFlight:
+    """
+    Пока для ключа выполняется вызов, повторные вызовы с тем же ключом
+    не запускают работу заново, а ждут результат первого.
+
+    Работа выполняется в отдельной задаче, поэтому отмена одного из
+    ожидающих запросов (например, клиент закрыл соединение) не отменяет
+    вызов для остальных.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, "asyncio.Future[Any]"] = {}
+        self.leaders = 0
+        self.suppressed = 0
+        self.remote_suppressed = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Выполняет fn один раз на ключ среди одновременных вызовов"""
+        while True:
+            task = self._calls.get(key)
+            if task is None:
+                self.leaders += 1
+                task = asyncio.ensure_future(fn())
+                self._register(key, task)
+            else:
+                self.suppressed += 1
+
+            try:
+                return await asyncio.shield(task)
+            except FlightAbandonedError:
+                # Лидер из lead прервался - вызов выполняет один из ожидающих
+                if self._calls.get(key) is task:
+                    del self._calls[key]
+
+    def lead(self, key: str) -> "Optional[asyncio.Future[Any]]":
+        """
+        Делает вызывающего лидером ключа без отдельной задачи - для работы,
+        которая выполняется в генераторе (потоковый анализ). Лидер сам
+        завершает future результатом или FlightAbandonedError. None - ключ
+        уже выполняется, результат ждать через do.
+        """
+        if key in self._calls:
+            return None
+        self.leaders += 1
+        future = asyncio.get_running_loop().create_future()
+        self._register(key, future)
+        return future
+
+    def _register(self, key: str, task: "asyncio.Future[Any]") -> None:
+        self._calls[key] = task
+        task.add_done_callback(lambda t, key=key: self._forget(key, t))
+
+    def record_remote_hit(self) -> None:
+        """Результат получен от другого воркера, который держал блокировку"""
+        self.remote_suppressed += 1
+
+    def _forget(self, key: str, task: "asyncio.Future[Any]") -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Помечаем исключение как полученное, даже если ожидающих не осталось
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики подавленных дублей"""
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "suppressed": self.suppressed,
+            "remote_suppressed": self.remote_suppressed,
+        }
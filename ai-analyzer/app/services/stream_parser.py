@@ -0,0 +1,115 @@
+"""
+Инкрементальное извлечение строкового поля из потокового JSON ответа
+"""
+import json
+from typing import List
+
+
+def _complete_prefix_length(data: str) -> int:
+    """
+    Длина префикса без незавершенной escape-последовательности в конце
+    ("\\", "\\u12") и без старшей половины суррогатной пары, ждущей младшую.
+    """
+    i = 0
+    length = len(data)
+    high_surrogate_at = -1
+    while i < length:
+        if data[i] != "\\":
+            i += 1
+            high_surrogate_at = -1
+            continue
+        size = 6 if data[i + 1:i + 2] == "u" else 2
+        if i + size > length:
+            return high_surrogate_at if high_surrogate_at >= 0 else i
+        if size == 6 and data[i + 2:i + 4].lower() in ("d8", "d9", "da", "db"):
+            high_surrogate_at = i
+        else:
+            high_surrogate_at = -1
+        i += size
+    return high_surrogate_at if high_surrogate_at >= 0 else length
+
+
+class JsonStringFieldStreamer:
+    """
+    Получает куски JSON по мере генерации и возвращает декодированные
+    фрагменты значения строкового поля верхнего уровня (например "text"),
+    не дожидаясь конца документа.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._string_is_key = False
+        self._key_chars: List[str] = []
+        self._last_key = ""
+        self._awaiting_value = False
+        self._capturing = False
+        self._pending = ""
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        """Обрабатывает кусок ответа, возвращает новый текст поля ('' если нет)"""
+        if self.done:
+            return ""
+
+        raw: List[str] = []
+        for char in chunk:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._capturing:
+                        self._capturing = False
+                        self.done = True
+                        break
+                    if self._string_is_key:
+                        self._last_key = "".join(self._key_chars)
+                    continue
+
+                if self._capturing:
+                    raw.append(char)
+                elif self._string_is_key:
+                    self._key_chars.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_is_key = self._expect_key and self._depth == 1
+                self._key_chars = []
+                if self._awaiting_value and self._depth == 1:
+                    self._capturing = True
+                self._awaiting_value = False
+                self._expect_key = False
+            elif char in "{[":
+                self._depth += 1
+                self._expect_key = char == "{"
+                self._awaiting_value = False
+            elif char in "}]":
+                self._depth -= 1
+            elif char == ",":
+                self._expect_key = self._depth == 1
+            elif char == ":":
+                self._awaiting_value = self._depth == 1 and self._last_key == self.field
+                self._last_key = ""
+            elif not char.isspace():
+                self._awaiting_value = False
+
+        return self._decode("".join(raw))
+
+    def _decode(self, raw: str) -> str:
+        data = self._pending + raw
+        self._pending = ""
+        if not data:
+            return ""
+
+        if not self.done:
+            cut = _complete_prefix_length(data)
+            self._pending = data[cut:]
+            data = data[:cut]
+        return json.loads(f'"{data}"') if data else ""
@@ -0,0 +1,178 @@
+"""
+Учет токенов DeepSeek: оценка до вызова, бюджет промпта и фактический расход
+"""
+import math
+import re
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.schemas.response import TokenUsage
+from app.services.latency import LatencyTracker
+
+# Претокенизация как у BPE-токенизаторов: слова, числа и отдельные знаки
+_PIECE_RE = re.compile(r"[^\W\d_]+|\d+|[^\w\s]")
+# Накладные токены на сообщение чата (роль и служебная разметка)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class TokenCounter:
+    """
+    Локальная оценка числа токенов без словаря модели: латиница ~4
+    символа на токен, кириллица ~3, число - по токену на 3 цифры, знак
+    препинания - токен. Оценка калибруется по фактическому prompt_tokens
+    из ответов DeepSeek (скользящее среднее отношения факт/оценка).
+    """
+
+    def __init__(self, smoothing: float = 0.1):
+        self.smoothing = smoothing
+        self.ratio = 1.0
+
+    @staticmethod
+    def raw_count(text: str) -> int:
+        """Оценка без калибровки"""
+        tokens = 0
+        for piece in _PIECE_RE.findall(text):
+            if piece.isdigit():
+                tokens += math.ceil(len(piece) / 3)
+            elif piece.isascii():
+                tokens += math.ceil(len(piece) / 4) if piece.isalpha() else 1
+            else:
+                tokens += math.ceil(len(piece) / 3) if piece.isalpha() else 1
+        return tokens
+
+    def count(self, text: str) -> int:
+        """Калиброванная оценка токенов текста"""
+        return math.ceil(self.raw_count(text) * self.ratio)
+
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        """Оценка токенов промпта из сообщений чата"""
+        return sum(self.count(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+    def calibrate(self, estimated: int, actual: int) -> None:
+        """Подстраивает коэффициент по фактическому числу токенов промпта"""
+        if estimated <= 0 or actual <= 0:
+            return
+        observed = actual / (estimated / self.ratio)
+        ratio = (1 - self.smoothing) * self.ratio + self.smoothing * observed
+        self.ratio = min(3.0, max(0.33, ratio))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Обрезает текст по границе слова, чтобы он уложился в max_tokens"""
+        if self.count(text) <= max_tokens:
+            return text
+        budget = max_tokens / self.ratio
+        used = 0.0
+        end = 0
+        for match in _PIECE_RE.finditer(text):
+            used += self.raw_count(match.group())
+            if used > budget:
+                break
+            end = match.end()
+        return text[:end].rstrip() + "…"
+
+
+class TokenAccountant:
+    """
+    Фактический расход токенов по ответам DeepSeek: суммарные счетчики,
+    пропускная способность (токенов в секунду) и стоимость анализа по
+    ценам из настроек. По распределению completion_tokens подбирает
+    max_tokens под ожидаемый размер ответа.
+    """
+
+    def __init__(self, counter: Optional[TokenCounter] = None):
+        self.counter = counter or TokenCounter()
+        self._completion = LatencyTracker(min_samples=settings.DEEPSEEK_MAX_TOKENS_MIN_SAMPLES)
+
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hit_tokens = 0
+        self.cache_miss_tokens = 0
+        self.provider_seconds = 0.0
+        self.cost_total = 0.0
+        self.truncated = 0
+
+    def max_tokens(self) -> int:
+        """
+        max_tokens для следующего вызова: перцентиль фактических ответов с
+        запасом, но не меньше DEEPSEEK_MIN_OUTPUT_TOKENS и не больше
+        DEEPSEEK_MAX_TOKENS. До накопления статистики - DEEPSEEK_MAX_TOKENS.
+        """
+        expected = self._completion.percentile(settings.DEEPSEEK_OUTPUT_PERCENTILE)
+        if expected is None:
+            return settings.DEEPSEEK_MAX_TOKENS
+        adaptive = int(expected * settings.DEEPSEEK_OUTPUT_HEADROOM)
+        return max(settings.DEEPSEEK_MIN_OUTPUT_TOKENS, min(settings.DEEPSEEK_MAX_TOKENS, adaptive))
+
+    def estimate_request(self, messages: List[Dict[str, str]], max_tokens: int) -> int:
+        """Оценка токенов запроса для квоты TPM (промпт + максимум ответа)"""
+        return self.counter.count_messages(messages) + max_tokens
+
+    def record(
+        self,
+        usage: Any,
+        estimated_prompt_tokens: int = 0,
+        elapsed: float = 0.0,
+        finish_reason: Optional[str] = None,
+    ) -> Optional[TokenUsage]:
+        """Учитывает usage ответа (prompt_cache_* - расширение DeepSeek)"""
+        if finish_reason == "length":
+            self.truncated += 1
+        if usage is None:
+            return None
+        token_usage = TokenUsage(
+            prompt_tokens=usage.prompt_tokens or 0,
+            completion_tokens=usage.completion_tokens or 0,
+            total_tokens=usage.total_tokens or 0,
+            prompt_cache_hit_tokens=getattr(usage, "prompt_cache_hit_tokens", None) or 0,
+            prompt_cache_miss_tokens=getattr(usage, "prompt_cache_miss_tokens", None) or 0,
+        )
+        token_usage.cost = self.cost(token_usage)
+
+        self.requests += 1
+        self.prompt_tokens += token_usage.prompt_tokens
+        self.completion_tokens += token_usage.completion_tokens
+        self.cache_hit_tokens += token_usage.prompt_cache_hit_tokens
+        self.cache_miss_tokens += token_usage.prompt_cache_miss_tokens
+        self.provider_seconds += elapsed
+        self.cost_total += token_usage.cost
+        self._completion.observe(token_usage.completion_tokens)
+        self.counter.calibrate(estimated_prompt_tokens, token_usage.prompt_tokens)
+        return token_usage
+
+    @staticmethod
+    def cost(usage: TokenUsage) -> float:
+        """Стоимость вызова в USD по ценам за 1M токенов"""
+        hit = usage.prompt_cache_hit_tokens
+        # Если провайдер не разделил промпт на hit/miss - весь промпт по цене miss
+        miss = usage.prompt_cache_miss_tokens or max(0, usage.prompt_tokens - hit)
+        return (
+            hit * settings.DEEPSEEK_PRICE_INPUT_CACHE_HIT
+            + miss * settings.DEEPSEEK_PRICE_INPUT_CACHE_MISS
+            + usage.completion_tokens * settings.DEEPSEEK_PRICE_OUTPUT
+        ) / 1_000_000
+
+    def stats(self) -> Dict[str, Any]:
+        """Агрегаты расхода токенов"""
+        requests = self.requests or 1
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cache_hit_tokens": self.cache_hit_tokens,
+            "cache_miss_tokens": self.cache_miss_tokens,
+            "cache_hit_ratio": (
+                round(self.cache_hit_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0
+            ),
+            "completion_tokens_per_second": (
+                round(self.completion_tokens / self.provider_seconds, 1)
+                if self.provider_seconds else 0.0
+            ),
+            "avg_prompt_tokens": round(self.prompt_tokens / requests, 1),
+            "avg_completion_tokens": round(self.completion_tokens / requests, 1),
+            "cost_total_usd": round(self.cost_total, 6),
+            "avg_cost_usd": round(self.cost_total / requests, 6),
+            "max_tokens": self.max_tokens(),
+            "truncated": self.truncated,
+            "estimate_ratio": round(self.counter.ratio, 3),
+        }
@@ -0,0 +1,150 @@
+"""
+Холодный старт анализатора: время импорта и время до первого ответа.
+
+1. Импорт `main` в свежем интерпретаторе (-X importtime): общее время
+   и самые тяжелые пакеты верхнего уровня (медиана по --runs запускам).
+2. Запуск сервера (по умолчанию `uvicorn main:app`) и опрос
+   /health/ready: first_response_ms - первый HTTP ответ (порт открыт,
+   приложение отвечает), ready_ms - первый ответ 200 (инициализация
+   завершена). На сервере без /health/ready готовностью считается
+   первый 200 от /health.
+
+Запуск из каталога ai-analyzer:
+    python -m benchmarks.cold_start --runs 5 --output benchmarks/results/cold_start.json
+Медленная база (соединение не устанавливается) моделируется так:
+    python -m benchmarks.cold_start --env DATABASE_URL=postgresql://u:p@10.255.255.1:5432/db
+/health/ready не ждет базу: готовность наступает по завершении фонового
+старта, а недоступность базы видна в поле database_connected.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.load_test import git_commit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Как в продакшене: ключ DeepSeek задан (клиент провайдера создается), вывод тише
+SERVER_ENV = {
+    "DEEPSEEK_API_KEY": "cold-start",
+    "LOG_LEVEL": "WARNING",
+    "DEBUG": "false",
+}
+
+
+def import_profile(env: Dict[str, str]) -> Tuple[float, Dict[str, float]]:
+    """Время импорта main (мс) и накопленное время пакетов верхнего уровня"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    packages: Dict[str, float] = {}
+    total = 0.0
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        module = line.rsplit("|", 1)[1].strip()
+        milliseconds = int(line.split("|")[1]) / 1000
+        if module == "main":
+            total = milliseconds
+        elif "." not in module:
+            # Корневой модуль пакета импортируется один раз - его cumulative и есть цена пакета
+            packages[module] = milliseconds
+    return total, packages
+
+
+def time_to_ready(command: List[str], port: int, env: Dict[str, str], timeout: float) -> Dict[str, Optional[float]]:
+    """Время от запуска процесса до первого ответа и до готовности (мс)"""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        command + ["--port", str(port)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    first_response = ready = None
+    elapsed = lambda: round((time.perf_counter() - started) * 1000, 1)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1.0) as client:
+            while ready is None and time.perf_counter() - started < timeout:
+                try:
+                    response = client.get("/health/ready")
+                    if first_response is None:
+                        first_response = elapsed()
+                    if response.status_code == 404:
+                        response = client.get("/health")
+                    if response.status_code == 200:
+                        ready = elapsed()
+                except httpx.TransportError:
+                    time.sleep(0.005)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    return {"first_response_ms": first_response, "ready_ms": ready}
+
+
+def _median(values: List[Optional[float]]) -> Optional[float]:
+    measured = [value for value in values if value is not None]
+    return round(statistics.median(measured), 1) if measured else None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Время импорта и холодного старта")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=30.0, help="секунд на старт")
+    parser.add_argument("--server", default=f"{sys.executable} -m uvicorn main:app --host 127.0.0.1",
+                        help="команда запуска (к ней добавляется --port)")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE для сервера")
+    parser.add_argument("--top", type=int, default=10, help="сколько тяжелых пакетов показать")
+    parser.add_argument("--output", help="куда записать результат в JSON")
+    args = parser.parse_args()
+
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    env = {**os.environ, **SERVER_ENV, **extra_env}
+    # Байткод компилируется заранее, чтобы первый запуск не отличался от остальных
+    subprocess.run([sys.executable, "-m", "compileall", "-q", "main.py", "app"], cwd=ROOT, check=True)
+
+    imports: List[float] = []
+    packages: Dict[str, List[float]] = {}
+    starts: List[Dict[str, Optional[float]]] = []
+    for _ in range(args.runs):
+        total, per_package = import_profile(env)
+        imports.append(total)
+        for name, value in per_package.items():
+            packages.setdefault(name, []).append(value)
+        starts.append(time_to_ready(args.server.split(), args.port, env, args.timeout))
+
+    heaviest = sorted(
+        ((name, round(statistics.median(values), 1)) for name, values in packages.items()),
+        key=lambda item: -item[1],
+    )[:args.top]
+    result: Dict[str, Any] = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "config": {"runs": args.runs, "server": args.server, "env": extra_env},
+        "import_main_ms": _median(imports),
+        "first_response_ms": _median([start["first_response_ms"] for start in starts]),
+        "ready_ms": _median([start["ready_ms"] for start in starts]),
+        "heaviest_imports_ms": dict(heaviest),
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Нагрузочный тест POST /api/v1/analyze с заданной интенсивностью.
+
+Открытая модель нагрузки: запросы отправляются по расписанию с частотой
+--rps независимо от того, успел ли ответить сервис. Анкеты генерируются
+по профилям из questionnaires.json; доля --repeat-ratio - повторы уже
+отправленных анкет (как у реальных пользователей, дающих кэш-попадания).
+
+Доля попаданий в кэш и доля rule-based ответов берутся из приращения
+счетчиков /metrics анализатора за время теста. Результат пишется в JSON
+(--output), чтобы сравнивать прогоны между коммитами.
+
+Пример (анализатор запущен с DEEPSEEK_BASE_URL на mock_deepseek):
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --rps 20 --duration 60 \\
+        --output benchmarks/results/load.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+DEFAULT_MIX = os.path.join(os.path.dirname(__file__), "questionnaires.json")
+# Счетчики анализатора, по которым считаются доли кэша и fallback
+_COUNTERS = ("ai_analysis_cache_total", "ai_analysis_results_total")
+
+
+class QuestionnaireMix:
+    """Генератор анкет по взвешенным профилям"""
+
+    def __init__(self, path: str, repeat_ratio: float, seed: Optional[int] = None):
+        with open(path, encoding="utf-8") as f:
+            self.profiles = json.load(f)["profiles"]
+        self.weights = [profile["weight"] for profile in self.profiles]
+        self.repeat_ratio = repeat_ratio
+        self.random = random.Random(seed)
+        self.sent: List[Dict[str, Any]] = []
+
+    def _generate(self) -> Dict[str, Any]:
+        profile = self.random.choices(self.profiles, weights=self.weights)[0]
+        rnd = self.random
+        return {
+            "age": rnd.randint(*profile["age"]),
+            "gender": rnd.choice(profile["gender"]),
+            "weight": rnd.randint(*profile["weight_kg"]),
+            "height": rnd.randint(*profile["height_cm"]),
+            "chronic_diseases": rnd.choice(profile["chronic_diseases"]),
+            "current_medications": rnd.choice(profile["current_medications"]),
+            "symptoms": rnd.sample(profile["symptoms"], k=rnd.randint(1, min(3, len(profile["symptoms"])))),
+            "goals": rnd.sample(profile["goals"], k=rnd.randint(1, min(2, len(profile["goals"])))),
+        }
+
+    def next(self) -> Dict[str, Any]:
+        if self.sent and self.random.random() < self.repeat_ratio:
+            return self.random.choice(self.sent)
+        form = self._generate()
+        self.sent.append(form)
+        return form
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Перцентиль по ближайшему рангу"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def scrape_counters(client: httpx.AsyncClient) -> Dict[str, float]:
+    """Счетчики анализатора вида 'metric{label=value}' -> значение"""
+    try:
+        response = await client.get("/metrics")
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return {}
+    counters: Dict[str, float] = {}
+    for family in text_string_to_metric_families(response.text):
+        for sample in family.samples:
+            if sample.name in _COUNTERS:
+                labels = ",".join(f"{k}={v}" for k, v in sorted(sample.labels.items()))
+                counters[f"{sample.name}{{{labels}}}"] = sample.value
+    return counters
+
+
+def _ratio(numerator: float, denominator: float) -> Optional[float]:
+    return round(numerator / denominator, 4) if denominator else None
+
+
+def service_ratios(before: Dict[str, float], after: Dict[str, float]) -> Dict[str, Any]:
+    delta = {key: after.get(key, 0.0) - before.get(key, 0.0) for key in after}
+    hits = delta.get("ai_analysis_cache_total{result=hit}", 0.0)
+    misses = delta.get("ai_analysis_cache_total{result=miss}", 0.0)
+    results = {
+        key.split("source=")[1].rstrip("}"): value
+        for key, value in delta.items()
+        if key.startswith("ai_analysis_results_total")
+    }
+    completed = sum(results.values())
+    return {
+        "cache_hit_ratio": _ratio(hits, hits + misses),
+        "fallback_rate": _ratio(results.get("fallback", 0.0), completed),
+        "results_by_source": results,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    mix = QuestionnaireMix(args.mix, args.repeat_ratio, args.seed)
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        before = await scrape_counters(client)
+
+        async def one(index: int) -> None:
+            body = {"user_id": f"load_{index}", "form_data": mix.next()}
+            started = time.perf_counter()
+            try:
+                response = await client.post("/api/v1/analyze", json=body)
+                status = str(response.status_code)
+            except httpx.TimeoutException:
+                status = "timeout"
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == "200":
+                latencies.append(elapsed)
+
+        total = int(args.rps * args.duration)
+        tasks = []
+        started = time.perf_counter()
+        for index in range(total):
+            # Расписание открытой модели: i-й запрос уходит в момент i / rps
+            delay = started + index / args.rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(index)))
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - started
+
+        after = await scrape_counters(client)
+
+    ok = len(latencies)
+    to_ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "config": {
+            "url": args.url,
+            "target_rps": args.rps,
+            "duration_s": args.duration,
+            "repeat_ratio": args.repeat_ratio,
+            "seed": args.seed,
+        },
+        "requests": total,
+        "ok": ok,
+        "statuses": statuses,
+        "error_rate": _ratio(total - ok, total),
+        "throughput_rps": round(ok / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "p50": to_ms(percentile(latencies, 0.50)),
+            "p95": to_ms(percentile(latencies, 0.95)),
+            "p99": to_ms(percentile(latencies, 0.99)),
+            "max": to_ms(max(latencies) if latencies else None),
+            "mean": to_ms(sum(latencies) / ok if ok else None),
+        },
+        **service_ratios(before, after),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест POST /api/v1/analyze")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rps", type=float, default=10.0)
+    parser.add_argument("--duration", type=float, default=30.0, help="секунд")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="JSON с профилями анкет")
+    parser.add_argument("--repeat-ratio", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--output", help="куда записать результат в JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
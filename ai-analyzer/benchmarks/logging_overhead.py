@@ -0,0 +1,110 @@
+"""
+Бенчмарк накладных расходов логирования на один анализ.
+
+Сравнивает строки логов одного анализа (access-лог, итог анализа и две
+выборочные отладочные строки DeepSeek) при выключенном логировании,
+синхронном текстовом выводе (прежняя настройка) и очереди JSON.
+Вывод идет в /dev/null, поэтому меряется время вызывающего потока.
+
+Запуск из каталога ai-analyzer:
+    python -m benchmarks.logging_overhead [--iterations 20000]
+"""
+import argparse
+import os
+import time
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.logging import QueuedJsonSink, sampled
+
+TEXT_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+)
+
+_access_log = sampled("access")
+_request_log = sampled("deepseek_request")
+_response_log = sampled("deepseek_response")
+_RESPONSE = '{"text": "' + "Рекомендации по питанию и образу жизни. " * 20 + '"}'
+
+
+def one_analysis(i: int) -> None:
+    """Строки логов одного анализа в текущей версии сервиса"""
+    _request_log.debug(
+        "🧠 Запрос в DeepSeek: model={} max_tokens={} temp={} prompt~{} токенов",
+        "deepseek-chat", 2000, 0.7, 1200,
+    )
+    _response_log.debug("📄 Ответ DeepSeek: {}...", _RESPONSE[:200])
+    logger.info(
+        "Analysis completed for form {form_id} in {processing_time_ms}ms",
+        form_id=f"form_{i}", processing_time_ms=850, source="ai",
+    )
+    _access_log.info(
+        "{method} {path} {status_code} {duration_ms}ms",
+        method="POST", path="/api/v1/analyze", status_code=200, duration_ms=851.2,
+        client_ip="127.0.0.1",
+    )
+
+
+def legacy_analysis(i: int) -> None:
+    """Строки логов одного анализа до перехода на выборочный JSON-лог"""
+    logger.info("Запрос: POST /api/v1/analyze", extra={"method": "POST", "path": "/api/v1/analyze"})
+    logger.info("🧠 Analysis requested for user u1")
+    logger.info(f"📝 Form data received: {['age', 'gender', 'symptoms', 'goals']}")
+    logger.info("🚀 Calling DeepSeek API for analysis...")
+    logger.info("🧠 Отправляем запрос в DeepSeek API...")
+    logger.info("📝 Модель: deepseek-chat")
+    logger.info("🔧 Параметры: max_tokens=2000, temp=0.7")
+    logger.info("📊 Размер промпта: ~1200 токенов")
+    logger.info("✅ Получен ответ от DeepSeek API")
+    logger.info(f"📄 Ответ DeepSeek: {_RESPONSE[:200]}...")
+    logger.info("✅ JSON успешно распарсен")
+    logger.info("✅ DeepSeek анализ успешно завершен")
+    logger.info(f"Analysis completed for form form_{i} in 850ms")
+    logger.info(f"✅ Analysis completed: 3 recommendations")
+    logger.info("Ответ: 200", extra={"status_code": 200, "process_time": 0.8512})
+
+
+def measure(name: str, func, iterations: int) -> float:
+    started = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    per_call_us = (time.perf_counter() - started) / iterations * 1e6
+    print(f"{name:<44} {per_call_us:8.2f} µs/анализ")
+    return per_call_us
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    devnull = open(os.devnull, "w", encoding="utf-8")
+
+    logger.remove()
+    baseline = measure("логирование выключено", one_analysis, args.iterations)
+
+    logger.add(devnull, level="INFO", format=TEXT_FORMAT, colorize=False)
+    legacy = measure("прежний вариант: 15 INFO, синхронный текст", legacy_analysis, args.iterations)
+    logger.remove()
+
+    sink = QueuedJsonSink(devnull, max_queue=args.iterations * 4)
+    logger.add(sink, level="INFO", format="{message}", colorize=False)
+    queued = measure("очередь JSON, INFO", one_analysis, args.iterations)
+    logger.remove()
+
+    sink = QueuedJsonSink(devnull, max_queue=args.iterations * 4)
+    logger.add(sink, level="DEBUG", format="{message}", colorize=False)
+    debug = measure("очередь JSON, DEBUG с выборкой", one_analysis, args.iterations)
+    logger.remove()
+
+    print()
+    print(f"накладные расходы прежнего варианта:  {legacy - baseline:8.2f} µs/анализ")
+    print(f"накладные расходы очереди JSON:       {queued - baseline:8.2f} µs/анализ")
+    print(f"то же с DEBUG и выборкой:             {debug - baseline:8.2f} µs/анализ")
+    print(f"доли выборки: {settings.LOG_SAMPLE_RATES}")
+    devnull.close()
+
+
+if __name__ == "__main__":
+    main()
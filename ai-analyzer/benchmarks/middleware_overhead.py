@@ -0,0 +1,136 @@
+"""
+Микробенчмарк накладных расходов middleware запросов.
+
+Сравнивает на простом эндпоинте приложение без middleware, прежний
+@app.middleware("http") (BaseHTTPMiddleware) и RequestContextMiddleware.
+Запросы подаются напрямую в ASGI-приложение без сети; логирование
+отключено, чтобы мерить только обертку запроса.
+
+Запуск из каталога ai-analyzer:
+    python -m benchmarks.middleware_overhead [--requests 5000]
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from loguru import logger
+
+from app.core import tracing
+from app.core.middleware import RequestContextMiddleware
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return PlainTextResponse("ok")
+
+    @app.get("/stream")
+    async def stream():
+        async def events():
+            for i in range(10):
+                yield f"data: {i}\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def legacy_app() -> FastAPI:
+    """Приложение с прежним log_requests на BaseHTTPMiddleware"""
+    app = build_app()
+
+    @app.middleware("http")
+    async def log_requests(request: Request, call_next):
+        trace = tracing.start_trace(f"{request.method} {request.url.path}")
+        started = time.time()
+        try:
+            response = await call_next(request)
+        finally:
+            if trace is not None:
+                tracing.finish_trace(trace)
+        process_time = time.time() - started
+        logger.info(f"Ответ: {response.status_code}")
+        if trace is not None:
+            response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["X-Process-Time"] = str(process_time)
+        return response
+
+    return app
+
+
+def asgi_app() -> FastAPI:
+    app = build_app()
+    app.add_middleware(RequestContextMiddleware)
+    return app
+
+
+async def call(app, path: str) -> None:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Клиент не отключается, пока ответ не отправлен
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def measure(name: str, app, path: str, requests: int) -> float:
+    for _ in range(200):
+        await call(app, path)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await call(app, path)
+    per_request_us = (time.perf_counter() - started) / requests * 1e6
+    print(f"{name:<36} {path:<8} {per_request_us:8.1f} µs/запрос")
+    return per_request_us
+
+
+async def run(requests: int) -> None:
+    apps = {
+        "без middleware": build_app(),
+        "BaseHTTPMiddleware": legacy_app(),
+        "RequestContextMiddleware": asgi_app(),
+    }
+    for path in ("/ping", "/stream"):
+        results = {name: await measure(name, app, path, requests) for name, app in apps.items()}
+        bare = results["без middleware"]
+        print(
+            f"  накладные расходы: прежний {results['BaseHTTPMiddleware'] - bare:.1f} µs, "
+            f"ASGI {results['RequestContextMiddleware'] - bare:.1f} µs"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    logger.remove()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
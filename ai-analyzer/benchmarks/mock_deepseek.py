@@ -0,0 +1,279 @@
+"""
+Локальная замена DeepSeek API для нагрузочного тестирования.
+
+OpenAI-совместимый POST /v1/chat/completions (обычный и потоковый ответ)
+с настраиваемым распределением задержки, инъекцией 429/5xx/таймаутов и
+записью/воспроизведением настоящих ответов DeepSeek.
+
+Запуск из каталога ai-analyzer:
+    python -m benchmarks.mock_deepseek --port 9000 --latency lognormal:800,0.5 --rate-429 0.02
+
+Анализатор направляется на заглушку так:
+    DEEPSEEK_BASE_URL=http://127.0.0.1:9000/v1 DEEPSEEK_API_KEY=mock
+
+Запись настоящих ответов (запросы проксируются в DeepSeek):
+    python -m benchmarks.mock_deepseek --record benchmarks/cassettes/deepseek.jsonl \\
+        --upstream https://api.deepseek.com/v1 --upstream-key $DEEPSEEK_API_KEY
+Воспроизведение записанного:
+    python -m benchmarks.mock_deepseek --replay benchmarks/cassettes/deepseek.jsonl
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Позиция каталога в промпте (см. prompt_builder.format_catalog)
+_CATALOG_LINE_RE = re.compile(r"- ID: ([^,]+), Название: ([^,]+),")
+# Сколько длится "зависший" вызов при инъекции таймаута
+HANG_SECONDS = 3600.0
+
+
+class LatencyModel:
+    """
+    Распределение задержки ответа, задается строкой:
+    fixed:MS, uniform:MIN_MS,MAX_MS, lognormal:MEDIAN_MS,SIGMA
+    """
+
+    def __init__(self, spec: str):
+        kind, _, params = spec.partition(":")
+        values = [float(value) for value in params.split(",") if value]
+        if kind == "fixed" and len(values) == 1:
+            self._sample = lambda: values[0]
+        elif kind == "uniform" and len(values) == 2:
+            self._sample = lambda: random.uniform(values[0], values[1])
+        elif kind == "lognormal" and len(values) == 2:
+            mu = math.log(values[0])
+            self._sample = lambda: random.lognormvariate(mu, values[1])
+        else:
+            raise ValueError(f"Неизвестное распределение задержки: {spec}")
+        self.spec = spec
+
+    def sample(self) -> float:
+        """Задержка в секундах"""
+        return max(0.0, self._sample()) / 1000
+
+
+class Cassette:
+    """Записанные ответы DeepSeek (JSONL: ключ запроса -> тело ответа)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.responses: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.responses[entry["key"]] = entry["response"]
+
+    @staticmethod
+    def key(messages: List[Dict[str, Any]]) -> str:
+        payload = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, messages: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Ответ на тот же промпт, иначе случайный записанный"""
+        response = self.responses.get(self.key(messages))
+        if response is None and self.responses:
+            response = random.choice(list(self.responses.values()))
+        return response
+
+    def add(self, messages: List[Dict[str, Any]], response: Dict[str, Any]) -> None:
+        key = self.key(messages)
+        self.responses[key] = response
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": key, "response": response}, ensure_ascii=False) + "\n")
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 3)
+
+
+def synthesize_content(messages: List[Dict[str, Any]]) -> str:
+    """Правдоподобный JSON ответ по позициям каталога из промпта"""
+    prompt = "\n".join(str(message.get("content", "")) for message in messages)
+    catalog = _CATALOG_LINE_RE.findall(prompt)
+    picked = random.sample(catalog, k=min(len(catalog), random.randint(2, 4)))
+    recommendations = {
+        supplement_id.strip(): {
+            "name": name.strip(),
+            "dose": "1 капсула в день",
+            "duration": random.choice(["1 месяц", "2 месяца", "3 месяца"]),
+            "priority": random.choice(["high", "medium", "low"]),
+            "confidence": round(random.uniform(0.6, 0.9), 2),
+            "reason": "Соответствует симптомам и целям анкеты",
+        }
+        for supplement_id, name in picked
+    }
+    text = (
+        "На основе анкеты рекомендуем обратить внимание на питание, сон и "
+        "физическую активность. " * 8
+        + "Перед приемом БАДов обязательно проконсультируйтесь с врачом."
+    )
+    return json.dumps(
+        {"text": text, "recommendations": recommendations, "confidence": 0.8},
+        ensure_ascii=False,
+    )
+
+
+def completion_body(model: str, content: str, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    prompt_tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in messages)
+    # Системное сообщение одинаково у всех запросов - считаем его попаданием в кэш контекста
+    cache_hit = estimate_tokens(str(messages[0].get("content", ""))) if messages else 0
+    completion_tokens = estimate_tokens(content)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_cache_hit_tokens": cache_hit,
+            "prompt_cache_miss_tokens": prompt_tokens - cache_hit,
+        },
+    }
+
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    latency = LatencyModel(args.latency)
+    cassette = Cassette(args.record or args.replay) if (args.record or args.replay) else None
+    upstream = (
+        httpx.AsyncClient(
+            base_url=args.upstream,
+            headers={"Authorization": f"Bearer {args.upstream_key}"},
+            timeout=120.0,
+        )
+        if args.record else None
+    )
+    counters = {"requests": 0, "streamed": 0, "429": 0, "5xx": 0, "timeouts": 0}
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        if upstream is not None:
+            await upstream.aclose()
+
+    app = FastAPI(title="DeepSeek mock", lifespan=lifespan)
+
+    async def produce(body: Dict[str, Any]) -> Dict[str, Any]:
+        messages = body.get("messages", [])
+        if upstream is not None:
+            # Записываем обычный ответ; поток при воспроизведении нарезается из него
+            request_body = {k: v for k, v in body.items() if k not in ("stream", "stream_options")}
+            response = await upstream.post("/chat/completions", json=request_body)
+            response.raise_for_status()
+            data = response.json()
+            cassette.add(messages, data)
+            return data
+        recorded = cassette.get(messages) if cassette is not None else None
+        if recorded is not None:
+            return recorded
+        return completion_body(body.get("model", "deepseek-chat"), synthesize_content(messages), messages)
+
+    async def stream(data: Dict[str, Any], delay: float):
+        content = data["choices"][0]["message"]["content"] or ""
+        pieces = [content[i:i + args.chunk_chars] for i in range(0, len(content), args.chunk_chars)]
+        per_piece = delay / max(1, len(pieces))
+        base = {"id": data["id"], "object": "chat.completion.chunk", "created": data["created"], "model": data["model"]}
+        for piece in pieces:
+            await asyncio.sleep(per_piece)
+            chunk = {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        final = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield f"data: {json.dumps(final)}\n\n"
+        yield f"data: {json.dumps({**base, 'choices': [], 'usage': data.get('usage')})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.post("/v1/chat/completions")
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        counters["requests"] += 1
+
+        roll = random.random()
+        if roll < args.rate_429:
+            counters["429"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                status_code=429,
+                headers={"Retry-After": str(args.retry_after)},
+            )
+        roll -= args.rate_429
+        if roll < args.rate_5xx:
+            counters["5xx"] += 1
+            return JSONResponse(
+                {"error": {"message": "Service unavailable", "type": "server_error"}},
+                status_code=random.choice([500, 502, 503]),
+            )
+        roll -= args.rate_5xx
+        if roll < args.rate_timeout:
+            counters["timeouts"] += 1
+            # Клиент оборвет соединение по своему таймауту
+            await asyncio.sleep(HANG_SECONDS)
+
+        delay = latency.sample()
+        data = await produce(body)
+        if body.get("stream"):
+            counters["streamed"] += 1
+            return StreamingResponse(stream(data, delay), media_type="text/event-stream")
+        await asyncio.sleep(delay)
+        return JSONResponse(data)
+
+    @app.get("/stats")
+    async def stats():
+        return {**counters, "latency": latency.spec}
+
+    return app
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="OpenAI-совместимая заглушка DeepSeek")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", default="lognormal:800,0.5",
+                        help="fixed:MS | uniform:MIN,MAX | lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--rate-timeout", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--chunk-chars", type=int, default=16, help="символов в куске потока")
+    parser.add_argument("--record", help="JSONL файл для записи ответов настоящего DeepSeek")
+    parser.add_argument("--upstream", default="https://api.deepseek.com/v1")
+    parser.add_argument("--upstream-key", default=os.environ.get("DEEPSEEK_API_KEY"))
+    parser.add_argument("--replay", help="JSONL файл записанных ответов")
+    args = parser.parse_args(argv)
+    if args.record and not args.upstream_key:
+        parser.error("--record требует --upstream-key или DEEPSEEK_API_KEY")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
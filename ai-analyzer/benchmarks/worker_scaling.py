@@ -0,0 +1,223 @@
+"""
+Масштабирование пропускной способности по числу воркеров gunicorn.
+
+Для каждого значения --workers запускает `gunicorn -c gunicorn.conf.py
+main:app` и нагружает POST /api/v1/analyze в замкнутом цикле: --concurrency
+запросов в полете, распределенных по --clients процессам-клиентам.
+Анкеты не повторяются, поэтому каждый запрос проходит полный CPU-путь
+(валидация, каталог, правила, сериализация). По умолчанию DeepSeek не
+настроен и ответ строится rule-based анализом - меряется именно
+CPU-часть, которая в одном процессе упирается в одно ядро. Вызовы
+заглушки DeepSeek включаются через --env (см. mock_deepseek).
+
+Клиенты работают на той же машине и делят с воркерами ядра; для чистого
+результата запускайте с другой машины через --url и --no-server.
+
+Запуск из каталога ai-analyzer:
+    python -m benchmarks.worker_scaling --workers 1,2,4,8 --duration 20 \\
+        --output benchmarks/results/scaling.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.load_test import DEFAULT_MIX, QuestionnaireMix, git_commit, percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Окружение сервера по умолчанию: без DeepSeek, Redis и отладочного вывода
+SERVER_ENV = {
+    "DEEPSEEK_API_KEY": "",
+    "REDIS_ENABLED": "false",
+    "LOG_LEVEL": "WARNING",
+    "DEBUG": "false",
+}
+
+
+def _default_workers() -> str:
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return ",".join(str(count) for count in counts)
+
+
+def start_server(workers: int, port: int, extra_env: Dict[str, str]) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        **SERVER_ENV,
+        **extra_env,
+        "WEB_CONCURRENCY": str(workers),
+        "HOST": "127.0.0.1",
+        "PORT": str(port),
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    """SIGTERM - плавная остановка gunicorn с завершением начатых запросов"""
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def wait_ready(url: str, workers: int, timeout: float = 60.0) -> int:
+    """Ждет, пока ответят все воркеры (различные worker_pid в /health)"""
+    pids = set()
+    deadline = time.monotonic() + timeout
+    with httpx.Client(base_url=url, timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            try:
+                pids.add(client.get("/health").json().get("worker_pid"))
+            except (httpx.HTTPError, ValueError):
+                time.sleep(0.2)
+                continue
+            if len(pids) >= workers:
+                break
+    if not pids:
+        raise RuntimeError(f"Сервер {url} не ответил за {timeout:.0f}с")
+    return len(pids)
+
+
+async def _client_loop(url: str, concurrency: int, duration: float, seed: int) -> Tuple[List[float], int]:
+    mix = QuestionnaireMix(DEFAULT_MIX, repeat_ratio=0.0, seed=seed)
+    latencies: List[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=60.0, limits=limits) as client:
+        stop_at = time.perf_counter() + duration
+
+        async def worker(slot: int) -> None:
+            nonlocal errors
+            index = 0
+            while time.perf_counter() < stop_at:
+                body = {"user_id": f"scale_{seed}_{slot}_{index}", "form_data": mix.next()}
+                index += 1
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/api/v1/analyze", json=body)
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(worker(slot) for slot in range(concurrency)))
+    return latencies, errors
+
+
+def _client_process(args: Tuple[str, int, float, int]) -> Tuple[List[float], int]:
+    return asyncio.run(_client_loop(*args))
+
+
+def drive(url: str, concurrency: int, clients: int, duration: float) -> Dict[str, Any]:
+    """Замкнутый цикл нагрузки из нескольких процессов-клиентов"""
+    per_client = max(1, concurrency // clients)
+    jobs = [(url, per_client, duration, seed) for seed in range(clients)]
+    started = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(clients) as pool:
+        results = pool.map(_client_process, jobs)
+    wall = time.perf_counter() - started
+
+    latencies = [value for client_latencies, _ in results for value in client_latencies]
+    errors = sum(client_errors for _, client_errors in results)
+    to_ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        "ok": len(latencies),
+        "errors": errors,
+        # Запуск процессов-клиентов входит в wall, поэтому делим на большее из двух
+        "throughput_rps": round(len(latencies) / max(wall, duration), 1),
+        "p50_ms": to_ms(percentile(latencies, 0.50)),
+        "p99_ms": to_ms(percentile(latencies, 0.99)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пропускная способность по числу воркеров")
+    parser.add_argument("--workers", default=_default_workers(), help="список, например 1,2,4")
+    parser.add_argument("--duration", type=float, default=15.0, help="секунд на замер")
+    parser.add_argument("--warmup", type=float, default=2.0, help="секунд прогрева")
+    parser.add_argument("--concurrency", type=int, default=64, help="запросов в полете")
+    parser.add_argument("--clients", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", help="адрес уже запущенного сервера (с --no-server)")
+    parser.add_argument("--no-server", action="store_true", help="не запускать gunicorn")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE для сервера")
+    parser.add_argument("--output", help="куда записать результат в JSON")
+    args = parser.parse_args()
+
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    url = args.url or f"http://127.0.0.1:{args.port}"
+    rows: List[Dict[str, Any]] = []
+
+    for workers in [int(value) for value in args.workers.split(",")]:
+        server: Optional[subprocess.Popen] = None
+        if not args.no_server:
+            server = start_server(workers, args.port, extra_env)
+        try:
+            ready = wait_ready(url, 1 if args.no_server else workers)
+            if args.warmup > 0:
+                drive(url, args.concurrency, args.clients, args.warmup)
+            row = {"workers": workers, "workers_ready": ready}
+            row.update(drive(url, args.concurrency, args.clients, args.duration))
+        finally:
+            if server is not None:
+                stop_server(server)
+        # Ускорение относительно первого замера и его доля от идеального линейного
+        base = rows[0] if rows else row
+        speedup = row["throughput_rps"] / base["throughput_rps"] if base["throughput_rps"] else 0.0
+        row["speedup"] = round(speedup, 2)
+        row["efficiency"] = round(speedup * base["workers"] / workers, 2)
+        rows.append(row)
+        print(
+            f"workers={workers:<3} rps={row['throughput_rps']:<8} p50={row['p50_ms']}ms "
+            f"p99={row['p99_ms']}ms speedup={row['speedup']} errors={row['errors']}",
+            flush=True,
+        )
+
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "clients": args.clients,
+            "env": extra_env,
+        },
+        "results": rows,
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Многопроцессный запуск анализатора: gunicorn с uvicorn-воркерами
+
+    gunicorn -c gunicorn.conf.py main:app
+
+Приложение импортируется в master-процессе до fork (preload_app): там же
+загружается каталог, компилируются правила, индекс каталога и шаблон
+промпта (app.services.preload). После gc.freeze() эти объекты не
+трогает сборщик мусора, и воркеры читают их из общих страниц памяти
+без копирования. Соединения (база, Redis, DeepSeek) и фоновые задачи
+каждый воркер открывает сам в lifespan; кэш результатов воркеры делят
+через Redis (L2).
+"""
+import gc
+import os
+import shutil
+
+from loguru import logger
+
+from app.core.config import settings
+
+# Метрики Prometheus воркеров пишутся в общий каталог и суммируются на
+# /metrics; переменная должна быть задана до импорта prometheus_client
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", settings.PROMETHEUS_MULTIPROC_DIR)
+_metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+shutil.rmtree(_metrics_dir, ignore_errors=True)
+os.makedirs(_metrics_dir, exist_ok=True)
+
+bind = f"{settings.HOST}:{settings.PORT}"
+worker_class = "uvicorn_worker.UvicornWorker"
+# Без WEB_CONCURRENCY - по числу доступных процессу ядер (учитывает cpuset контейнера)
+_cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+workers = settings.WEB_CONCURRENCY or _cores or 1
+
+# Перезапуск воркеров против накопления памяти и плавное завершение
+max_requests = settings.WORKER_MAX_REQUESTS
+max_requests_jitter = settings.WORKER_MAX_REQUESTS_JITTER
+graceful_timeout = settings.WORKER_GRACEFUL_TIMEOUT
+timeout = settings.WORKER_TIMEOUT
+keepalive = settings.WORKER_KEEPALIVE
+
+preload_app = settings.WORKER_PRELOAD
+# Access-лог пишет RequestContextMiddleware
+accesslog = None
+errorlog = "-"
+loglevel = settings.LOG_LEVEL.lower()
+
+if preload_app:
+    # Сборка мусора отключена до gc.freeze(), чтобы не освобождать память
+    # между подготовленными объектами перед fork
+    gc.disable()
+
+
+def when_ready(server):
+    """Master готов: строим общее состояние и замораживаем его перед fork"""
+    if not preload_app:
+        return
+    from app.services.preload import preload_state
+
+    preload_state()
+    # Объекты master уходят в постоянное поколение: сборки мусора в
+    # воркерах их не обходят и не копируют страницы памяти
+    gc.freeze()
+    gc.enable()
+    logger.info(f"🧊 Заморожено объектов до fork: {gc.get_freeze_count()}, воркеров: {workers}")
+    if workers > 1 and not settings.REDIS_ENABLED:
+        logger.warning("⚠️ REDIS_ENABLED=false - воркеры не делят кэш результатов анализа")
+
+
+def child_exit(server, worker):
+    """Файлы метрик завершившегося воркера больше не учитываются в живых gauge"""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,25 +1,54 @@
 """
 Основной файл FastAPI приложения для ИИ-анализатора медицинских анкет
 """
-import os
-import sys
+import asyncio
 import time
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from loguru import logger
 
-# Добавляем путь к модулям приложения
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
 from app.api.routes import api_router
+from app.core import metrics, tracing
 from app.core.config import settings
 from app.core.exceptions import setup_exception_handlers
+from app.core.http_client import create_deepseek_http_client
 from app.core.logging import setup_logging
-from app.database.connection import init_db, close_db_connection
+from app.core.middleware import RequestContextMiddleware
+from app.database.connection import init_db, close_db_connection, check_db_connection
+from app.services.ai_service import AIAnalysisService
+
+
+async def start_services(app: FastAPI) -> None:
+    """
+    Подключение внешних ресурсов в фоне: порт уже открыт и /health/live
+    отвечает, а /health/ready вернет 200 после завершения. Шаги не зависят
+    друг от друга: ошибка одного не мешает запуститься остальным
+    (клиент DeepSeek и очередь задач нужны и без базы).
+    """
+    started = time.perf_counter()
+    steps = (
+        # Пул соединений с базой данных (подключается в фоне)
+        ("database", init_db),
+        # Фоновый экспорт трасс (если задан TRACE_EXPORT_PATH или TRACE_OTLP_ENDPOINT)
+        ("tracing", tracing.exporter.start),
+        # Клиент DeepSeek, очередь задач, Redis и каталог
+        ("ai_service", app.state.ai_service.start),
+    )
+    errors = []
+    for name, step in steps:
+        try:
+            await step()
+        except Exception as e:
+            errors.append(f"{name}: {type(e).__name__}: {e}")
+            logger.exception(f"❌ Ошибка запуска ({name}): {e}")
+    if errors:
+        app.state.startup_error = "; ".join(errors)
+        return
+    logger.info(f"✅ Сервисы запущены за {(time.perf_counter() - started) * 1000:.0f} мс после открытия порта")
 
 
 @asynccontextmanager
@@ -31,19 +60,25 @@ async def lifespan(app: FastAPI):
     setup_logging()
     logger.info("🚀 Запуск ИИ-анализатора медицинских анкет")
     
-    # Инициализация базы данных
-    await init_db()
-    logger.info("✅ База данных инициализирована")
-    
     # Проверка подключения к DeepSeek API
     if settings.DEEPSEEK_API_KEY:
         logger.info("✅ DeepSeek API ключ настроен")
     else:
         logger.warning("⚠️ DeepSeek API ключ не настроен - используется rule-based анализ")
     
+    # Один сервис анализа на процесс: общий пул соединений к DeepSeek и общий кэш.
+    # Тяжелая инициализация не задерживает открытие порта (холодный старт)
+    app.state.ai_service = AIAnalysisService(http_client_factory=create_deepseek_http_client)
+    app.state.startup_error = None
+    startup = asyncio.create_task(start_services(app), name="startup")
+    
     yield
     
     # Закрытие соединений при завершении
+    startup.cancel()
+    await asyncio.gather(startup, return_exceptions=True)
+    await app.state.ai_service.close()
+    await tracing.exporter.close()
     await close_db_connection()
     logger.info("👋 ИИ-анализатор остановлен")
 
@@ -74,6 +109,9 @@ app.add_middleware(
     allowed_hosts=settings.ALLOWED_HOSTS,
 )
 
+# Трассировка, request-id и access-лог (внешний слой - учитывает все остальные)
+app.add_middleware(RequestContextMiddleware)
+
 # Настройка обработчиков исключений
 setup_exception_handlers(app)
 
@@ -95,7 +133,7 @@ async def root():
 
 
 @app.get("/health", tags=["Health"])
-async def health_check():
+async def health_check(request: Request):
     """
     Проверка здоровья сервиса
     """
@@ -105,50 +143,52 @@ async def health_check():
         "version": "1.0.0",
         "debug": settings.DEBUG,
         "ai_configured": bool(settings.DEEPSEEK_API_KEY),
+        **request.app.state.ai_service.get_health(),
     }
 
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
+@app.get("/health/live", tags=["Health"])
+async def liveness():
     """
-    Middleware для логирования всех HTTP запросов
+    Процесс жив и обрабатывает запросы (не зависит от внешних ресурсов)
     """
-    start_time = time.time()
-    
-    # Логируем входящий запрос
-    logger.info(
-        f"Запрос: {request.method} {request.url.path}",
-        extra={
-            "method": request.method,
-            "path": request.url.path,
-            "query_params": str(request.query_params),
-            "client_ip": request.client.host,
-        }
-    )
-    
-    # Обрабатываем запрос
-    response = await call_next(request)
-    
-    # Вычисляем время обработки
-    process_time = time.time() - start_time
-    
-    # Логируем ответ
-    logger.info(
-        f"Ответ: {response.status_code}",
-        extra={
-            "status_code": response.status_code,
-            "process_time": round(process_time, 4),
-        }
+    return {"status": "alive"}
+
+
+@app.get("/health/ready", tags=["Health"])
+async def readiness(request: Request):
+    """
+    Сервис готов к нагрузке: фоновый старт завершен (клиент DeepSeek,
+    очередь задач, кэш, каталог). База для анализа не обязательна
+    (встроенный каталог, сохранение результатов - заглушка), поэтому ее
+    состояние только сообщается и на готовность не влияет.
+    """
+    service = request.app.state.ai_service
+    database = await check_db_connection()
+    if service.ready:
+        return {"status": "ready", "database_connected": database}
+    error = request.app.state.startup_error
+    return JSONResponse(
+        status_code=503,
+        content={
+            "status": "failed" if error else "starting",
+            "error": error,
+            "services_started": service.ready,
+            "database_connected": database,
+        },
     )
-    
-    # Добавляем заголовок с временем обработки
-    response.headers["X-Process-Time"] = str(process_time)
-    
-    return response
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """
+    Метрики Prometheus
+    """
+    data, content_type = metrics.render_metrics()
+    return Response(content=data, media_type=content_type)
 
 
 if __name__ == "__main__":
-    import time
     import uvicorn
     
     # Запуск сервера
@@ -0,0 +1,38 @@
+"""
+Фикстуры микробенчмарков горячих путей анализатора.
+
+Запуск и сравнение с сохраненной базовой линией (из каталога ai-analyzer):
+    pytest tests/bench --benchmark-storage=tests/bench/baseline \\
+        --benchmark-compare=0001 --benchmark-compare-fail=median:25%
+Обновление базовой линии после осознанного изменения производительности:
+    pytest tests/bench --benchmark-storage=tests/bench/baseline --benchmark-save=baseline
+"""
+from typing import Any, Dict
+
+import pytest
+from loguru import logger
+
+from app.services.ai_service import AIAnalysisService
+from tests.bench.datasets import CATALOG_SIZES, QUESTIONNAIRES, make_catalog
+
+
+@pytest.fixture(scope="session", autouse=True)
+def quiet_logging():
+    """Логи не пишутся - меряется только код горячего пути"""
+    logger.remove()
+    yield
+
+
+@pytest.fixture(scope="session")
+def service() -> AIAnalysisService:
+    return AIAnalysisService()
+
+
+@pytest.fixture(scope="session", params=CATALOG_SIZES, ids=lambda size: f"catalog{size}")
+def catalog(request) -> tuple:
+    return make_catalog(request.param)
+
+
+@pytest.fixture(params=sorted(QUESTIONNAIRES), ids=str)
+def questionnaire(request) -> Dict[str, Any]:
+    return QUESTIONNAIRES[request.param]
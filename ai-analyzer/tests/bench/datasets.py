@@ -0,0 +1,88 @@
+"""
+Данные микробенчмарков: анкеты разного размера, каталоги и ответ DeepSeek
+"""
+import json
+import random
+from typing import Any, Dict, List
+
+from app.services.catalog import BUILTIN_CATALOG, CatalogSnapshot
+
+CATALOG_SIZES = (5, 500, 5000)
+
+_DESCRIPTION_WORDS = (
+    "поддержка", "иммунитет", "энергия", "сон", "стресс", "сердце", "сосуды",
+    "кости", "суставы", "кожа", "волосы", "ногти", "мозг", "память", "зрение",
+    "пищеварение", "печень", "мышцы", "восстановление", "антиоксидант",
+)
+_TAGS = (
+    "иммунитет", "энергия", "сон", "стресс", "сердце", "кости", "суставы",
+    "кожа", "волосы", "мозг", "пищеварение", "мышцы", "витамин d", "омега-3",
+    "магний", "цинк", "железо", "витамин b12", "коллаген", "пробиотики",
+)
+
+QUESTIONNAIRES: Dict[str, Dict[str, Any]] = {
+    # Минимальная анкета: только обязательный минимум
+    "small": {"age": 30, "gender": "female"},
+    # Типичная анкета из основного сервера
+    "typical": {
+        "age": 42,
+        "gender": "male",
+        "weight": 86.5,
+        "height": 181,
+        "chronic_diseases": ["гипертония"],
+        "current_medications": ["аспирин"],
+        "symptoms": ["усталость", "плохой сон", "боли в суставах"],
+        "goals": ["энергия", "здоровье сердца"],
+        "lifestyle": {"activity": "low", "smoking": False},
+    },
+    # Патологическая: длинный свободный текст, длинные списки и невалидные
+    # значения (путь исключения в валидации)
+    "pathological": {
+        "age": 500,
+        "gender": "не указан",
+        "weight": "восемьдесят",
+        "height": 181,
+        "chronic_diseases": [f"заболевание {i} " + "очень подробное описание " * 5 for i in range(50)],
+        "current_medications": [f"препарат {i}" for i in range(100)],
+        "symptoms": ["усталость " * 200, "головная боль", "Бессонница!!! 😴" * 20] + [f"симптом {i}" for i in range(100)],
+        "goals": ["энергия", "иммунитет", "сон"] * 30,
+        "notes": "Свободный текст пациента. " * 500,
+    },
+}
+
+
+def make_catalog(size: int) -> tuple:
+    """Детерминированный каталог заданного размера в виде снимка (как в сервисе)"""
+    rnd = random.Random(size)
+    items: List[Dict[str, Any]] = [dict(item) for item in BUILTIN_CATALOG[:size]]
+    while len(items) < size:
+        i = len(items)
+        items.append({
+            "id": f"supplement_{i}",
+            "name": f"БАД {i}",
+            "description": " ".join(rnd.sample(_DESCRIPTION_WORDS, k=6)),
+            "category": rnd.choice(("vitamins", "minerals", "fatty_acids", "herbs")),
+            "tags": rnd.sample(_TAGS, k=3),
+            "price": round(rnd.uniform(300, 3000), 2),
+        })
+    return CatalogSnapshot(items, version=1, source="bench").items
+
+
+def ai_response_json(catalog: tuple, count: int = 5) -> str:
+    """Ответ DeepSeek по контракту промпта с count рекомендациями из каталога"""
+    recommendations = {
+        item["id"]: {
+            "name": item["name"],
+            "dose": "1 капсула 2 раза в день",
+            "duration": "1 месяц",
+            "priority": "medium",
+            "confidence": 0.8,
+            "reason": "Соответствует целям анкеты",
+        }
+        for item in catalog[:count]
+    }
+    text = "Рекомендации по питанию, сну и активности. " * 40 + "Проконсультируйтесь с врачом."
+    return json.dumps(
+        {"text": text, "recommendations": recommendations, "confidence": 0.85},
+        ensure_ascii=False,
+    )
@@ -0,0 +1,66 @@
+"""
+Микробенчмарки CPU-части обработки запроса (без вызова DeepSeek)
+"""
+import pytest
+
+from app.schemas.response import AIAnalysisResponse
+
+from tests.bench.datasets import ai_response_json, make_catalog
+
+pytestmark = pytest.mark.slow
+
+
+def test_cache_key(benchmark, service, questionnaire):
+    """Канонический отпечаток анкеты (ключ кэша)"""
+    benchmark(service._generate_cache_key, questionnaire)
+
+
+def test_validate_form_answers(benchmark, service, questionnaire):
+    """FormAnswersValidation, включая путь исключения на невалидной анкете"""
+    benchmark(service._validate_form_answers, questionnaire)
+
+
+def test_build_prompt(benchmark, service, catalog, questionnaire):
+    """Сборка промпта: шаблон на снимок каталога, отбор top-K и бюджет токенов"""
+    answers = service._validate_form_answers(questionnaire)
+    service.prompt_builder.build(answers, catalog)
+    benchmark(service.prompt_builder.build, answers, catalog)
+
+
+@pytest.mark.parametrize("variant", ["clean", "fenced", "truncated"])
+def test_process_ai_response(benchmark, service, variant):
+    """Разбор и валидация ответа DeepSeek"""
+    content = ai_response_json(make_catalog(5))
+    if variant == "fenced":
+        content = "Вот результат анализа:\n```json\n" + content + "\n```"
+    elif variant == "truncated":
+        content = content[:content.rindex('"reason"')]
+    benchmark(service._process_ai_response, content)
+
+
+def test_fallback_rules(benchmark, service, catalog, questionnaire):
+    """Rule-based рекомендации (CPU-часть _fallback_rule_based_analysis)"""
+    answers = service._validate_form_answers(questionnaire)
+    benchmark(service.rule_engine.evaluate, answers, catalog)
+
+
+@pytest.fixture(scope="module")
+def analysis_response(service) -> AIAnalysisResponse:
+    result = service._process_ai_response(ai_response_json(make_catalog(5)))
+    return AIAnalysisResponse(
+        recommended_supplements=result["supplements"],
+        recommendations_text=result["text"],
+        analysis_id="bench",
+        confidence=result["confidence"],
+    )
+
+
+def test_response_serialization(benchmark, analysis_response):
+    """Сериализация результата (ответ API и запись в кэш)"""
+    benchmark(analysis_response.model_dump_json)
+
+
+def test_response_deserialization(benchmark, analysis_response):
+    """Восстановление результата из кэша"""
+    payload = analysis_response.model_dump_json()
+    benchmark(AIAnalysisResponse.model_validate_json, payload)
@@ -0,0 +1,34 @@
+"""
+Общие фикстуры unit-тестов
+"""
+import pytest
+
+from app.core.config import settings
+from app.services.ai_service import AIAnalysisService
+
+
+class FakeClock:
+    """Управляемое монотонное время: передается в компоненты вместо time.monotonic"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def service(monkeypatch, tmp_path) -> AIAnalysisService:
+    """Сервис без DeepSeek и Redis, очередь задач - во временной SQLite базе"""
+    monkeypatch.setattr(settings, "DEEPSEEK_API_KEY", None)
+    monkeypatch.setattr(settings, "REDIS_ENABLED", False)
+    monkeypatch.setattr(settings, "JOBS_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    return AIAnalysisService()
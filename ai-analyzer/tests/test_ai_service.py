@@ -0,0 +1,93 @@
+"""
+AIAnalysisService: переиспользование готовых результатов между анкетами
+"""
+import asyncio
+
+import pytest
+
+from app.schemas.response import (
+    AIAnalysisResponse,
+    AnalysisRequest,
+    BatchAnalysisRequest,
+    SupplementRecommendation,
+)
+
+ANSWERS = {"age": 35, "gender": "female", "symptoms": ["усталость"], "goals": ["энергия"]}
+
+
+def make_request(user: str) -> AnalysisRequest:
+    return AnalysisRequest(form_id=f"form_{user}", user_id=user, answers=ANSWERS)
+
+
+def alice_result() -> AIAnalysisResponse:
+    return AIAnalysisResponse(
+        analysis_id="analysis_form_alice_1700000000",
+        recommended_supplements={
+            "vitamin_d": SupplementRecommendation(
+                name="Витамин D3", dose="2000 МЕ", duration="2 месяца", priority="high"
+            )
+        },
+        recommendations_text="Рекомендуется витамин D",
+        confidence=0.9,
+        processing_time_ms=4321,
+        source="ai",
+    )
+
+
+@pytest.fixture
+async def cached(service) -> AIAnalysisResponse:
+    """Результат alice в кэше под ключом общих для всех анкет ответов"""
+    result = alice_result()
+    cache_key = service._fingerprinter.fingerprint(ANSWERS).key
+    await service.cache_service.store_analysis(cache_key, result)
+    return result
+
+
+def assert_reissued(result: AIAnalysisResponse, user: str) -> None:
+    assert result.analysis_id.startswith(f"analysis_form_{user}_")
+    assert result.processing_time_ms != 4321
+    assert result.recommendations_text == "Рекомендуется витамин D"
+
+
+async def test_cache_hit_gets_own_analysis_id(service, cached):
+    result = await service.analyze_medical_form(make_request("bob"))
+
+    assert_reissued(result, "bob")
+
+
+async def test_batch_cache_hits_and_duplicates_get_own_analysis_ids(service, cached):
+    batch = BatchAnalysisRequest(requests=[make_request("bob"), make_request("carol")])
+
+    response = await service.analyze_batch(batch)
+
+    assert_reissued(response.results[0], "bob")
+    assert_reissued(response.results[1], "carol")
+
+
+async def test_stream_cache_hit_gets_own_analysis_id(service, cached):
+    events = [event async for event in service.stream_medical_form(make_request("carol"))]
+
+    name, data = events[-1]
+    assert name == "result"
+    assert_reissued(AIAnalysisResponse.model_validate(data), "carol")
+
+
+async def test_in_flight_result_is_reissued_to_waiter(service, monkeypatch):
+    release = asyncio.Event()
+    calls = 0
+
+    async def run_analysis(request, cache_key, start_time, deadline=None):
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return alice_result()
+
+    monkeypatch.setattr(service, "_run_analysis", run_analysis)
+    alice = asyncio.create_task(service.analyze_medical_form(make_request("alice")))
+    bob = asyncio.create_task(service.analyze_medical_form(make_request("bob")))
+    await asyncio.sleep(0.01)
+    release.set()
+
+    assert (await alice).analysis_id == "analysis_form_alice_1700000000"
+    assert_reissued(await bob, "bob")
+    assert calls == 1
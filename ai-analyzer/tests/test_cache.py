@@ -0,0 +1,61 @@
+"""
+Локальный кэш анализов (L1): LRU, время жизни и лимит по объему
+"""
+from app.services.cache_service import LocalAnalysisCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LocalAnalysisCache(max_entries=2, max_bytes=1024, ttl_seconds=60)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    assert cache.get("a") == b"1"  # "a" становится самой свежей
+
+    cache.set("c", b"3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert cache.get("c") == b"3"
+    assert cache.evictions == 1
+
+
+def test_byte_limit_evicts_until_within_budget():
+    cache = LocalAnalysisCache(max_entries=100, max_bytes=10, ttl_seconds=60)
+    cache.set("a", b"xxxx")
+    cache.set("b", b"yyyy")
+    cache.set("c", b"zzzz")
+
+    assert len(cache) == 2
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 8
+
+
+def test_entry_larger_than_budget_is_not_cached():
+    cache = LocalAnalysisCache(max_entries=100, max_bytes=4, ttl_seconds=60)
+    cache.set("a", b"ok")
+
+    assert cache.set("big", b"too large") is False
+    assert cache.get("a") == b"ok"
+
+
+def test_overwrite_keeps_byte_accounting():
+    cache = LocalAnalysisCache(max_entries=10, max_bytes=100, ttl_seconds=60)
+    cache.set("a", b"12345")
+    cache.set("a", b"12")
+
+    assert cache.stats()["bytes"] == 2
+    assert len(cache) == 1
+
+
+def test_expired_entry_is_dropped(clock):
+    cache = LocalAnalysisCache(max_entries=10, max_bytes=100, ttl_seconds=60, clock=clock)
+    cache.set("default", b"1")
+    cache.set("short", b"2", ttl_seconds=5)
+
+    clock.advance(10)
+    assert cache.get("short") is None
+    assert cache.get("default") == b"1"
+
+    clock.advance(60)
+    assert cache.get("default") is None
+    assert cache.expirations == 2
+    assert cache.stats()["bytes"] == 0
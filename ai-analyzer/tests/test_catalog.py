@@ -0,0 +1,38 @@
+"""
+Снимок каталога БАДов и его индексы
+"""
+from app.services.catalog import BUILTIN_CATALOG, CatalogSnapshot, CatalogStore
+from app.services.database_service import DatabaseService
+
+
+def unavailable_pool():
+    raise AssertionError("без CATALOG_DB_ENABLED каталог не читается из базы")
+
+
+def test_snapshot_indexes():
+    snapshot = CatalogSnapshot(BUILTIN_CATALOG, version=1, source="builtin")
+
+    assert snapshot.by_id["zinc"]["name"] == "Цинк"
+    assert [item["id"] for item in snapshot.by_tag["иммунитет"]] == ["vitamin_d3", "zinc"]
+    assert [item["id"] for item in snapshot.by_category["minerals"]] == ["magnesium", "zinc"]
+
+
+async def test_builtin_catalog_does_not_touch_database():
+    store = CatalogStore(pool_getter=unavailable_pool, enabled=False)
+
+    await store.start()
+
+    assert store.snapshot.source == "builtin"
+    assert not await store.refresh()
+    assert not store.preload()
+    assert store.stats()["errors"] == 0
+
+
+async def test_database_service_lookups():
+    service = DatabaseService(CatalogStore(enabled=False))
+
+    assert (await service.get_supplement("omega_3"))["name"] == "Омега-3"
+    assert await service.get_supplement("missing") is None
+    assert len(await service.get_supplements_by_tag("  Нервы ")) == 2
+    assert len(await service.get_supplements_by_category("vitamins")) == 2
+    assert await service.get_supplements_by_category("herbs") == ()
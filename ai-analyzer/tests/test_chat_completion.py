@@ -0,0 +1,128 @@
+"""
+Вызов DeepSeek chat.completions: повторы временных ошибок, дедлайн, circuit breaker и учет ошибок
+"""
+import random
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+from prometheus_client import REGISTRY
+
+from app.core.config import settings
+from app.core.deadline import Deadline
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.rate_limiter import LimiterTimeoutError
+
+MESSAGES = [{"role": "user", "content": "анкета"}]
+API_REQUEST = httpx.Request("POST", "https://api.deepseek.test/chat/completions")
+RESPONSE = SimpleNamespace(usage=None)
+
+
+def status_error(error_cls, status_code: int, headers=None):
+    response = httpx.Response(status_code, headers=headers, request=API_REQUEST)
+    return error_cls("provider error", response=response, body=None)
+
+
+class FakeCompletions:
+    """Отдает ошибки из outcomes по очереди, затем успешный ответ"""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def create(self, **params):
+        self.calls += 1
+        if self.outcomes:
+            raise self.outcomes.pop(0)
+        return RESPONSE
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(random, "uniform", lambda a, b: 0.0)
+
+
+def use_client(service, *outcomes) -> FakeCompletions:
+    completions = FakeCompletions(outcomes)
+    service.deepseek_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return completions
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        status_error(openai.InternalServerError, 503),
+        openai.APIConnectionError(request=API_REQUEST),
+        openai.APITimeoutError(request=API_REQUEST),
+        status_error(openai.RateLimitError, 429),
+    ],
+    ids=["5xx", "connection", "timeout", "429"],
+)
+async def test_transient_error_is_retried(service, error):
+    completions = use_client(service, error)
+
+    assert await service._chat_completion(messages=MESSAGES) is RESPONSE
+    assert completions.calls == 2
+
+
+async def test_retries_are_bounded(service, monkeypatch):
+    monkeypatch.setattr(settings, "DEEPSEEK_MAX_RETRIES", 2)
+    completions = use_client(
+        service, *(status_error(openai.InternalServerError, 500) for _ in range(3))
+    )
+
+    with pytest.raises(openai.InternalServerError):
+        await service._chat_completion(messages=MESSAGES)
+    assert completions.calls == 3
+
+
+async def test_client_error_is_not_retried(service):
+    completions = use_client(service, status_error(openai.BadRequestError, 400))
+
+    with pytest.raises(openai.BadRequestError):
+        await service._chat_completion(messages=MESSAGES)
+    assert completions.calls == 1
+
+
+async def test_retry_after_beyond_deadline_fails_fast(service):
+    completions = use_client(
+        service, status_error(openai.InternalServerError, 503, headers={"retry-after": "30"})
+    )
+
+    with pytest.raises(openai.InternalServerError):
+        await service._chat_completion(Deadline(1.0), messages=MESSAGES)
+    assert completions.calls == 1
+
+
+async def test_open_circuit_stops_retries(service):
+    service._breaker = CircuitBreaker("test", failure_rate=0.5, min_calls=1)
+    completions = use_client(service, openai.APIConnectionError(request=API_REQUEST))
+
+    with pytest.raises(CircuitOpenError):
+        await service._chat_completion(messages=MESSAGES)
+    assert completions.calls == 1
+
+
+async def test_limiter_timeout_is_not_provider_error(service, clock):
+    service._breaker = CircuitBreaker("test", failure_rate=0.5, min_calls=1, clock=clock)
+    labels = {"type": "LimiterTimeoutError"}
+    errors_before = REGISTRY.get_sample_value("ai_deepseek_errors_total", labels) or 0.0
+
+    service._record_provider_error(LimiterTimeoutError("очередь ограничителя"))
+
+    assert (REGISTRY.get_sample_value("ai_deepseek_errors_total", labels) or 0.0) == errors_before
+    assert service.get_health()["deepseek_circuit"] == "closed"
+
+
+async def test_health_reports_half_open_after_open_seconds(service, clock):
+    service._breaker = CircuitBreaker(
+        "test", failure_rate=0.5, min_calls=1, open_seconds=30, clock=clock
+    )
+    service._breaker.before_call()
+    service._breaker.record_failure()
+    assert service.get_health()["deepseek_circuit"] == "open"
+
+    clock.advance(31)
+
+    assert service.get_health()["deepseek_circuit"] == "half_open"
@@ -0,0 +1,113 @@
+"""
+Переходы circuit breaker: closed -> open -> half_open -> closed/open
+"""
+import pytest
+
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+def make_breaker(clock) -> CircuitBreaker:
+    return CircuitBreaker(
+        "test", failure_rate=0.5, window_seconds=60, min_calls=4, open_seconds=30,
+        half_open_probes=1, clock=clock,
+    )
+
+
+def open_breaker(breaker: CircuitBreaker) -> None:
+    for _ in range(4):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_stays_closed_below_min_calls(clock):
+    breaker = make_breaker(clock)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+
+    assert breaker.state == "closed"
+
+
+def test_stays_closed_below_failure_rate(clock):
+    breaker = make_breaker(clock)
+    for success in (True, True, True, False, True):
+        breaker.before_call()
+        breaker.record_success() if success else breaker.record_failure()
+
+    assert breaker.state == "closed"
+
+
+def test_opens_and_rejects_calls(clock):
+    breaker = make_breaker(clock)
+    open_breaker(breaker)
+
+    assert breaker.state == "open"
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.stats()["rejected"] == 1
+    assert breaker.stats()["opened"] == 1
+
+
+def test_failures_outside_window_are_forgotten(clock):
+    breaker = make_breaker(clock)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    clock.advance(61)
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == "closed"
+
+
+def test_half_open_allows_limited_probes_and_closes_on_success(clock):
+    breaker = make_breaker(clock)
+    open_breaker(breaker)
+    clock.advance(31)
+    assert not breaker.is_open
+
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.stats()["window_calls"] == 0
+
+
+def test_failed_probe_reopens(clock):
+    breaker = make_breaker(clock)
+    open_breaker(breaker)
+    clock.advance(31)
+
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert breaker.stats()["opened"] == 2
+
+
+def test_ignored_probe_frees_the_slot(clock):
+    breaker = make_breaker(clock)
+    open_breaker(breaker)
+    clock.advance(31)
+
+    breaker.before_call()
+    breaker.record_ignored()
+    breaker.before_call()
+
+    assert breaker.state == "half_open"
+
+
+def test_stats_report_half_open_after_open_seconds(clock):
+    breaker = make_breaker(clock)
+    open_breaker(breaker)
+    assert breaker.stats()["state"] == "open"
+
+    clock.advance(31)
+
+    assert breaker.stats()["state"] == "half_open"
+    breaker.before_call()
+    assert breaker.state == "half_open"
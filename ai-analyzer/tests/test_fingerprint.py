@@ -0,0 +1,66 @@
+"""
+Каноническая форма анкеты и ключ кэша
+"""
+from app.core.config import settings
+from app.services.fingerprint import AnswersFingerprinter, canonicalize_answers
+
+ANSWERS = {
+    "age": 35,
+    "gender": "female",
+    "weight": 70.0,
+    "height": 168,
+    "symptoms": ["Усталость", "выпадение волос"],
+    "goals": ["energy"],
+}
+
+
+def test_canonical_form_ignores_case_whitespace_order_and_duplicates():
+    noisy = dict(
+        ANSWERS,
+        symptoms=["  Выпадение   волос", "усталость", "УСТАЛОСТЬ", ""],
+        weight=70,
+    )
+
+    assert canonicalize_answers(noisy) == canonicalize_answers(ANSWERS)
+    assert canonicalize_answers(noisy)["symptoms"] == ["выпадение волос", "усталость"]
+
+
+def test_fields_outside_prompt_are_dropped():
+    answers = dict(ANSWERS, lifestyle={"sleep": 7}, comment="лишнее")
+
+    assert canonicalize_answers(answers) == canonicalize_answers(ANSWERS)
+
+
+def test_empty_lists_are_dropped():
+    assert "chronic_diseases" not in canonicalize_answers(dict(ANSWERS, chronic_diseases=[]))
+
+
+def test_numeric_buckets(monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_AGE_BUCKET", 5)
+
+    assert canonicalize_answers(dict(ANSWERS, age=31))["age"] == 30
+    assert canonicalize_answers(dict(ANSWERS, age=34))["age"] == 30
+    assert canonicalize_answers(dict(ANSWERS, age=35))["age"] == 35
+
+
+def test_equivalent_answers_share_key():
+    fingerprinter = AnswersFingerprinter(secret="secret", prompt_version="1", model="m")
+    noisy = dict(ANSWERS, goals=["ENERGY", "energy"], lifestyle={"sport": True})
+
+    first = fingerprinter.fingerprint(ANSWERS)
+    second = fingerprinter.fingerprint(noisy)
+
+    assert first.key == second.key
+    assert second.normalized
+    assert fingerprinter.stats()["fingerprints"] == 2
+
+
+def test_key_depends_on_answers_prompt_version_model_and_secret():
+    base = AnswersFingerprinter(secret="secret", prompt_version="1", model="m")
+    key = base.fingerprint(ANSWERS).key
+
+    assert base.fingerprint(dict(ANSWERS, age=36)).key != key
+    assert AnswersFingerprinter("secret", "2", "m").fingerprint(ANSWERS).key != key
+    assert AnswersFingerprinter("secret", "1", "other").fingerprint(ANSWERS).key != key
+    assert AnswersFingerprinter("other", "1", "m").fingerprint(ANSWERS).key != key
+    assert key.startswith("p1:")
@@ -0,0 +1,162 @@
+"""
+Хранилище асинхронных задач анализа: статусы, аренда и восстановление
+"""
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.schemas.response import AIAnalysisResponse, AnalysisRequest
+from app.services.job_service import AnalysisJobQueue, AnalysisJobStore
+
+REQUEST = AnalysisRequest(form_id="form-1", user_id="user-1", answers={"age": 30})
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = AnalysisJobStore(str(tmp_path / "jobs.sqlite3"))
+    store.open()
+    yield store
+    store.close()
+
+
+def test_created_job_is_pending(store):
+    store.create("job-1", REQUEST)
+
+    job = store.get("job-1")
+    assert job.status == "pending"
+    assert job.progress == 0
+    assert store.pending() == ["job-1"]
+    assert store.get_request("job-1") == REQUEST
+    assert store.get("missing") is None
+
+
+def test_claim_is_exclusive(store):
+    store.create("job-1", REQUEST)
+
+    assert store.claim("job-1", "worker-a")
+    assert not store.claim("job-1", "worker-b")
+    assert store.get("job-1").status == "processing"
+    assert store.pending() == []
+
+
+def test_completed_job_keeps_result(store):
+    store.create("job-1", REQUEST)
+    store.claim("job-1", "worker-a")
+    result = AIAnalysisResponse(
+        recommended_supplements={}, recommendations_text="ok", analysis_id="job-1"
+    )
+
+    assert store.update("job-1", "worker-a", "completed", 100, result=result)
+
+    job = store.get("job-1")
+    assert job.status == "completed"
+    assert job.progress == 100
+    assert job.result.recommendations_text == "ok"
+
+
+def test_failed_job_keeps_message(store):
+    store.create("job-1", REQUEST)
+    store.claim("job-1", "worker-a")
+
+    assert store.update("job-1", "worker-a", "failed", 100, message="DeepSeek недоступен")
+
+    job = store.get("job-1")
+    assert job.status == "failed"
+    assert job.message == "DeepSeek недоступен"
+    assert job.result is None
+
+
+def test_only_owner_updates_processing_job(store):
+    store.create("job-1", REQUEST)
+
+    assert not store.update("job-1", "worker-a", "completed", 100)
+    store.claim("job-1", "worker-a")
+    assert not store.update("job-1", "worker-b", "completed", 100)
+    assert not store.renew("job-1", "worker-b")
+    assert store.renew("job-1", "worker-a")
+
+    store.update("job-1", "worker-a", "failed", 100)
+    assert not store.update("job-1", "worker-a", "completed", 100)
+    assert store.get("job-1").status == "failed"
+
+
+def test_release_returns_owner_jobs_to_pending(store):
+    for job_id in ("job-1", "job-2"):
+        store.create(job_id, REQUEST)
+    store.claim("job-1", "worker-a")
+    store.claim("job-2", "worker-b")
+
+    assert store.release("worker-a") == 1
+    assert store.pending() == ["job-1"]
+    assert store.claim("job-1", "worker-c")
+
+
+def test_expired_lease_is_recovered(store):
+    store.create("job-1", REQUEST)
+    store.claim("job-1", "dead-worker")
+
+    assert store.recover_expired(datetime.now() - timedelta(minutes=1)) == 0
+    assert store.recover_expired(datetime.now() + timedelta(seconds=1)) == 1
+    assert store.pending() == ["job-1"]
+    # Старый владелец больше не может записать результат
+    assert not store.update("job-1", "dead-worker", "completed", 100)
+
+
+def test_purge_removes_only_finished_jobs(store):
+    for job_id in ("job-1", "job-2"):
+        store.create(job_id, REQUEST)
+    store.claim("job-1", "worker-a")
+    store.update("job-1", "worker-a", "completed", 100)
+
+    assert store.purge(datetime.now() + timedelta(seconds=1)) == 1
+    assert store.get("job-1") is None
+    assert store.get("job-2") is not None
+
+
+def test_database_without_owner_column_is_migrated(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE analysis_jobs (analysis_id TEXT PRIMARY KEY, status TEXT NOT NULL, "
+        "progress INTEGER NOT NULL DEFAULT 0, message TEXT, request_json TEXT NOT NULL, "
+        "result_json TEXT, created_at TEXT NOT NULL, updated_at TEXT NOT NULL)"
+    )
+    conn.close()
+
+    store = AnalysisJobStore(path)
+    store.open()
+    try:
+        store.create("job-1", REQUEST)
+        assert store.claim("job-1", "worker-a")
+    finally:
+        store.close()
+
+
+class FakeAnalyzer:
+    async def analyze_medical_form(self, request, raise_on_error=False):
+        return AIAnalysisResponse(
+            recommended_supplements={}, recommendations_text="ok", analysis_id="job-1"
+        )
+
+
+async def test_running_queue_recovers_job_of_crashed_owner(store, monkeypatch):
+    monkeypatch.setattr(settings, "JOBS_LEASE_SECONDS", 0.2)
+    queue = AnalysisJobQueue(FakeAnalyzer(), store)
+    await queue.start()
+    try:
+        # Воркер другого процесса забрал задачу уже после старта очереди и упал
+        store.create("job-1", REQUEST)
+        store.claim("job-1", "dead-worker")
+
+        for _ in range(50):
+            await asyncio.sleep(0.05)
+            if store.get("job-1").status == "completed":
+                break
+
+        assert store.get("job-1").status == "completed"
+        assert queue.stats()["recovered"] == 1
+    finally:
+        await queue.close()
@@ -0,0 +1,49 @@
+"""
+Выборочное логирование горячего пути
+"""
+from loguru import logger
+
+from app.core.config import settings
+from app.core.logging import sampled
+
+
+class FormatCounter:
+    """Аргумент сообщения, считающий, сколько раз его отформатировали"""
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __format__(self, spec: str) -> str:
+        self.formatted += 1
+        return "value"
+
+
+def capture():
+    records = []
+    handler_id = logger.add(lambda message: records.append(message.record), level="DEBUG")
+    return records, handler_id
+
+
+def test_dropped_message_is_not_formatted(monkeypatch):
+    monkeypatch.setitem(settings.LOG_SAMPLE_RATES, "test", 0.0)
+    records, handler_id = capture()
+    argument = FormatCounter()
+    try:
+        sampled("test").info("value={}", argument)
+    finally:
+        logger.remove(handler_id)
+
+    assert records == []
+    assert argument.formatted == 0
+
+
+def test_kept_message_points_to_caller(monkeypatch):
+    monkeypatch.setitem(settings.LOG_SAMPLE_RATES, "test", 1.0)
+    records, handler_id = capture()
+    try:
+        sampled("test").info("value={value}", value=1)
+    finally:
+        logger.remove(handler_id)
+
+    assert records[0]["message"] == "value=1"
+    assert records[0]["function"] == "test_kept_message_points_to_caller"
@@ -0,0 +1,105 @@
+"""
+Адаптивный ограничитель запросов к DeepSeek (AIMD)
+"""
+import asyncio
+
+import pytest
+
+from app.services.rate_limiter import AdaptiveLimiter, LimiterTimeoutError, parse_retry_after
+
+
+def make_limiter(**kwargs) -> AdaptiveLimiter:
+    options = dict(
+        requests_per_minute=6000, tokens_per_minute=1_000_000,
+        initial_window=4, min_window=1, max_window=8,
+    )
+    options.update(kwargs)
+    return AdaptiveLimiter(**options)
+
+
+def test_success_grows_window_additively():
+    limiter = make_limiter()
+    for _ in range(4):
+        limiter.on_success()
+
+    # +1/window за каждый успех: после 4 успехов окно вырастает примерно на 1
+    assert 4.9 < limiter.window < 5.0
+
+
+def test_window_is_capped_by_max():
+    limiter = make_limiter(initial_window=8)
+    limiter.on_success()
+
+    assert limiter.window == 8
+
+
+def test_overload_halves_window_down_to_min():
+    limiter = make_limiter()
+    limiter.on_overload()
+    assert limiter.window == 2
+    limiter.on_overload()
+    limiter.on_overload()
+    assert limiter.window == 1
+    assert limiter.overloads == 3
+
+
+async def test_window_bounds_concurrency():
+    limiter = make_limiter(initial_window=2)
+    await limiter.acquire(10)
+    await limiter.acquire(10)
+
+    with pytest.raises(LimiterTimeoutError):
+        await limiter.acquire(10, timeout=0.05)
+    assert limiter.stats()["acquire_timeouts"] == 1
+
+
+async def test_release_wakes_waiter():
+    limiter = make_limiter(initial_window=1)
+    entered = asyncio.Event()
+    release = asyncio.Event()
+
+    async def hold() -> None:
+        async with limiter.slot(10):
+            entered.set()
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await entered.wait()
+    waiter = asyncio.create_task(limiter.acquire(10, timeout=1))
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+
+    release.set()
+    await asyncio.wait_for(waiter, 1)
+    await holder
+    assert limiter.in_flight == 1
+
+
+async def test_free_slot_is_granted_with_zero_timeout():
+    limiter = make_limiter()
+    await limiter.acquire(10, timeout=0)
+
+    assert limiter.in_flight == 1
+
+
+async def test_retry_after_pauses_acquire():
+    limiter = make_limiter()
+    limiter.on_overload(retry_after=30)
+
+    assert limiter.stats()["paused_for"] > 29
+    with pytest.raises(LimiterTimeoutError):
+        await limiter.acquire(10, timeout=0.01)
+
+
+async def test_token_budget_limits_requests():
+    limiter = make_limiter(tokens_per_minute=100)
+    await limiter.acquire(100)
+
+    with pytest.raises(LimiterTimeoutError):
+        await limiter.acquire(50, timeout=0.01)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("5") == 5
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("not a date") is None
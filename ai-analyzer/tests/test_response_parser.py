@@ -0,0 +1,103 @@
+"""
+Устойчивый разбор ответа DeepSeek
+"""
+import json
+
+import pytest
+
+from app.services.response_parser import (
+    DEFAULT_DURATION,
+    ResponseParseError,
+    ResponseParser,
+    extract_json_object,
+)
+
+RESPONSE = {
+    "text": "Рекомендуется витамин D",
+    "confidence": 0.9,
+    "recommendations": {
+        "vitamin_d": {
+            "name": "Витамин D3", "dose": "2000 МЕ", "duration": "2 месяца", "priority": "high",
+        },
+        "magnesium": {
+            "name": "Магний", "dose": "400 мг", "duration": "1 месяц", "priority": "medium",
+        },
+    },
+}
+
+
+def test_clean_json():
+    data, method = extract_json_object(json.dumps(RESPONSE))
+
+    assert data == RESPONSE
+    assert method == "clean"
+
+
+def test_json_in_fences_and_prose():
+    fenced = "```json\n" + json.dumps(RESPONSE) + "\n```"
+    assert extract_json_object(fenced) == (RESPONSE, "extracted")
+
+    wrapped = "Вот результат анализа:\n" + json.dumps(RESPONSE) + "\nБудьте здоровы!"
+    assert extract_json_object(wrapped) == (RESPONSE, "extracted")
+
+
+def test_truncated_json_keeps_complete_recommendations():
+    content = json.dumps(RESPONSE, ensure_ascii=False)
+    truncated = content[:content.index('"Магний"') + 5]
+
+    data, method = extract_json_object(truncated)
+
+    assert method == "truncated"
+    assert list(data["recommendations"]) == ["vitamin_d"]
+
+
+def test_no_json_raises():
+    with pytest.raises(ResponseParseError):
+        extract_json_object("модель ответила текстом без JSON")
+
+
+def test_parse_normalizes_aliases_and_defaults():
+    parser = ResponseParser()
+    content = json.dumps({
+        "text": "ok",
+        "confidence": 85,
+        "recommendations": [
+            {"id": "omega", "title": "Омега-3", "dosage": "1 г", "priority": "HIGH"},
+        ],
+    })
+
+    result = parser.parse(content)
+
+    omega = result["supplements"]["omega"]
+    assert omega.name == "Омега-3"
+    assert omega.dose == "1 г"
+    assert omega.duration == DEFAULT_DURATION
+    assert omega.priority == "high"
+    assert result["confidence"] == 0.85
+    assert result["source"] == "ai"
+
+
+def test_parse_drops_only_invalid_recommendations():
+    parser = ResponseParser()
+    content = json.dumps({
+        "text": "ok",
+        "recommendations": {
+            "good": {"name": "Цинк", "dose": "15 мг"},
+            "bad": {"dose": "без названия"},
+        },
+    })
+
+    result = parser.parse(content)
+
+    assert list(result["supplements"]) == ["good"]
+    assert parser.stats()["items_dropped"] == 1
+
+
+def test_parse_without_text_and_recommendations_fails():
+    parser = ResponseParser()
+
+    with pytest.raises(ResponseParseError):
+        parser.parse('{"recommendations": {}}')
+    with pytest.raises(ResponseParseError):
+        parser.parse(None)
+    assert parser.stats()["failed"] == 2
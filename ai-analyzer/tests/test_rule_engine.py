@@ -0,0 +1,112 @@
+"""
+Rule-based подбор БАДов и горячая перезагрузка правил
+"""
+import json
+import os
+
+import pytest
+
+from app.services.rule_engine import RuleEngine, RuleSetError, CompiledRuleSet
+
+SUPPLEMENTS = {
+    "vitamin_d": {"name": "Витамин D3", "dose": "2000 МЕ", "priority": "high"},
+    "magnesium": {"name": "Магний", "dose": "400 мг", "requires_catalog": False},
+}
+CATALOG = ({"id": "vitamin_d", "name": "Витамин D3"},)
+
+
+def rules_data(version: int, weight: float = 0.8) -> dict:
+    return {
+        "version": version,
+        "threshold": 0.6,
+        "max_recommendations": 5,
+        "supplements": SUPPLEMENTS,
+        "rules": [
+            {"id": "fatigue_d", "supplement": "vitamin_d", "weight": weight,
+             "when": {"symptoms": ["усталость"], "age_min": 18}},
+            {"id": "stress_mg", "supplement": "magnesium", "weight": 0.7,
+             "when": {"symptoms": ["стресс", "бессонница"]}},
+        ],
+    }
+
+
+def write_rules(path, data, mtime: float) -> None:
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def rules_path(tmp_path):
+    path = tmp_path / "rules.json"
+    write_rules(path, rules_data(1), mtime=1_000_000)
+    return path
+
+
+def test_evaluate_matches_terms_age_and_catalog(rules_path):
+    engine = RuleEngine(str(rules_path), reload_interval=0)
+
+    result = engine.evaluate({"age": 30, "symptoms": ["  Усталость ", "Стресс"]}, CATALOG)
+    assert list(result) == ["vitamin_d", "magnesium"]
+    assert result["vitamin_d"].confidence == 0.8
+
+    assert list(engine.evaluate({"age": 16, "symptoms": ["усталость"]}, CATALOG)) == []
+    assert list(engine.evaluate({"age": 30, "symptoms": ["усталость"]}, ())) == []
+
+
+def test_evaluate_batch_matches_single_evaluation(rules_path):
+    engine = RuleEngine(str(rules_path), reload_interval=0)
+    profiles = [
+        {"age": 30, "symptoms": ["усталость"]},
+        {"symptoms": ["бессонница"]},
+        {"age": 40, "goals": ["энергия"]},
+    ]
+
+    assert engine.evaluate_batch(profiles, CATALOG) == [
+        engine.evaluate(profile, CATALOG) for profile in profiles
+    ]
+
+
+def test_changed_file_is_reloaded(rules_path):
+    engine = RuleEngine(str(rules_path), reload_interval=0)
+    profile = {"age": 30, "symptoms": ["усталость"]}
+
+    write_rules(rules_path, rules_data(2, weight=0.9), mtime=1_000_100)
+    result = engine.evaluate(profile, CATALOG)
+
+    assert engine.rules.version == 2
+    assert engine.reloads == 1
+    assert result["vitamin_d"].confidence == 0.9
+
+
+def test_broken_file_keeps_previous_rules(rules_path):
+    engine = RuleEngine(str(rules_path), reload_interval=0)
+
+    rules_path.write_text("{not json", encoding="utf-8")
+    os.utime(rules_path, (1_000_100, 1_000_100))
+    engine.evaluate({"symptoms": ["стресс"]}, CATALOG)
+    engine.evaluate({"symptoms": ["стресс"]}, CATALOG)
+
+    assert engine.rules.version == 1
+    assert engine.reload_errors == 1  # ошибочный файл не перечитывается повторно
+
+    write_rules(rules_path, rules_data(3), mtime=1_000_200)
+    engine.evaluate({"symptoms": ["стресс"]}, CATALOG)
+    assert engine.rules.version == 3
+
+
+def test_reload_interval_throttles_checks(rules_path):
+    engine = RuleEngine(str(rules_path), reload_interval=3600)
+    engine.evaluate({"symptoms": ["стресс"]}, CATALOG)
+
+    write_rules(rules_path, rules_data(2), mtime=1_000_100)
+    engine.evaluate({"symptoms": ["стресс"]}, CATALOG)
+
+    assert engine.rules.version == 1
+
+
+def test_unknown_supplement_is_rejected():
+    data = rules_data(1)
+    data["rules"][0]["supplement"] = "unknown"
+
+    with pytest.raises(RuleSetError):
+        CompiledRuleSet(data)
@@ -0,0 +1,64 @@
+"""
+Общий кэш (L2) в Redis: чтение, прогрев L1 и нечитаемые записи
+"""
+import zlib
+
+import pytest
+from fakeredis import FakeAsyncRedis
+
+from app.schemas.response import AIAnalysisResponse
+from app.services.cache_service import CacheService, LocalAnalysisCache, RedisAnalysisCache
+
+RESULT = AIAnalysisResponse(
+    analysis_id="analysis_form_1_1700000000",
+    recommended_supplements={},
+    recommendations_text="Рекомендации",
+    confidence=0.8,
+)
+
+
+@pytest.fixture
+async def shared():
+    shared = RedisAnalysisCache(url="redis://localhost:6379/0", key_prefix="test:", ttl_seconds=60)
+    shared._client = FakeAsyncRedis()
+    yield shared
+    await shared.close()
+
+
+@pytest.fixture
+def cache(shared) -> CacheService:
+    return CacheService(local_cache=LocalAnalysisCache(), shared_cache=shared)
+
+
+async def test_l2_hit_warms_l1(cache, shared):
+    await cache.store_analysis("key", RESULT)
+    cache._local.clear()
+
+    assert await cache.get_analysis("key") == RESULT
+    assert cache._local.get("key") is not None
+    assert shared.hits == 1
+
+
+@pytest.mark.parametrize("stored", [
+    b"\x01garbage",
+    b"\x01" + zlib.compress(b'{"truncated": '),
+    b"\x01" + zlib.compress(b'{"analysis_id": "old schema"}'),
+], ids=["corrupt", "truncated_json", "old_schema"])
+async def test_unreadable_l2_entry_is_a_miss_and_removed(cache, shared, stored):
+    await shared._client.set("test:key", stored)
+
+    assert await cache.get_analysis("key") is None
+    assert await shared._client.exists("test:key") == 0
+    assert shared.invalid == 1
+
+    # Новый анализ перезаписывает ключ и снова читается
+    await cache.store_analysis("key", RESULT)
+    cache._local.clear()
+    assert await cache.get_analysis("key") == RESULT
+
+
+async def test_unreadable_l1_entry_is_removed(cache):
+    cache._local.set("key", b'{"analysis_id": "old schema"}')
+
+    assert await cache.get_analysis("key") is None
+    assert cache._local.get("key") is None
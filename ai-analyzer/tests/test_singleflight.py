@@ -0,0 +1,99 @@
+"""
+Объединение одинаковых одновременных вызовов (SingleFlight)
+"""
+import asyncio
+
+import pytest
+
+from app.services.singleflight import FlightAbandonedError, SingleFlight
+
+
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def work() -> str:
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "result"
+
+    waiters = [asyncio.create_task(flight.do("key", work)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*waiters) == ["result"] * 5
+    assert calls == 1
+    assert flight.stats() == {
+        "in_flight": 0, "leaders": 1, "suppressed": 4, "remote_suppressed": 0
+    }
+
+
+async def test_error_is_shared_and_key_is_forgotten():
+    flight = SingleFlight()
+
+    async def fail() -> None:
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        await flight.do("key", fail)
+
+    async def succeed() -> str:
+        return "ok"
+
+    assert await flight.do("key", succeed) == "ok"
+
+
+async def test_cancelled_waiter_does_not_cancel_others():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def work() -> str:
+        await release.wait()
+        return "result"
+
+    first = asyncio.create_task(flight.do("key", work))
+    second = asyncio.create_task(flight.do("key", work))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await second == "result"
+    assert first.cancelled()
+
+
+async def test_lead_resolves_waiters():
+    flight = SingleFlight()
+    leader = flight.lead("key")
+    assert leader is not None
+    assert flight.lead("key") is None
+
+    async def never_called() -> str:
+        raise AssertionError("ключ уже выполняется")
+
+    waiter = asyncio.create_task(flight.do("key", never_called))
+    await asyncio.sleep(0)
+    leader.set_result("streamed")
+
+    assert await waiter == "streamed"
+
+
+async def test_abandoned_lead_is_rerun_by_a_waiter():
+    flight = SingleFlight()
+    leader = flight.lead("key")
+    calls = 0
+
+    async def work() -> str:
+        nonlocal calls
+        calls += 1
+        return "rerun"
+
+    waiters = [asyncio.create_task(flight.do("key", work)) for _ in range(3)]
+    await asyncio.sleep(0)
+    leader.set_exception(FlightAbandonedError("key"))
+
+    assert await asyncio.gather(*waiters) == ["rerun"] * 3
+    assert calls == 1
@@ -0,0 +1,87 @@
+"""
+Фоновый старт сервисов и проверки готовности
+"""
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import main
+from app.database import connection
+
+
+@pytest.fixture
+async def app(service):
+    main.app.state.ai_service = service
+    main.app.state.startup_error = None
+    yield main.app
+    await service.close()
+
+
+async def get(app, path: str) -> httpx.Response:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as client:
+        return await client.get(path)
+
+
+async def test_failed_step_does_not_block_other_services(app, monkeypatch):
+    async def broken_database():
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(main, "init_db", broken_database)
+
+    await main.start_services(app)
+
+    assert app.state.ai_service.ready
+    assert app.state.ai_service.jobs.started
+    assert "database: OSError" in app.state.startup_error
+
+
+async def test_readiness_does_not_depend_on_database(app, monkeypatch):
+    async def database_down():
+        return False
+
+    monkeypatch.setattr(main, "check_db_connection", database_down)
+
+    response = await get(app, "/health/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "starting"
+
+    app.state.ai_service.ready = True
+    response = await get(app, "/health/ready")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready", "database_connected": False}
+
+    assert (await get(app, "/health/live")).status_code == 200
+
+
+async def test_readiness_reports_startup_error(app, monkeypatch):
+    async def database_down():
+        return False
+
+    monkeypatch.setattr(main, "check_db_connection", database_down)
+    app.state.startup_error = "ai_service: RuntimeError: boom"
+
+    response = await get(app, "/health/ready")
+
+    assert response.status_code == 503
+    assert response.json()["status"] == "failed"
+
+
+async def test_database_check_tracks_outage(monkeypatch):
+    class FailingConnection:
+        async def __aenter__(self):
+            raise OSError("connection lost")
+
+        async def __aexit__(self, *exc_info):
+            return False
+
+    pool = SimpleNamespace(connection=lambda timeout: FailingConnection())
+    monkeypatch.setattr(connection, "_pool", pool)
+    monkeypatch.setattr(connection, "_connected", True)
+
+    assert not await connection.check_db_connection()
+    assert not connection._connected
+
+    monkeypatch.setattr(connection, "_pool", None)
+    assert not await connection.check_db_connection()
@@ -0,0 +1,52 @@
+"""
+Потоковое извлечение поля text из JSON ответа
+"""
+import json
+
+from app.services.stream_parser import JsonStringFieldStreamer
+
+
+def stream(document: str, chunk_size: int) -> str:
+    streamer = JsonStringFieldStreamer("text")
+    parts = [
+        streamer.feed(document[i:i + chunk_size])
+        for i in range(0, len(document), chunk_size)
+    ]
+    assert streamer.done
+    return "".join(parts)
+
+
+def test_field_is_decoded_for_any_chunking():
+    text = 'Строка с "кавычками", \\ слэшем,\nпереводом строки и эмодзи 💊'
+    document = json.dumps({"confidence": 0.9, "text": text, "recommendations": {}})
+
+    for chunk_size in (1, 2, 3, 5, 7, len(document)):
+        assert stream(document, chunk_size) == text
+
+
+def test_unicode_escapes_split_across_chunks():
+    text = "Витамин D 💊"
+    document = json.dumps({"text": text})  # ensure_ascii: \uXXXX и суррогатные пары
+
+    for chunk_size in range(1, 14):
+        assert stream(document, chunk_size) == text
+
+
+def test_nested_field_with_same_name_is_ignored():
+    document = json.dumps({
+        "recommendations": {"zinc": {"text": "вложенное", "name": "Цинк"}},
+        "note": "text",
+        "text": "верхний уровень",
+    })
+
+    assert stream(document, 4) == "верхний уровень"
+
+
+def test_text_is_emitted_before_document_ends():
+    streamer = JsonStringFieldStreamer("text")
+
+    assert streamer.feed('{"text": "Первая ') == "Первая "
+    assert not streamer.done
+    assert streamer.feed('часть", "confidence": 0.') == "часть"
+    assert streamer.done
+    assert streamer.feed('9}') == ""
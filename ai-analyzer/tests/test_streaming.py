@@ -0,0 +1,102 @@
+"""
+Потоковый анализ: single-flight с обычным анализом и отключение клиента
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+from prometheus_client import REGISTRY
+
+from app.schemas.response import AnalysisRequest
+
+ANSWERS = {"age": 35, "gender": "female", "symptoms": ["усталость"], "goals": ["энергия"]}
+CONTENT = json.dumps({
+    "text": "Рекомендуется витамин D",
+    "confidence": 0.9,
+    "recommendations": {
+        "vitamin_d": {
+            "name": "Витамин D3", "dose": "2000 МЕ", "duration": "2 месяца", "priority": "high",
+        },
+    },
+}, ensure_ascii=False)
+# Первый фрагмент уже содержит начало текста рекомендаций
+FIRST_PIECE = CONTENT[:CONTENT.index("витамин")]
+
+
+def make_request(user: str) -> AnalysisRequest:
+    return AnalysisRequest(form_id=f"form_{user}", user_id=user, answers=ANSWERS)
+
+
+def chunk(content: str) -> SimpleNamespace:
+    choice = SimpleNamespace(finish_reason=None, delta=SimpleNamespace(content=content))
+    return SimpleNamespace(usage=None, choices=[choice])
+
+
+class FakeCompletions:
+    """Поток отдает первый фрагмент и ждет release; обычный вызов отвечает сразу"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.stream_calls = 0
+        self.calls = 0
+
+    async def create(self, stream: bool = False, **params):
+        if stream:
+            self.stream_calls += 1
+            return self._stream()
+        self.calls += 1
+        choice = SimpleNamespace(finish_reason="stop", message=SimpleNamespace(content=CONTENT))
+        return SimpleNamespace(usage=None, choices=[choice])
+
+    async def _stream(self):
+        yield chunk(FIRST_PIECE)
+        await self.release.wait()
+        yield chunk(CONTENT[len(FIRST_PIECE):])
+
+
+def use_client(service) -> FakeCompletions:
+    completions = FakeCompletions()
+    service.deepseek_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return completions
+
+
+def provider_errors(error_type: str) -> float:
+    return REGISTRY.get_sample_value("ai_deepseek_errors_total", {"type": error_type}) or 0.0
+
+
+async def test_concurrent_analysis_joins_stream(service):
+    completions = use_client(service)
+    stream = service.stream_medical_form(make_request("alice"))
+    assert (await anext(stream))[0] == "start"
+    assert (await anext(stream))[0] == "text"
+
+    bob = asyncio.create_task(service.analyze_medical_form(make_request("bob")))
+    await asyncio.sleep(0.01)
+    completions.release.set()
+    events = [event async for event in stream]
+
+    alice = events[-1][1]
+    result = await bob
+    assert completions.stream_calls == 1
+    assert completions.calls == 0
+    assert result.recommendations_text == alice["recommendations_text"]
+    assert result.analysis_id != alice["analysis_id"]
+
+
+async def test_client_disconnect_is_not_provider_failure(service):
+    completions = use_client(service)
+    errors_before = provider_errors("GeneratorExit")
+    stream = service.stream_medical_form(make_request("alice"))
+    await anext(stream)
+    await anext(stream)
+    bob = asyncio.create_task(service.analyze_medical_form(make_request("bob")))
+    await asyncio.sleep(0.01)
+
+    # Клиент отключился посреди генерации
+    await stream.aclose()
+
+    result = await bob
+    assert result.source == "ai"
+    assert completions.calls == 1  # ожидающий выполнил анализ сам
+    assert service._breaker.stats()["window_failures"] == 0
+    assert provider_errors("GeneratorExit") == errors_before